@@ -0,0 +1,164 @@
+"""Async REST client for the Drive, Sheets and Slides APIs.
+
+`GoogleDriveLoader.alazy_load` makes the same REST calls as the blocking
+loaders, but through this client instead of googleapiclient. A single
+`httpx.AsyncClient` keeps pooled keep-alive connections open to every API
+host, multiplexed over HTTP/2 when `http2` is set. A semaphore caps the
+requests in flight, so one event loop can keep hundreds of exports going
+without a thread per socket.
+
+Requests are signed with the user's credentials from `service_pool`. They go
+through `request_executor.acall`, so they share the rate limits and the retry
+policy of the blocking path. Failed responses are raised as googleapiclient
+`HttpError`s, which the loader already knows how to handle.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from requestExecutor import request_executor
+from servicePool import service_pool
+
+API_ROOTS: Dict[str, Tuple[str, str]] = {
+    "drive": ("https://www.googleapis.com/", "drive/v3/"),
+    "sheets": ("https://sheets.googleapis.com/", "v4/"),
+    "slides": ("https://slides.googleapis.com/", "v1/"),
+}
+"""Root URL and service path of each API, as in their discovery documents."""
+
+
+class AsyncDriveClient:
+    """Pooled async HTTP client issuing Google API calls as one user."""
+
+    def __init__(
+        self,
+        username: str,
+        concurrency: int = 100,
+        http2: bool = False,
+        root_url: Optional[str] = None,
+        timeout: float = 60.0,
+        credentials: Any = None,
+    ) -> None:
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError(
+                "You must run "
+                "`pip install --upgrade httpx` "
+                "(`httpx[http2]` for HTTP/2) "
+                "to use the async Google Drive loader."
+            )
+
+        self.username = username
+        # Replaces the root URL of every API, e.g. to talk to a local stand-in.
+        self.root_url = root_url
+        self.credentials = (
+            credentials if credentials is not None else service_pool.delegated_credentials(username)
+        )
+        self._httpx = httpx
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._refresh_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncDriveClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def url(self, api: str, path: str) -> str:
+        root, service_path = API_ROOTS[api]
+        return (self.root_url or root) + service_path + path
+
+    async def get_json(
+        self, api: str, path: str, params: Optional[Dict[str, Any]] = None, method: Optional[str] = None
+    ) -> Any:
+        """GET `path` of the API and decode the JSON response."""
+        url = self.url(api, path)
+
+        async def attempt() -> Any:
+            async with self._semaphore:
+                headers = await self._headers()
+                with self._transport_errors():
+                    response = await self._client.get(url, params=params, headers=headers)
+            _raise_for_status(response, url)
+            return response.json()
+
+        return await request_executor.acall(attempt, api, self.username, method)
+
+    async def download(
+        self,
+        api: str,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        fh: Any,
+        method: Optional[str] = None,
+    ) -> int:
+        """Stream a media response into `fh` and return the number of bytes written.
+
+        A retried download starts over, so `fh` must be seekable.
+        """
+        url = self.url(api, path)
+
+        async def attempt() -> int:
+            fh.seek(0)
+            fh.truncate()
+            size = 0
+            async with self._semaphore:
+                headers = await self._headers()
+                with self._transport_errors():
+                    async with self._client.stream("GET", url, params=params, headers=headers) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                            _raise_for_status(response, url)
+                        async for chunk in response.aiter_bytes():
+                            fh.write(chunk)
+                            size += len(chunk)
+            return size
+
+        return await request_executor.acall(attempt, api, self.username, method)
+
+    async def _headers(self) -> Dict[str, str]:
+        """Return the authorization headers, refreshing the token when needed."""
+        if not self.credentials.valid:
+            async with self._refresh_lock:
+                if not self.credentials.valid:
+                    import google_auth_httplib2
+                    import httplib2
+
+                    # Token refresh is a blocking HTTP call.
+                    await asyncio.to_thread(
+                        self.credentials.refresh, google_auth_httplib2.Request(httplib2.Http())
+                    )
+        headers: Dict[str, str] = {}
+        self.credentials.apply(headers)
+        return headers
+
+    @contextmanager
+    def _transport_errors(self) -> Iterator[None]:
+        """Re-raise httpx transport errors as `ConnectionError` for the retry policy."""
+        try:
+            yield
+        except self._httpx.TransportError as e:
+            raise ConnectionError(str(e) or type(e).__name__) from e
+
+
+def _raise_for_status(response: Any, url: str) -> None:
+    """Raise an `HttpError` like googleapiclient does for an error response."""
+    if response.status_code < 400:
+        return
+    import httplib2
+
+    info = dict(response.headers)
+    info["status"] = str(response.status_code)
+    raise HttpError(httplib2.Response(info), response.content, uri=url)
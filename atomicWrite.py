@@ -0,0 +1,25 @@
+"""Atomic replacement of small state files.
+
+Readers, in this or another process, see either the previous file or the new
+one, never a partial write: the content goes to a temporary file in the same
+directory, which is then renamed over the target.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Union
+
+
+def write_atomic(path: Union[str, Path], text: str) -> None:
+    """Replace the file at `path` with `text`, creating its directory if needed."""
+    directory = os.path.dirname(os.fspath(path)) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
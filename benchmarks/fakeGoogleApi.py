@@ -0,0 +1,507 @@
+"""Local stand-in for the Drive, Sheets and Slides REST calls the loader makes.
+
+`FakeGoogleApi` serves a synthetic, deterministic corpus (folder trees,
+Docs, Sheets of any size, Slides and multi-page PDFs) over plain HTTP:
+
+    drive/v3/files                       files.list (q parents/mimeType/trashed filters, paging)
+    drive/v3/files/{id}                  files.get, and get_media with alt=media (Range aware)
+    drive/v3/files/{id}/export           files.export as text/plain (Range aware)
+    drive/v3/changes, changes/startPageToken
+    batch/drive/v3                       multipart/mixed HTTP batches of files.get
+    v4/spreadsheets/{id}                 spreadsheets.get
+    v4/spreadsheets/{id}/values:batchGet and values/{range}
+    v1/presentations/{id}                presentations.get
+    discovery/{api}/{version}            discovery documents pointing back at this server
+
+Clients are built against it through `ServicePool(discovery_service_url=...)`
+with anonymous credentials. Latency, server errors and quota responses are
+injected at configurable rates. Request counts, injected faults and response
+bytes are exposed at `_admin/stats`; `_admin/touch` edits files so
+`changes.list` has something to report.
+"""
+
+import email.parser
+import email.policy
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+FOLDER = "application/vnd.google-apps.folder"
+DOCUMENT = "application/vnd.google-apps.document"
+SPREADSHEET = "application/vnd.google-apps.spreadsheet"
+PRESENTATION = "application/vnd.google-apps.presentation"
+PDF = "application/pdf"
+
+WORDS = (
+    "drive quarterly revenue forecast roadmap customer onboarding pipeline latency budget "
+    "migration review policy contract invoice summary metrics incident launch hiring"
+).split()
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+def _text(seed: str, size: int) -> str:
+    """Deterministic pseudo-prose of roughly `size` characters."""
+    rng = random.Random(seed)
+    words: List[str] = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Build a minimal PDF with one line of Helvetica text per page."""
+    objects: List[bytes] = []
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page_id, text in zip(page_ids, pages):
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        stream = f"BT /F1 10 Tf 36 760 Td ({escaped}) Tj ET".encode("latin-1", "replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
+
+
+class Corpus:
+    """A synthetic Drive: a folder tree whose contents are derived from seeds.
+
+    `mix` weights the MIME types of generated files. Sheets have `sheet_tabs`
+    tabs of `sheet_rows` rows; PDFs have `pdf_pages` pages of
+    `page_chars` characters; Docs have `doc_chars` characters.
+    """
+
+    def __init__(
+        self,
+        depth: int = 2,
+        fanout: int = 3,
+        files_per_folder: int = 5,
+        mix: Optional[Dict[str, float]] = None,
+        doc_chars: int = 4000,
+        sheet_tabs: int = 2,
+        sheet_rows: int = 200,
+        sheet_columns: int = 6,
+        slides: int = 10,
+        pdf_pages: int = 5,
+        page_chars: int = 1500,
+        seed: int = 0,
+    ) -> None:
+        self.doc_chars = doc_chars
+        self.sheet_tabs = sheet_tabs
+        self.sheet_rows = sheet_rows
+        self.sheet_columns = sheet_columns
+        self.slides = slides
+        self.pdf_pages = pdf_pages
+        self.page_chars = page_chars
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.changes: List[Tuple[str, bool]] = []
+        self._pdfs: Dict[Tuple[str, int], bytes] = {}
+        self._lock = threading.Lock()
+
+        self.files["root"] = {"id": "root", "name": "My Drive", "mimeType": FOLDER, "trashed": False}
+        mix = mix or {DOCUMENT: 0.4, SPREADSHEET: 0.2, PRESENTATION: 0.2, PDF: 0.2}
+        rng = random.Random(seed)
+        mime_types, weights = zip(*mix.items())
+        level = ["root"]
+        for current_depth in range(depth + 1):
+            next_level = []
+            for parent in level:
+                for i in range(files_per_folder):
+                    self._add(f"{parent}-f{i}", rng.choices(mime_types, weights)[0], parent)
+                if current_depth < depth:
+                    for i in range(fanout):
+                        next_level.append(self._add(f"{parent}-d{i}", FOLDER, parent))
+            level = next_level
+
+    def _add(self, id: str, mime_type: str, parent: str) -> str:
+        self.files[id] = {
+            "id": id,
+            "name": f"{mime_type.rsplit('.', 1)[-1]} {id}",
+            "mimeType": mime_type,
+            "parents": [parent],
+            "trashed": False,
+            "version": "1",
+            "modifiedTime": "2024-01-01T00:00:00.000Z",
+        }
+        self.children.setdefault(parent, []).append(id)
+        if mime_type == PDF:
+            self.files[id]["size"] = str(len(self.pdf(id)))
+            self.files[id]["md5Checksum"] = hashlib.md5(self.pdf(id)).hexdigest()
+        return id
+
+    def touch(self, count: int) -> List[str]:
+        """Edit `count` files (bumping their version) and record the changes."""
+        with self._lock:
+            ids = [id for id, f in self.files.items() if f["mimeType"] != FOLDER][:count]
+            for id in ids:
+                file = self.files[id]
+                version = int(file["version"]) + 1
+                file["version"] = str(version)
+                file["modifiedTime"] = f"2024-01-01T00:{version // 60 % 60:02d}:{version % 60:02d}.000Z"
+                if file["mimeType"] == PDF:
+                    pdf = self.pdf(id)
+                    file["size"] = str(len(pdf))
+                    file["md5Checksum"] = hashlib.md5(pdf).hexdigest()
+                self.changes.append((id, False))
+        return ids
+
+    def document_text(self, id: str) -> str:
+        return _text(f"{id}:{self.files[id]['version']}", self.doc_chars)
+
+    def pdf(self, id: str) -> bytes:
+        key = (id, int(self.files[id]["version"]))
+        pdf = self._pdfs.get(key)
+        if pdf is None:
+            pages = [_text(f"{id}:{key[1]}:{page}", self.page_chars) for page in range(self.pdf_pages)]
+            pdf = self._pdfs[key] = make_pdf(pages)
+        return pdf
+
+    def sheet_row(self, id: str, index: int) -> List[str]:
+        """Row `index` of every tab; 0 is the header."""
+        if index == 0:
+            return [f"column {c}" for c in range(self.sheet_columns)]
+        rng = random.Random(f"{id}:{index}")
+        return [f"{rng.choice(WORDS)} {rng.randint(0, 10 ** 6)}" for _ in range(self.sheet_columns)]
+
+    def presentation(self, id: str) -> Dict[str, Any]:
+        return {
+            "title": self.files[id]["name"],
+            "slides": [
+                {
+                    "pageElements": [
+                        {"shape": {"text": {"textElements": [
+                            {"textRun": {"content": _text(f"{id}:{n}:{part}", 200)}}
+                        ]}}}
+                        for part in range(3)
+                    ]
+                }
+                for n in range(self.slides)
+            ],
+        }
+
+
+class FakeGoogleApi:
+    """Request router over a `Corpus`, with latency and fault injection."""
+
+    def __init__(
+        self,
+        corpus: Corpus,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        quota_rate: float = 0.0,
+        retry_after: float = 0.05,
+        seed: int = 0,
+    ) -> None:
+        self.corpus = corpus
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self.retry_after = retry_after
+        self.base_url = ""
+        self.requests: Dict[str, int] = {}
+        self.faults: Dict[str, int] = {}
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "faults": dict(self.faults),
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def handle(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Response:
+        """Serve one request, injecting latency and faults into API calls."""
+        url = urlsplit(target)
+        path = unquote(url.path).lstrip("/")
+        query = parse_qs(url.query)
+        if "x-http-method-override" in headers:
+            # googleapiclient turns GETs with overlong URLs into form-encoded POSTs.
+            method = headers["x-http-method-override"]
+            query.update(parse_qs(body.decode("utf-8")))
+        if path.startswith("_admin/") or path.startswith("discovery/"):
+            return self._route(method, path, query, headers, body)
+
+        delay = self.latency + (self.jitter * self._rng.random() if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.quota_rate:
+            return self._fault("quota", 429, "rateLimitExceeded", {"Retry-After": str(self.retry_after)})
+        if roll < self.quota_rate + self.error_rate:
+            return self._fault("server_error", 503, "backendError")
+        response = self._route(method, path, query, headers, body)
+        with self._lock:
+            self.bytes_sent += len(response[2])
+        return response
+
+    def _fault(
+        self, kind: str, status: int, reason: str, headers: Optional[Dict[str, str]] = None
+    ) -> Response:
+        with self._lock:
+            self.faults[kind] = self.faults.get(kind, 0) + 1
+        error = {"error": {"code": status, "message": reason, "errors": [{"reason": reason}]}}
+        return _json(error, status, headers)
+
+    def _count(self, route: str) -> None:
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def _route(
+        self, method: str, path: str, query: Dict[str, List[str]], headers: Dict[str, str], body: bytes
+    ) -> Response:
+        arg = lambda name, default=None: query.get(name, [default])[0]  # noqa: E731
+        parts = path.split("/")
+
+        if path == "_admin/stats":
+            return _json(self.stats())
+        if path == "_admin/touch" and method == "POST":
+            return _json({"touched": self.corpus.touch(int(arg("count", "1")))})
+        if parts[0] == "discovery" and len(parts) == 3:
+            return self._discovery(parts[1], parts[2])
+
+        if path == "batch/drive/v3" and method == "POST":
+            self._count("drive.batch")
+            return self._batch(headers, body)
+        if path == "drive/v3/files":
+            self._count("drive.files.list")
+            return self._list(arg("q", ""), int(arg("pageSize", "100")), int(arg("pageToken", "0")))
+        if path == "drive/v3/changes/startPageToken":
+            self._count("drive.changes.getStartPageToken")
+            return _json({"startPageToken": str(len(self.corpus.changes))})
+        if path == "drive/v3/changes":
+            self._count("drive.changes.list")
+            return self._changes(int(arg("pageToken", "0")), int(arg("pageSize", "100")))
+        if parts[:3] == ["drive", "v3", "files"] and len(parts) in (4, 5):
+            file = self.corpus.files.get(parts[3])
+            if file is None:
+                return _json({"error": {"code": 404, "message": "File not found"}}, 404)
+            if len(parts) == 5 and parts[4] == "export":
+                self._count("drive.files.export")
+                return _ranged(self.corpus.document_text(file["id"]).encode("utf-8"), headers)
+            if arg("alt") == "media":
+                self._count("drive.files.get_media")
+                return _ranged(self.corpus.pdf(file["id"]), headers, "application/pdf")
+            self._count("drive.files.get")
+            return _json(file)
+        if parts[:2] == ["v4", "spreadsheets"] and len(parts) >= 3:
+            return self._sheets(parts[2], "/".join(parts[3:]), query)
+        if parts[:2] == ["v1", "presentations"] and len(parts) == 3:
+            self._count("slides.presentations.get")
+            return _json(self.corpus.presentation(parts[2]))
+        return _json({"error": {"code": 404, "message": f"No route for {path}"}}, 404)
+
+    def _discovery(self, api: str, version: str) -> Response:
+        from googleapiclient.discovery_cache import get_static_doc
+
+        document = json.loads(get_static_doc(api, version))
+        document["rootUrl"] = document["mtlsRootUrl"] = self.base_url + "/"
+        document["baseUrl"] = document["rootUrl"] + document.get("servicePath", "")
+        return _json(document)
+
+    def _list(self, q: str, page_size: int, offset: int) -> Response:
+        parents = re.findall(r"'([^']+)' in parents", q)
+        wanted = re.findall(r"mimeType = '([^']+)'", q)
+        unwanted = re.findall(r"mimeType != '([^']+)'", q)
+        skip_trashed = "trashed = false" in q
+        matches = []
+        for parent in parents:
+            for id in self.corpus.children.get(parent, []):
+                file = self.corpus.files[id]
+                if skip_trashed and file["trashed"]:
+                    continue
+                if (wanted and file["mimeType"] not in wanted) or file["mimeType"] in unwanted:
+                    continue
+                matches.append(file)
+        page = matches[offset:offset + page_size]
+        result: Dict[str, Any] = {"files": page}
+        if offset + page_size < len(matches):
+            result["nextPageToken"] = str(offset + page_size)
+        return _json(result)
+
+    def _changes(self, start: int, page_size: int) -> Response:
+        changes = self.corpus.changes[start:start + page_size]
+        result: Dict[str, Any] = {
+            "changes": [
+                {"fileId": id, "removed": removed, "file": None if removed else self.corpus.files[id]}
+                for id, removed in changes
+            ]
+        }
+        if start + page_size < len(self.corpus.changes):
+            result["nextPageToken"] = str(start + page_size)
+        else:
+            result["newStartPageToken"] = str(len(self.corpus.changes))
+        return _json(result)
+
+    def _sheets(self, id: str, rest: str, query: Dict[str, List[str]]) -> Response:
+        file = self.corpus.files.get(id)
+        if file is None:
+            return _json({"error": {"code": 404, "message": "Spreadsheet not found"}}, 404)
+        rows = self.corpus.sheet_rows + 1
+        tabs = [f"Tab {t}" for t in range(self.corpus.sheet_tabs)]
+        if not rest:
+            self._count("sheets.spreadsheets.get")
+            return _json({
+                "properties": {"title": file["name"]},
+                "sheets": [
+                    {"properties": {"sheetId": t, "title": title, "gridProperties": {"rowCount": rows}}}
+                    for t, title in enumerate(tabs)
+                ],
+            })
+        if rest == "values:batchGet":
+            self._count("sheets.spreadsheets.values.batchGet")
+            return _json({
+                "spreadsheetId": id,
+                "valueRanges": [
+                    self._value_range(id, r, rows) for r in query.get("ranges", [])
+                ],
+            })
+        if rest.startswith("values/"):
+            self._count("sheets.spreadsheets.values.get")
+            return _json(self._value_range(id, rest[len("values/"):], rows))
+        return _json({"error": {"code": 404, "message": f"No route for {rest}"}}, 404)
+
+    def _value_range(self, id: str, a1: str, rows: int) -> Dict[str, Any]:
+        """Serve `'Title'` or `'Title'!start:end` (1-based, inclusive) row ranges."""
+        match = re.fullmatch(r"'(?:[^']|'')*'(?:!(\d+):(\d+))?", a1)
+        start, end = (int(match.group(1)), int(match.group(2))) if match and match.group(1) else (1, rows)
+        end = min(end, rows)
+        return {
+            "range": a1,
+            "majorDimension": "ROWS",
+            "values": [self.corpus.sheet_row(id, i - 1) for i in range(start, end + 1)],
+        }
+
+    def _batch(self, headers: Dict[str, str], body: bytes) -> Response:
+        """Answer a multipart/mixed batch by routing each embedded request."""
+        content_type = headers.get("content-type", "")
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        boundary = "batch_" + hashlib.md5(body).hexdigest()
+        out = bytearray()
+        for part in message.iter_parts():
+            request_line = part.get_payload(decode=True).decode("utf-8").splitlines()[0]
+            method, target, _ = request_line.split(" ", 2)
+            url = urlsplit(target)
+            status, part_headers, part_body = self._route(
+                method, unquote(url.path).lstrip("/"), parse_qs(url.query), {}, b""
+            )
+            content_id = part["Content-ID"].strip("<>")
+            out += (
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\n"
+                f"Content-Type: {part_headers['Content-Type']}\r\n"
+                f"Content-Length: {len(part_body)}\r\n\r\n"
+            ).encode() + part_body + b"\r\n"
+        out += f"--{boundary}--\r\n".encode()
+        return 200, {"Content-Type": f"multipart/mixed; boundary={boundary}"}, bytes(out)
+
+
+def _json(payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    return status, {"Content-Type": "application/json; charset=UTF-8", **(headers or {})}, json.dumps(
+        payload
+    ).encode("utf-8")
+
+
+def _ranged(content: bytes, headers: Dict[str, str], content_type: str = "text/plain") -> Response:
+    """Serve `content`, honouring a `Range: bytes=a-b` request header."""
+    match = re.fullmatch(r"bytes=(\d+)-(\d*)", headers.get("range", ""))
+    if not match or not content:
+        return 200, {"Content-Type": content_type}, content
+    start = int(match.group(1))
+    end = min(int(match.group(2)) if match.group(2) else len(content) - 1, len(content) - 1)
+    return 206, {
+        "Content-Type": content_type,
+        "Content-Range": f"bytes {start}-{end}/{len(content)}",
+    }, content[start:end + 1]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoints
+    api: FakeGoogleApi
+
+    def _serve(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        status, response_headers, content = self.api.handle(self.command, self.path, headers, body)
+        self.send_response(status)
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = _serve
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve(api: FakeGoogleApi, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start serving `api` on a background thread; returns the running server."""
+    handler = type("Handler", (_Handler,), {"api": api})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    api.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_server(corpus_options: Dict[str, Any], api_options: Dict[str, Any], connection: Any) -> None:
+    """Process entry point: build the corpus, serve it and report the base URL."""
+    api = FakeGoogleApi(Corpus(**corpus_options), **api_options)
+    server = serve(api)
+    connection.send(api.base_url)
+    connection.recv()  # any message (or EOF) stops the server
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    api = FakeGoogleApi(Corpus(depth=args.depth), latency=args.latency)
+    serve(api, port=args.port)
+    print(f"Serving {len(api.corpus.files)} files on {api.base_url}")
+    threading.Event().wait()
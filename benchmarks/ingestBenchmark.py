@@ -0,0 +1,343 @@
+"""Ingestion throughput benchmarks against the local fake Google APIs.
+
+Each scenario runs in a fresh process (so peak RSS is its own) against a
+`fakeGoogleApi` server in another process, and feeds `GoogleDriveLoader`
+through `IngestionPipeline` into an in-memory vector store with a fake
+embedder. Reported per scenario: files/sec, MB/sec served, peak RSS, p50/p99
+per-file latency, API calls and injected faults.
+
+    python benchmarks/ingestBenchmark.py                      # every scenario
+    python benchmarks/ingestBenchmark.py deep_tree --output results.json
+    python benchmarks/ingestBenchmark.py --baseline results.json --tolerance 0.2
+    python benchmarks/ingestBenchmark.py --engine async      # GoogleDriveLoader.alazy_load
+
+With `--baseline`, the run exits non-zero when a metric is worse than the
+baseline by more than the tolerance, so CI can flag regressions. Google's
+real per-user quotas are lifted by default (the stand-in has none); pass
+`--google-quotas` to keep them.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakeGoogleApi import DOCUMENT, PDF, PRESENTATION, SPREADSHEET, run_server  # noqa: E402
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "deep_tree": {
+        "corpus": {
+            "depth": 5, "fanout": 3, "files_per_folder": 3, "mix": {DOCUMENT: 0.6, PRESENTATION: 0.4}
+        },
+        "api": {"latency": 0.01, "jitter": 0.01},
+    },
+    "huge_sheet": {
+        "corpus": {
+            "depth": 0, "files_per_folder": 1, "mix": {SPREADSHEET: 1.0}, "sheet_tabs": 1, "sheet_rows": 200_000
+        },
+        "api": {"latency": 0.02},
+        "loader": {"sheet_rows_per_document": 200},
+    },
+    "big_pdfs": {
+        "corpus": {"depth": 0, "files_per_folder": 4, "mix": {PDF: 1.0}, "pdf_pages": 400},
+        "api": {"latency": 0.02},
+        "loader": {"pdf_spool_threshold": 1 << 20, "pdf_workers": 2},
+    },
+    "faults": {
+        "corpus": {"depth": 2, "fanout": 3, "files_per_folder": 5},
+        "api": {"latency": 0.005, "error_rate": 0.03, "quota_rate": 0.03},
+    },
+    "changes": {
+        "corpus": {"depth": 3, "fanout": 3, "files_per_folder": 4},
+        "api": {"latency": 0.005},
+        "touch": 50,
+    },
+}
+
+UNTHROTTLED_QUOTAS = {api: {"project": 1e6, "user": 1e6} for api in ("drive", "sheets", "slides")}
+
+REGRESSION_DIRECTIONS = {
+    "files_per_sec": 1,
+    "mb_per_sec": 1,
+    "p50_ms": -1,
+    "p99_ms": -1,
+    "peak_rss_mb": -1,
+}
+"""Metrics compared against a baseline; 1 means higher is better."""
+
+_latencies: List[float] = []
+_latencies_lock = threading.Lock()
+
+
+class FakeEmbeddings:
+    """Deterministic hash-based vectors with a simulated per-call latency."""
+
+    def __init__(
+        self, dimensions: int = 256, call_latency: float = 0.005, text_latency: float = 0.0
+    ) -> None:
+        self.dimensions = dimensions
+        self.call_latency = call_latency
+        self.text_latency = text_latency
+        self.calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.call_latency + self.text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    def _vector(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255.0 for i in range(self.dimensions)]
+
+
+class _MemoryCollection:
+    def __init__(self) -> None:
+        self.vectors: Dict[str, array] = {}
+
+    def upsert(
+        self, ids: List[str], embeddings: List[List[float]], metadatas: Any, documents: Any
+    ) -> None:
+        for id, vector in zip(ids, embeddings):
+            self.vectors[id] = array("f", vector)
+
+
+class MemoryVectorStore:
+    """Just enough of a Chroma store for `IngestionPipeline`."""
+
+    def __init__(self, embedding_function: Any) -> None:
+        self._embedding_function = embedding_function
+        self._collection = _MemoryCollection()
+
+
+def _timed_loader_class() -> Any:
+    from googleDriveLoader import GoogleDriveLoader
+
+    class TimedGoogleDriveLoader(GoogleDriveLoader):
+        """Records the wall-clock time each file takes to fetch and parse."""
+
+        def _iter_file_documents(self, id, mime_type, username, file=None) -> Iterator[Any]:
+            start = time.perf_counter()
+            yield from super()._iter_file_documents(id, mime_type, username, file)
+            with _latencies_lock:
+                _latencies.append(time.perf_counter() - start)
+
+        async def _aload_file_documents(self, client, id, mime_type, file) -> List[Any]:
+            start = time.perf_counter()
+            docs = await super()._aload_file_documents(client, id, mime_type, file)
+            with _latencies_lock:
+                _latencies.append(time.perf_counter() - start)
+            return docs
+
+    return TimedGoogleDriveLoader
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def _admin(base_url: str, path: str, method: str = "GET") -> Dict[str, Any]:
+    data = b"" if method == "POST" else None
+    request = urllib.request.Request(f"{base_url}/_admin/{path}", data=data, method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def run_scenario(name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one scenario end to end; meant to run in a fresh process."""
+    from google.auth.credentials import AnonymousCredentials
+
+    from driveChanges import ChangeCursorStore
+    from ingestionPipeline import IngestionPipeline
+    from requestExecutor import request_executor
+    from servicePool import service_pool
+
+    scenario = SCENARIOS[name]
+    context = multiprocessing.get_context("spawn")
+    parent, child = context.Pipe()
+    server = context.Process(
+        target=run_server, args=(scenario["corpus"], scenario.get("api", {}), child), daemon=True
+    )
+    server.start()
+    base_url = parent.recv()
+    try:
+        service_pool.credentials = AnonymousCredentials()
+        service_pool.discovery_service_url = base_url + "/discovery/{api}/{apiVersion}"
+        service_pool.clear(discovery_documents=True)
+        if not options["google_quotas"]:
+            request_executor.quotas = UNTHROTTLED_QUOTAS
+        # The stand-in recovers instantly; don't let backoff dominate the numbers.
+        request_executor.base_delay = options["retry_base_delay"]
+
+        loader = _timed_loader_class()(
+            folder_id="root",
+            recursive=True,
+            max_workers=options["workers"],
+            async_concurrency=options["concurrency"],
+            api_root_url=base_url + "/",
+            **scenario.get("loader", {}),
+        )
+        store = MemoryVectorStore(FakeEmbeddings(call_latency=options["embed_latency"]))
+        pipeline = IngestionPipeline(store)
+        username = "benchmark@example.com"
+
+        if "touch" in scenario:
+            with tempfile.TemporaryDirectory() as cursor_dir:
+                cursors = ChangeCursorStore(cursor_dir)
+                initial = loader.load_changes(username, cursors)
+                pipeline.run(initial.documents)
+                cursors.save(username, initial.new_start_page_token, initial.folder_ids)
+                _admin(base_url, f"touch?count={scenario['touch']}", "POST")
+                del _latencies[:]
+                before = _admin(base_url, "stats")
+                start = time.perf_counter()
+                change_set = loader.load_changes(username, cursors)
+                counts = pipeline.run(change_set.documents)
+        else:
+            before = _admin(base_url, "stats")
+            start = time.perf_counter()
+            if options["engine"] == "async":
+                counts = pipeline.run(loader.alazy_load(username))
+            else:
+                counts = pipeline.run(loader.lazy_load(username))
+        seconds = time.perf_counter() - start
+        after = _admin(base_url, "stats")
+    finally:
+        parent.send("stop")
+        server.join(5)
+
+    megabytes = (after["bytes_sent"] - before["bytes_sent"]) / 1e6
+    files = len(_latencies)
+    return {
+        "scenario": name,
+        "files": files,
+        "documents": counts["documents"],
+        "chunks": counts["chunks"],
+        "seconds": round(seconds, 3),
+        "files_per_sec": round(files / seconds, 2) if seconds else 0.0,
+        "mb_per_sec": round(megabytes / seconds, 3) if seconds else 0.0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "p50_ms": round(_percentile(_latencies, 0.50) * 1000, 1),
+        "p99_ms": round(_percentile(_latencies, 0.99) * 1000, 1),
+        "api_calls": sum(after["requests"].values()) - sum(before["requests"].values()),
+        "faults": sum(after["faults"].values()) - sum(before["faults"].values()),
+        "retries": request_executor.stats()["retries"],
+    }
+
+
+def _scenario_process(name: str, options: Dict[str, Any], connection: Any) -> None:
+    connection.send(run_scenario(name, options))
+
+
+def _run_isolated(name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a scenario in a fresh (non-daemon, so it may start the server) process."""
+    context = multiprocessing.get_context("spawn")
+    parent, child = context.Pipe()
+    process = context.Process(target=_scenario_process, args=(name, options, child))
+    process.start()
+    try:
+        return parent.recv()
+    finally:
+        process.join()
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Describe every metric that is worse than the baseline by more than `tolerance`."""
+    baseline_by_name = {r["scenario"]: r for r in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_by_name.get(result["scenario"])
+        if previous is None:
+            continue
+        for metric, direction in REGRESSION_DIRECTIONS.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * direction
+            if change < -tolerance:
+                regressions.append(
+                    f"{result['scenario']}.{metric}: {old} -> {new} ({change:+.0%})"
+                )
+    return regressions
+
+
+def _print_table(results: List[Dict[str, Any]]) -> None:
+    columns = ["scenario", "files", "chunks", "seconds", "files_per_sec", "mb_per_sec",
+               "peak_rss_mb", "p50_ms", "p99_ms", "api_calls", "faults", "retries"]
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark Drive ingestion against fake Google APIs.")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "async"],
+        default="threads",
+        help="load with lazy_load or alazy_load (the changes scenario always uses threads)",
+    )
+    parser.add_argument("--workers", type=int, default=8, help="GoogleDriveLoader.max_workers")
+    parser.add_argument(
+        "--concurrency", type=int, default=100, help="GoogleDriveLoader.async_concurrency"
+    )
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="seconds per embedding call")
+    parser.add_argument("--retry-base-delay", type=float, default=0.05)
+    parser.add_argument("--google-quotas", action="store_true", help="keep Google's default quotas")
+    parser.add_argument("--output", help="write results as JSON (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    options = {
+        "engine": args.engine,
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "embed_latency": args.embed_latency,
+        "retry_base_delay": args.retry_base_delay,
+        "google_quotas": args.google_quotas,
+    }
+    results = [_run_isolated(name, options) for name in args.scenarios or list(SCENARIOS)]
+    _print_table(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Startup cost of the service's modules, from `python -X importtime`.
+
+Each target module is imported `--repeat` times in a fresh interpreter.
+Reported per target: the median wall time of the import and of the whole
+process, the modules it imports directly ranked by cumulative import time
+(the candidates for lazy imports), and the import time spent in each
+top-level package.
+
+    python benchmarks/startupBenchmark.py                     # service, googleDriveLoader
+    python benchmarks/startupBenchmark.py service --top 20 --repeat 7
+    python benchmarks/startupBenchmark.py --warm-up           # also time service.warm_up()
+    python benchmarks/startupBenchmark.py --output startup.json
+    python benchmarks/startupBenchmark.py --baseline startup.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TARGETS = ["service", "googleDriveLoader"]
+
+REGRESSION_METRICS = ["import_ms", "process_ms"]
+"""Metrics compared against `--baseline`; lower is better for all of them."""
+
+_IMPORT_SCRIPT = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "print('import', time.perf_counter() - start)\n"
+    "{after}"
+)
+
+_WARM_UP_SCRIPT = (
+    "start = time.perf_counter()\n"
+    "{module}.warm_up()\n"
+    "print('warm_up', time.perf_counter() - start)\n"
+)
+
+Entry = Tuple[str, int, int, int]
+"""One `-X importtime` line: (module, nesting depth, self µs, cumulative µs)."""
+
+
+def parse_importtime(stderr: str) -> List[Entry]:
+    """Parse `-X importtime` output, in the order modules finished importing."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # the header line
+        name = parts[2][1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append((name.strip(), depth, int(parts[0]), int(parts[1])))
+    return entries
+
+
+def direct_imports(entries: List[Entry], module: str) -> Dict[str, int]:
+    """Cumulative µs of each module that `module` itself imported.
+
+    Children are printed before their parent, one level deeper, so they are
+    the depth-1 lines since the previous top-level line.
+    """
+    children: Dict[str, int] = {}
+    for name, depth, _, cumulative in entries:
+        if depth == 0:
+            if name == module:
+                return children
+            children = {}
+        elif depth == 1:
+            children[name] = cumulative
+    return {}
+
+
+def package_self_times(entries: List[Entry]) -> Dict[str, int]:
+    """Self µs summed per top-level package; every module is counted once."""
+    totals: Dict[str, int] = {}
+    for name, _, self_us, _ in entries:
+        package = name.split(".", 1)[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def _run(script: str) -> Tuple[subprocess.CompletedProcess, float]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    return process, time.perf_counter() - start
+
+
+def measure(module: str, repeat: int, top: int, warm_up: bool) -> Dict[str, Any]:
+    """Import `module` `repeat` times in fresh interpreters and summarize the cost."""
+    after = _WARM_UP_SCRIPT.format(module=module) if warm_up else ""
+    import_seconds, process_seconds, warm_up_seconds = [], [], []
+    children: Dict[str, List[int]] = {}
+    packages: Dict[str, List[int]] = {}
+    for _ in range(repeat):
+        process, seconds = _run(_IMPORT_SCRIPT.format(module=module, after=after))
+        if process.returncode != 0:
+            error = process.stderr.strip().splitlines()
+            return {"module": module, "error": error[-1] if error else f"exit {process.returncode}"}
+        # The module may print too; only the tagged lines are timings.
+        timings = dict(
+            (parts[0], float(parts[1]))
+            for parts in (line.split() for line in process.stdout.splitlines())
+            if len(parts) == 2 and parts[0] in ("import", "warm_up")
+        )
+        import_seconds.append(timings["import"])
+        if warm_up:
+            warm_up_seconds.append(timings["warm_up"])
+        process_seconds.append(seconds)
+        entries = parse_importtime(process.stderr)
+        for name, cumulative in direct_imports(entries, module).items():
+            children.setdefault(name, []).append(cumulative)
+        for name, self_us in package_self_times(entries).items():
+            packages.setdefault(name, []).append(self_us)
+
+    def ranked(values: Dict[str, List[int]]) -> List[Dict[str, Any]]:
+        medians = {name: statistics.median(us) / 1000 for name, us in values.items()}
+        ordered = sorted(medians.items(), key=lambda item: item[1], reverse=True)[:top]
+        return [{"module": name, "ms": round(ms, 1)} for name, ms in ordered]
+
+    result = {
+        "module": module,
+        "import_ms": round(statistics.median(import_seconds) * 1000, 1),
+        "process_ms": round(statistics.median(process_seconds) * 1000, 1),
+        "direct_imports": ranked(children),
+        "packages": ranked(packages),
+    }
+    if warm_up:
+        result["warm_up_ms"] = round(statistics.median(warm_up_seconds) * 1000, 1)
+    return result
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Describe every metric that is slower than the baseline by more than `tolerance`."""
+    baseline_by_module = {r["module"]: r for r in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_by_module.get(result["module"])
+        if previous is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change > tolerance:
+                regressions.append(f"{result['module']}.{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def _print_report(result: Dict[str, Any]) -> None:
+    if "error" in result:
+        print(f"{result['module']}: failed to import: {result['error']}\n")
+        return
+    line = f"{result['module']}: import {result['import_ms']} ms, process {result['process_ms']} ms"
+    if "warm_up_ms" in result:
+        line += f", warm_up {result['warm_up_ms']} ms"
+    print(line)
+    for title, key in (("direct imports (cumulative)", "direct_imports"), ("packages (self)", "packages")):
+        print(f"  {title}:")
+        for row in result[key]:
+            print(f"    {row['ms']:>9.1f} ms  {row['module']}")
+    print()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure per-module import cost of the service.")
+    parser.add_argument("modules", nargs="*", help=f"modules to import (default: {', '.join(DEFAULT_TARGETS)})")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=15, help="rows per ranking")
+    parser.add_argument("--warm-up", action="store_true", help="also time <module>.warm_up()")
+    parser.add_argument("--output", help="write results as JSON (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    results = [
+        measure(module, max(1, args.repeat), args.top, args.warm_up)
+        for module in args.modules or DEFAULT_TARGETS
+    ]
+    for result in results:
+        _print_report(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
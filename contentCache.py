@@ -0,0 +1,175 @@
+"""On-disk cache of parsed Drive file contents keyed by revision.
+
+Entries are addressed by a hash of the file ID, a revision marker taken from
+the file's metadata (`md5Checksum`, `version` or `modifiedTime`) and a variant
+string describing how the file was parsed. Any edit to the file changes the
+marker, so stale entries are never served; they just age out of the LRU.
+
+Writes go to a temporary file that is renamed into place, so concurrent
+workers (threads or processes) only ever see complete entries. `writer`
+appends documents to that file as they are parsed, so caching a huge file
+doesn't hold all of its documents in memory.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+def revision_marker(file: Dict[str, Any]) -> Optional[str]:
+    """Return the strongest revision marker available in file metadata."""
+    for key in ("md5Checksum", "version", "modifiedTime"):
+        if file.get(key):
+            return f"{key}:{file[key]}"
+    return None
+
+
+class ContentCache:
+    """Size-capped, LRU-evicted cache of parsed documents on local disk."""
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def get(self, file_id: str, revision: str, variant: str = "") -> Optional[List["Document"]]:
+        """Return cached documents, or None when this revision isn't cached."""
+        path = self._path(file_id, revision, variant)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            # Bump the mtime so eviction sees this entry as recently used.
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        from langchain.docstore.document import Document
+
+        return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload]
+
+    def put(self, file_id: str, revision: str, documents: List["Document"], variant: str = "") -> None:
+        """Store documents for this revision and evict old entries over the cap."""
+        writer = self.writer(file_id, revision, variant)
+        try:
+            for document in documents:
+                writer.add(document)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+
+    def writer(self, file_id: str, revision: str, variant: str = "") -> "CacheEntryWriter":
+        """Start an entry for this revision; it is stored once the writer is committed."""
+        return CacheEntryWriter(self, self._path(file_id, revision, variant))
+
+    def _added(self, size: int) -> None:
+        """Account for a new entry and evict old entries over the cap."""
+        with self._lock:
+            self._size += size
+            over_cap = self._size > self.max_bytes
+        if over_cap:
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the tracked cache size in bytes."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self._size}
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache is under 90% of its cap."""
+        with self._lock:
+            entries = sorted(self._entries())
+            self._size = sum(size for _, _, size in entries)
+            target = self.max_bytes * 0.9
+            for _, path, size in entries:
+                if self._size <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    # Another process evicted it first.
+                    pass
+                self._size -= size
+
+    def _entries(self) -> List[Tuple[float, Path, int]]:
+        """List (mtime, path, size) for every complete entry on disk."""
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def _path(self, file_id: str, revision: str, variant: str) -> Path:
+        digest = hashlib.sha256(f"{file_id}\0{revision}\0{variant}".encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.json"
+
+
+class CacheEntryWriter:
+    """Incrementally written cache entry; `commit` publishes it, `abort` drops it."""
+
+    def __init__(self, cache: ContentCache, path: Path) -> None:
+        self.cache = cache
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        self._file.write("[")
+        self._empty = True
+
+    def add(self, document: "Document") -> None:
+        if not self._empty:
+            self._file.write(", ")
+        json.dump({"page_content": document.page_content, "metadata": document.metadata}, self._file)
+        self._empty = False
+
+    def commit(self) -> None:
+        try:
+            self._file.write("]")
+            self._file.close()
+            size = os.path.getsize(self._tmp_path)
+            os.replace(self._tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+        self.cache._added(size)
+
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+_caches: Dict[Path, ContentCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_content_cache(directory: Union[str, Path], max_bytes: int = DEFAULT_MAX_BYTES) -> ContentCache:
+    """Return the process-wide cache for `directory`, creating it on first use."""
+    directory = Path(directory).resolve()
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = ContentCache(directory, max_bytes)
+        cache.max_bytes = max_bytes
+        return cache
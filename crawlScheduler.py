@@ -0,0 +1,341 @@
+"""Org-wide crawls: many users' Drives under one global worker budget.
+
+`CrawlScheduler` interleaves the crawls of many users on a shared pool of
+`workers` threads. A unit of work is either one batch of listed files or up
+to `files_per_unit` files, fetched, parsed and indexed through a single
+ingestion pipeline run. Units are handed out by stride scheduling: the ready
+user with the least weighted work (listing batches plus files) so far goes
+next. With equal weights
+this is round-robin. A user with a huge Drive then gets the same share of
+workers, and so of the project's API quota, as everyone else, instead of
+holding them until it is done. At most `max_active_users` crawls (twice the
+workers by default) are open at once; the rest wait their turn.
+
+`workers` bounds the units in flight. Work a unit starts on other threads,
+such as a loader's listing workers or an indexing pipeline, comes on top, so
+callers sharing an API budget keep those to one each.
+
+Progress is checkpointed to JSON: users that finished and, for the others,
+the files already indexed. Running the same crawl again with that checkpoint
+skips both, so an interrupted crawl resumes where it stopped. Once every
+user has finished, the checkpoint is deleted and the next run starts over.
+"""
+
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from atomicWrite import write_atomic
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class CrawlCheckpoint:
+    """Per-user crawl status and indexed file ids, persisted as one JSON file."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r") as f:
+                self._users: Dict[str, Dict[str, Any]] = json.load(f).get("users", {})
+        except FileNotFoundError:
+            self._users = {}
+
+    def status(self, username: str) -> str:
+        with self._lock:
+            return self._users.get(username, {}).get("status", PENDING)
+
+    def indexed_files(self, username: str) -> Set[str]:
+        """Return the ids of the user's files indexed by an earlier, unfinished run."""
+        with self._lock:
+            return set(self._users.get(username, {}).get("files", []))
+
+    def mark_file(self, username: str, file_id: str) -> None:
+        with self._lock:
+            self._entry(username)["files"].append(file_id)
+
+    def mark_user(self, username: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            entry = self._entry(username)
+            entry["status"] = status
+            if status == DONE:
+                # Finished users are skipped whole; their files need no record.
+                entry["files"] = []
+            if error is not None:
+                entry["error"] = error
+
+    def clear(self) -> None:
+        """Forget every user and delete the checkpoint file."""
+        with self._lock:
+            self._users = {}
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def save(self) -> None:
+        """Write the checkpoint, replacing the previous one atomically."""
+        with self._lock:
+            payload = json.dumps({"users": self._users})
+        write_atomic(self.path, payload)
+
+    def _entry(self, username: str) -> Dict[str, Any]:
+        return self._users.setdefault(username, {"status": PENDING, "files": []})
+
+
+class _UserCrawl:
+    """Scheduling state of one user's crawl."""
+
+    def __init__(
+        self, username: str, loader: Any, weight: float, indexed: Set[str], pass_value: float
+    ) -> None:
+        self.username = username
+        self.loader = loader
+        self.weight = weight
+        self.indexed = indexed
+        # Stride scheduling: grows by 1 / weight per unit of work handed out.
+        self.pass_value = pass_value
+        self.listing = loader.list_files(username)
+        self.pending: Deque[Dict[str, Any]] = deque()
+        self.listing_in_flight = False
+        self.listed = False
+        self.in_flight = 0
+        self.error: Optional[str] = None
+        self.counts = {"files": 0, "documents": 0, "skipped": 0}
+
+    def wants_listing(self, batch: int) -> bool:
+        return (
+            self.error is None
+            and not self.listed
+            and not self.listing_in_flight
+            and len(self.pending) < batch
+        )
+
+    def ready(self, batch: int) -> bool:
+        return self.error is None and (bool(self.pending) or self.wants_listing(batch))
+
+    @property
+    def finished(self) -> bool:
+        return self.in_flight == 0 and (
+            self.error is not None or (self.listed and not self.pending)
+        )
+
+    def list_more(self, batch: int) -> List[Dict[str, Any]]:
+        """Runs on a worker thread; never concurrently for the same user."""
+        return list(itertools.islice(self.listing, batch))
+
+    def close(self) -> None:
+        close = getattr(self.listing, "close", None)
+        if close is not None:
+            close()
+
+
+class CrawlScheduler:
+    """Crawl many users' Drives concurrently, sharing workers fairly between them.
+
+    `loader_factory(username)` returns the `GoogleDriveLoader` that crawls a
+    user, and `index(username, documents)` stores the documents of one unit
+    of files, given as a lazy iterable.
+    Users missing from `weights` weigh 1; while both have work, a user of
+    weight 2 gets twice the share of a user of weight 1. `progress`, if
+    given, is advanced with "files_listed", "files_fetched" and "users_done";
+    raising from `advance` stops the crawl.
+    """
+
+    def __init__(
+        self,
+        loader_factory: Callable[[str], Any],
+        index: Callable[[str, List[Any]], Any],
+        workers: int = 8,
+        max_active_users: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        checkpoint: Optional[CrawlCheckpoint] = None,
+        checkpoint_interval: float = 30.0,
+        listing_batch: int = 100,
+        files_per_unit: int = 10,
+        progress: Any = None,
+    ) -> None:
+        self.loader_factory = loader_factory
+        self.index = index
+        self.workers = max(1, workers)
+        # More open crawls than workers, so there is always a choice to be fair about.
+        self.max_active_users = max_active_users or 2 * self.workers
+        self.weights = weights or {}
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.listing_batch = listing_batch
+        # Files per pipeline run; bigger units start fewer pipelines but make
+        # scheduling coarser.
+        self.files_per_unit = max(1, files_per_unit)
+        self.progress = progress
+        self._virtual_time = 0.0
+
+    def run(self, usernames: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Crawl every user; returns each user's status and file/document counts.
+
+        A failing user is logged and reported as failed without stopping the
+        others. Files that fail to load are skipped by the loader itself.
+        When every user is done, the checkpoint is cleared, so submitting the
+        same crawl again crawls everything again rather than resuming.
+        """
+        waiting: Deque[str] = deque(dict.fromkeys(usernames))
+        active: List[_UserCrawl] = []
+        in_flight: Dict[Future, Tuple[_UserCrawl, Optional[List[Dict[str, Any]]]]] = {}
+        results: Dict[str, Dict[str, Any]] = {}
+        saved_at = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while waiting or active:
+                    self._activate(waiting, active, results)
+                    self._dispatch(executor, active, in_flight)
+                    if in_flight:
+                        done, _ = wait(
+                            list(in_flight),
+                            timeout=self.checkpoint_interval,
+                            return_when=FIRST_COMPLETED,
+                        )
+                        for future in done:
+                            crawl, files = in_flight.pop(future)
+                            self._complete(crawl, files, future)
+                    for crawl in [c for c in active if c.finished]:
+                        active.remove(crawl)
+                        self._finish(crawl, results)
+                    if (
+                        self.checkpoint is not None
+                        and time.monotonic() - saved_at >= self.checkpoint_interval
+                    ):
+                        self.checkpoint.save()
+                        saved_at = time.monotonic()
+            finally:
+                # Stopped early: drop queued work, let running units finish so
+                # their listings can be closed, and keep what was indexed.
+                for future in in_flight:
+                    future.cancel()
+                wait(list(in_flight))
+                for crawl in active:
+                    crawl.close()
+                if self.checkpoint is not None:
+                    self.checkpoint.save()
+        if self.checkpoint is not None and all(r["status"] == DONE for r in results.values()):
+            self.checkpoint.clear()
+        return results
+
+    def _activate(
+        self, waiting: Deque[str], active: List[_UserCrawl], results: Dict[str, Dict[str, Any]]
+    ) -> None:
+        """Open crawls for waiting users while fewer than `max_active_users` are open."""
+        while waiting and len(active) < self.max_active_users:
+            username = waiting.popleft()
+            if self.checkpoint is not None and self.checkpoint.status(username) == DONE:
+                results[username] = {"status": DONE, "resumed": True}
+                continue
+            indexed = self.checkpoint.indexed_files(username) if self.checkpoint is not None else set()
+            # Newcomers start at the current virtual time so they don't get a burst.
+            active.append(
+                _UserCrawl(
+                    username,
+                    self.loader_factory(username),
+                    self.weights.get(username, 1.0),
+                    indexed,
+                    self._virtual_time,
+                )
+            )
+            if self.checkpoint is not None:
+                self.checkpoint.mark_user(username, RUNNING)
+
+    def _dispatch(
+        self,
+        executor: ThreadPoolExecutor,
+        active: List[_UserCrawl],
+        in_flight: Dict[Future, Tuple[_UserCrawl, Optional[List[Dict[str, Any]]]]],
+    ) -> None:
+        """Fill idle workers, giving each unit to the ready user with the lowest pass."""
+        while len(in_flight) < self.workers:
+            ready = [crawl for crawl in active if crawl.ready(self.listing_batch)]
+            if not ready:
+                return
+            crawl = min(ready, key=lambda c: c.pass_value)
+            if crawl.wants_listing(self.listing_batch):
+                crawl.listing_in_flight = True
+                files = None
+                future = executor.submit(crawl.list_more, self.listing_batch)
+            else:
+                count = min(self.files_per_unit, len(crawl.pending))
+                files = [crawl.pending.popleft() for _ in range(count)]
+                future = executor.submit(self._crawl_files, crawl, files)
+            crawl.in_flight += 1
+            in_flight[future] = (crawl, files)
+            self._virtual_time = crawl.pass_value
+            crawl.pass_value += (1 if files is None else len(files)) / crawl.weight
+
+    def _crawl_files(self, crawl: _UserCrawl, files: List[Dict[str, Any]]) -> int:
+        """Index the files' documents in one pipeline run; returns the document count."""
+        count = 0
+
+        def documents() -> Iterable[Any]:
+            nonlocal count
+            for file in files:
+                loaded = crawl.loader.load_file(file, crawl.username)
+                count += len(loaded)
+                yield from loaded
+
+        self.index(crawl.username, documents())
+        return count
+
+    def _complete(
+        self, crawl: _UserCrawl, files: Optional[List[Dict[str, Any]]], future: Future
+    ) -> None:
+        crawl.in_flight -= 1
+        if files is None:
+            crawl.listing_in_flight = False
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.exception("Crawl of %s failed", crawl.username)
+            crawl.error = repr(e)
+            return
+
+        if files is None:
+            if len(result) < self.listing_batch:
+                crawl.listed = True
+            new = [f for f in result if f["id"] not in crawl.indexed]
+            crawl.counts["skipped"] += len(result) - len(new)
+            crawl.pending.extend(new)
+            self._report("files_listed", len(result))
+            return
+
+        crawl.counts["files"] += len(files)
+        crawl.counts["documents"] += result
+        if self.checkpoint is not None:
+            for file in files:
+                self.checkpoint.mark_file(crawl.username, file["id"])
+        self._report("files_fetched", len(files))
+
+    def _finish(self, crawl: _UserCrawl, results: Dict[str, Dict[str, Any]]) -> None:
+        crawl.close()
+        status = DONE if crawl.error is None else FAILED
+        results[crawl.username] = {"status": status, **crawl.counts}
+        if crawl.error is not None:
+            results[crawl.username]["error"] = crawl.error
+        if self.checkpoint is not None:
+            self.checkpoint.mark_user(crawl.username, status, crawl.error)
+            self.checkpoint.save()
+        self._report("users_done")
+
+    def _report(self, phase: str, n: int = 1) -> None:
+        if self.progress is not None:
+            self.progress.advance(phase, n)
@@ -0,0 +1,112 @@
+"""Persistent embedding cache keyed by (model, chunk content hash).
+
+Shared docs, templated sheets and re-syncs produce the same chunks over and
+over; `CachedEmbeddings` looks every chunk up in a SQLite table first and only
+sends the misses to the wrapped embedding backend, in as few calls as possible.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+from langchain.embeddings.base import Embeddings
+
+# SQLite's default limit on bound parameters is 999.
+LOOKUP_BATCH_SIZE = 900
+
+
+class EmbeddingCache:
+    """SQLite-backed store of embedding vectors with hit/miss counters."""
+
+    def __init__(self, path: Union[str, Path] = "docs/embedding_cache.sqlite3") -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, hash))"
+            )
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """Look up vectors for the given hashes, a few hundred per query."""
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                chunk = hashes[start:start + LOOKUP_BATCH_SIZE]
+                rows = self._connection.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? "
+                    f"AND hash IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk],
+                )
+                for hash, vector in rows:
+                    found[hash] = array("d", vector).tolist()
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """Store vectors for the given hashes."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, hash, array("d", vector).tobytes()) for hash, vector in vectors.items()],
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the hit rate over all lookups so far."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only embeds chunks missing from an `EmbeddingCache`."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache: EmbeddingCache,
+        model: Optional[str] = None,
+        batch_size: Optional[int] = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+        # None sends all misses in one call and lets the backend pick its maximal batch size.
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        unique = list(dict.fromkeys(hashes))
+        vectors = self.cache.get_many(self.model, unique)
+
+        missing = [hash for hash in unique if hash not in vectors]
+        if missing:
+            text_by_hash = dict(zip(hashes, texts))
+            batch_size = self.batch_size or len(missing)
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                embedded = self.embeddings.embed_documents([text_by_hash[h] for h in batch])
+                new_vectors = dict(zip(batch, embedded))
+                self.cache.put_many(self.model, new_vectors)
+                vectors.update(new_vectors)
+
+        return [vectors[hash] for hash in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
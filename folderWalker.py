@@ -0,0 +1,289 @@
+"""Breadth-first listing of Drive folder trees.
+
+Instead of one `files().list` call per folder, the walker packs many pending
+folder IDs into a single `'a' in parents or 'b' in parents ...` query and keeps
+several of those queries in flight at once. Folders discovered by one query
+are queued for the next batch immediately, so listings of neighbouring levels
+overlap instead of running strictly one level after another.
+
+File-type, trash and recursion filters are pushed into the `q` expression and
+only the fields the loader reads are requested, so filtered-out items never
+leave Google's servers.
+
+`awalk` runs the same walk on asyncio, for callers with their own async
+HTTP client.
+"""
+
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Set,
+    Tuple,
+)
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+SHORTCUT_MIME_TYPE = "application/vnd.google-apps.shortcut"
+
+MAX_QUERY_LENGTH = 2000
+"""Upper bound on the length of a generated `q` expression."""
+
+LIST_FIELDS = (
+    "nextPageToken, "
+    "files(id, name, mimeType, modifiedTime, version, md5Checksum, size, "
+    "shortcutDetails(targetId, targetMimeType))"
+)
+"""Minimal field mask used when filtering happens server-side.
+
+Carries everything the loader needs to name files, size downloads and key the
+content cache, so listed files need no per-file metadata call.
+"""
+
+CLIENT_FILTER_LIST_FIELDS = (
+    "nextPageToken, "
+    "files(id, name, mimeType, parents, trashed, shortcutDetails(targetId, targetMimeType))"
+)
+"""Field mask needed to filter listings client-side, as the loader used to."""
+
+
+class _Deferred:
+    """Stand-in for a `Future` whose call runs when its result is asked for."""
+
+    def __init__(self, fn: Callable[..., Any], *args: Any) -> None:
+        self.fn = fn
+        self.args = args
+
+    def result(self) -> Any:
+        return self.fn(*self.args)
+
+    def cancel(self) -> bool:
+        return True
+
+
+class FolderWalker:
+    """List every file under a folder, level by level, with batched queries."""
+
+    def __init__(
+        self,
+        service_factory: Callable[[], Any],
+        recursive: bool = False,
+        max_workers: int = 4,
+        max_query_length: int = MAX_QUERY_LENGTH,
+        file_types: Optional[Sequence[str]] = None,
+        load_trashed_files: bool = False,
+        server_side_filters: bool = True,
+        execute: Optional[Callable[[Any], Dict[str, Any]]] = None,
+        measure_bytes: bool = False,
+    ) -> None:
+        self.service_factory = service_factory
+        self.execute = execute or (lambda request: request.execute())
+        self.recursive = recursive
+        self.max_workers = max(1, max_workers)
+        self.max_query_length = max_query_length
+        self.file_types = list(file_types) if file_types else None
+        self.load_trashed_files = load_trashed_files
+        self.server_side_filters = server_side_filters
+        self.fields = LIST_FIELDS if server_side_filters else CLIENT_FILTER_LIST_FIELDS
+        # Listing pages fetched and, with `measure_bytes`, their approximate
+        # size as compact JSON; serializing every page is too costly otherwise.
+        self.measure_bytes = measure_bytes
+        self.pages = 0
+        self.bytes = 0
+
+    def walk(self, folder_id: str) -> Iterator[Dict[str, Any]]:
+        """Yield the non-folder files under `folder_id`, each at most once.
+
+        Shortcuts are resolved to their targets. Folders and files reachable
+        through several parents or shortcuts are visited once, which also
+        breaks shortcut cycles. Results are consumed in submission order, so
+        the output order does not depend on which query returns first. With
+        one worker, pages are fetched on the caller's thread as it consumes
+        them, so no query runs while the caller is paused.
+        """
+        return self._walk(folder_id, {folder_id}, folders_only=False)
+
+    def folder_ids(self, folder_id: str) -> Set[str]:
+        """Return `folder_id` plus, when recursive, every folder below it."""
+        visited_folders = {folder_id}
+        if self.recursive:
+            for _ in self._walk(folder_id, visited_folders, folders_only=True):
+                pass
+        return visited_folders
+
+    def _walk(
+        self, folder_id: str, visited_folders: Set[str], folders_only: bool
+    ) -> Iterator[Dict[str, Any]]:
+        seen_files: Set[str] = set()
+        frontier: Deque[str] = deque([folder_id])
+        in_flight: Deque[Tuple[Any, List[str]]] = deque()
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers) if self.max_workers > 1 else None
+        submit = executor.submit if executor is not None else _Deferred
+        try:
+            while frontier or in_flight:
+                while frontier and len(in_flight) < self.max_workers:
+                    batch = self._take_batch(frontier, folders_only)
+                    in_flight.append((submit(self._list_page, batch, None, folders_only), batch))
+
+                future, batch = in_flight.popleft()
+                results = future.result()
+                page_token = results.get("nextPageToken")
+                if page_token:
+                    in_flight.append(
+                        (submit(self._list_page, batch, page_token, folders_only), batch)
+                    )
+                yield from self._visit(results, frontier, visited_folders, seen_files)
+        finally:
+            for future, _ in in_flight:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown()
+
+    async def awalk(
+        self, folder_id: str, list_page: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Async `walk`; `list_page` fetches one page given the `files().list` parameters.
+
+        `service_factory` and `execute` are not used.
+        """
+        import asyncio
+
+        visited_folders = {folder_id}
+        seen_files: Set[str] = set()
+        frontier: Deque[str] = deque([folder_id])
+        in_flight: Deque[Tuple["asyncio.Future[Dict[str, Any]]", List[str]]] = deque()
+        try:
+            while frontier or in_flight:
+                while frontier and len(in_flight) < self.max_workers:
+                    batch = self._take_batch(frontier)
+                    in_flight.append(
+                        (asyncio.ensure_future(list_page(self._list_params(batch, None))), batch)
+                    )
+
+                task, batch = in_flight.popleft()
+                results = await task
+                page_token = results.get("nextPageToken")
+                if page_token:
+                    in_flight.append(
+                        (asyncio.ensure_future(list_page(self._list_params(batch, page_token))), batch)
+                    )
+                for file in self._visit(results, frontier, visited_folders, seen_files):
+                    yield file
+        finally:
+            for task, _ in in_flight:
+                task.cancel()
+
+    def _visit(
+        self,
+        results: Dict[str, Any],
+        frontier: Deque[str],
+        visited_folders: Set[str],
+        seen_files: Set[str],
+    ) -> List[Dict[str, Any]]:
+        """Queue the new subfolders of a listing page and return its new wanted files."""
+        self.pages += 1
+        if self.measure_bytes:
+            self.bytes += len(json.dumps(results, separators=(",", ":")))
+        files = []
+        for file in results.get("files", []):
+            file = self._resolve_shortcut(file)
+            if file["mimeType"] == FOLDER_MIME_TYPE:
+                if self.recursive and file["id"] not in visited_folders:
+                    visited_folders.add(file["id"])
+                    frontier.append(file["id"])
+            elif self._wanted(file) and file["id"] not in seen_files:
+                seen_files.add(file["id"])
+                files.append(file)
+        return files
+
+    def query(self, parent_ids: List[str], folders_only: bool = False) -> str:
+        """Build the `q` expression listing the children of `parent_ids`."""
+        clauses = [self._parents_clause(parent_ids)]
+        if folders_only:
+            clauses.append(f"mimeType = '{FOLDER_MIME_TYPE}'")
+            if not self.load_trashed_files:
+                clauses.append("trashed = false")
+        elif self.server_side_filters:
+            clauses.extend(self._filter_clauses())
+        return " and ".join(clauses)
+
+    def _filter_clauses(self) -> List[str]:
+        """Trash, file-type and recursion filters shared by every query."""
+        clauses = []
+        if not self.load_trashed_files:
+            clauses.append("trashed = false")
+        if self.file_types:
+            # Shortcut targets can't be filtered server-side; `_wanted` checks them.
+            mime_types = self.file_types + [SHORTCUT_MIME_TYPE]
+            if self.recursive:
+                mime_types.append(FOLDER_MIME_TYPE)
+            clauses.append(
+                "(" + " or ".join(f"mimeType = '{mime_type}'" for mime_type in mime_types) + ")"
+            )
+        elif not self.recursive:
+            clauses.append(f"mimeType != '{FOLDER_MIME_TYPE}'")
+        return clauses
+
+    def _wanted(self, file: Dict[str, Any]) -> bool:
+        """Apply the filters the query could not (or, client-side, did not) apply."""
+        if self.file_types and file["mimeType"] not in self.file_types:
+            return False
+        if not self.load_trashed_files and file.get("trashed"):
+            return False
+        return True
+
+    def _parents_clause(self, parent_ids: List[str]) -> str:
+        clause = " or ".join(f"'{parent_id}' in parents" for parent_id in parent_ids)
+        return f"({clause})" if len(parent_ids) > 1 else clause
+
+    def _take_batch(self, frontier: Deque[str], folders_only: bool = False) -> List[str]:
+        """Pop as many folder IDs as fit into one query; always at least one."""
+        batch = [frontier.popleft()]
+        while (
+            frontier
+            and len(self.query(batch + [frontier[0]], folders_only)) <= self.max_query_length
+        ):
+            batch.append(frontier.popleft())
+        return batch
+
+    def _list_page(
+        self, parent_ids: List[str], page_token: Optional[str], folders_only: bool = False
+    ) -> Dict[str, Any]:
+        """Fetch one page of children; runs on a worker thread."""
+        return self.execute(
+            self.service_factory()
+            .files()
+            .list(**self._list_params(parent_ids, page_token, folders_only))
+        )
+
+    def _list_params(
+        self, parent_ids: List[str], page_token: Optional[str], folders_only: bool = False
+    ) -> Dict[str, Any]:
+        params = {
+            "q": self.query(parent_ids, folders_only),
+            "pageSize": 1000,
+            "includeItemsFromAllDrives": True,
+            "supportsAllDrives": True,
+            "fields": self.fields,
+        }
+        if page_token:
+            params["pageToken"] = page_token
+        return params
+
+    @staticmethod
+    def _resolve_shortcut(file: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace a shortcut by an entry describing its target."""
+        if file["mimeType"] != SHORTCUT_MIME_TYPE:
+            return file
+        details = file.get("shortcutDetails") or {}
+        if "targetId" not in details:
+            return file
+        # The shortcut's own revision and size fields say nothing about the target.
+        target = {
+            key: value
+            for key, value in file.items()
+            if key not in ("modifiedTime", "version", "md5Checksum", "size")
+        }
+        target["id"] = details["targetId"]
+        target["mimeType"] = details.get("targetMimeType", SHORTCUT_MIME_TYPE)
+        return target
@@ -7,16 +7,219 @@
 # 4. For service accounts visit
 #   https://cloud.google.com/iam/docs/service-accounts-create
 
+import json
+import logging
+import mmap
 import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Union
+from typing import (
+    TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List,
+    Optional, Sequence, Set, Tuple,
+)
+from urllib.parse import quote
 
 from langchain.docstore.document import Document
 from langchain.document_loaders.base import BaseLoader
-from langchain.pydantic_v1 import BaseModel, root_validator, validator
+from langchain.pydantic_v1 import BaseModel, PrivateAttr, root_validator, validator
 from googleapiclient.errors import HttpError
 
+from contentCache import DEFAULT_MAX_BYTES, ContentCache, get_content_cache, revision_marker
+from driveChanges import ChangeCursorStore, ChangeSet
+from folderWalker import FOLDER_MIME_TYPE, FolderWalker
+from metrics import metrics
+from requestExecutor import request_executor
+from servicePool import service_pool
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
 SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
+FILE_METADATA_FIELDS = "id, name, mimeType, modifiedTime, version, md5Checksum, size"
+METADATA_BATCH_SIZE = 100
+SPREADSHEET_FIELDS = "properties.title, sheets.properties(sheetId, title, gridProperties.rowCount)"
+
+_TEXT_FIELDS = "text/textElements/textRun/content"
+_ELEMENT_FIELDS = f"shape/{_TEXT_FIELDS}, table/tableRows/tableCells/{_TEXT_FIELDS}"
+# Only slide text is requested; layouts, masters and images are left out.
+PRESENTATION_FIELDS = (
+    f"title, slides(pageElements({_ELEMENT_FIELDS}, "
+    f"elementGroup/children({_ELEMENT_FIELDS}, elementGroup)))"
+)
+
+
+def _document_from_text(id: str, file: Dict[str, Any], text: str) -> Document:
+    """Wrap the plain-text export of a Google Doc."""
+    metadata = {
+        "source": f"https://docs.google.com/document/d/{id}/edit",
+        "title": f"{file.get('name')}",
+        "when": f"{file.get('modifiedTime')}",
+    }
+    return Document(page_content=text, metadata=metadata)
+
+
+def _slide_documents(id: str, presentation: Dict[str, Any]) -> List[Document]:
+    """One document per slide of a presentation fetched with `PRESENTATION_FIELDS`."""
+    source = f"https://docs.google.com/presentation/d/{id}/edit"
+    title = f"{presentation['title']}"
+    return [
+        Document(
+            page_content=_slide_text(slide.get("pageElements", [])),
+            metadata={"source": source, "title": title, "page": slide_number},
+        )
+        for slide_number, slide in enumerate(presentation.get("slides", []), start=1)
+    ]
+
+
+def _slide_text(page_elements: List[Dict[str, Any]]) -> str:
+    """Concatenate the text runs of shapes, tables and grouped elements."""
+    parts: List[str] = []
+    _collect_slide_text(page_elements, parts)
+    return "".join(parts)
+
+
+def _collect_slide_text(page_elements: List[Dict[str, Any]], parts: List[str]) -> None:
+    for page_element in page_elements:
+        shape = page_element.get("shape")
+        if shape:
+            _collect_text_runs(shape.get("text"), parts)
+        table = page_element.get("table")
+        if table:
+            for table_row in table.get("tableRows", []):
+                for table_cell in table_row.get("tableCells", []):
+                    _collect_text_runs(table_cell.get("text"), parts)
+        group = page_element.get("elementGroup")
+        if group:
+            _collect_slide_text(group.get("children", []), parts)
+
+
+def _collect_text_runs(text: Optional[Dict[str, Any]], parts: List[str]) -> None:
+    if not text:
+        return
+    for text_element in text.get("textElements", []):
+        text_run = text_element.get("textRun")
+        if text_run:
+            parts.append(text_run.get("content", ""))
+
+
+def _sheet_range(sheet_title: str) -> str:
+    """Quote a tab title for use in A1 notation."""
+    return "'" + sheet_title.replace("'", "''") + "'"
+
+
+def _sheet_row_count(properties: Dict[str, Any]) -> int:
+    return properties.get("gridProperties", {}).get("rowCount", 0)
+
+
+def _sheet_documents(
+    id: str,
+    spreadsheet_title: str,
+    properties: Dict[str, Any],
+    header: List[str],
+    rows: Iterable[Tuple[int, List[str]]],
+    rows_per_document: int = 1,
+    max_chars_per_document: Optional[int] = None,
+) -> Iterator[Document]:
+    """Turn numbered tab rows into documents.
+
+    By default every row becomes one document that repeats the header label
+    in front of each value. When `rows_per_document` is above 1 or
+    `max_chars_per_document` is set, rows are packed into blocks instead: the
+    header is emitted once per block and the covered rows are kept in the
+    `row_start`/`row_end` metadata. A block ends after `rows_per_document`
+    rows or before it would exceed `max_chars_per_document`, whichever comes
+    first; with a character budget, a row limit of 1 or less means no limit.
+    """
+    sheet_name = properties["title"]
+    base_metadata = {
+        "source": (
+            f"https://docs.google.com/spreadsheets/d/{id}/"
+            f"edit?gid={properties['sheetId']}"
+        ),
+        "title": f"{spreadsheet_title} - {sheet_name}",
+    }
+
+    if rows_per_document <= 1 and max_chars_per_document is None:
+        for i, row in rows:
+            content = []
+            for j, v in enumerate(row):
+                title = header[j].strip() if len(header) > j else ""
+                content.append(f"{title}: {v.strip()}")
+
+            page_content = "\n".join(content)
+            yield Document(page_content=page_content, metadata={**base_metadata, "row": i})
+        return
+
+    max_rows = rows_per_document if rows_per_document > 1 else None
+    header_line = " | ".join(h.strip() for h in header)
+    lines: List[str] = []
+    size = len(header_line)
+    row_start = row_end = 0
+    for i, row in rows:
+        if not row:
+            continue
+        line = " | ".join(v.strip() for v in row)
+        if lines and (
+            (max_rows is not None and len(lines) >= max_rows)
+            or (max_chars_per_document is not None and size + 1 + len(line) > max_chars_per_document)
+        ):
+            yield _sheet_block(base_metadata, header_line, lines, row_start, row_end)
+            lines, size = [], len(header_line)
+        if not lines:
+            row_start = i
+        lines.append(line)
+        size += 1 + len(line)
+        row_end = i
+    if lines:
+        yield _sheet_block(base_metadata, header_line, lines, row_start, row_end)
+
+
+def _sheet_block(
+    base_metadata: Dict[str, Any], header_line: str, lines: List[str], row_start: int, row_end: int
+) -> Document:
+    metadata = {**base_metadata, "row": row_start, "row_start": row_start, "row_end": row_end}
+    return Document(page_content="\n".join([header_line] + lines), metadata=metadata)
+
+
+def _extract_pdf_pages(stream: Any, start: int, stop: Optional[int]) -> Iterator[str]:
+    """Yield the text of pages `start` to `stop` of a PDF stream."""
+    from PyPDF2 import PdfReader
+
+    pdf_reader = PdfReader(stream)
+    for page in pdf_reader.pages[start:stop]:
+        yield page.extract_text()
+
+
+def _extract_pdf_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Process-pool task: extract a page range of the PDF at `path`."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return list(_extract_pdf_pages(mm, start, stop))
+
+
+_pdf_process_pools: Dict[int, "ProcessPoolExecutor"] = {}
+_pdf_process_pools_lock = threading.Lock()
+
+
+def _pdf_process_pool(workers: int) -> "ProcessPoolExecutor":
+    """Return a shared process pool of the given size, creating it on first use."""
+    with _pdf_process_pools_lock:
+        executor = _pdf_process_pools.get(workers)
+        if executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Loader threads may hold locks; spawn avoids forking them.
+            executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pdf_process_pools[workers] = executor
+        return executor
 
 
 class GoogleDriveLoader(BaseLoader, BaseModel):
@@ -46,6 +249,44 @@ class GoogleDriveLoader(BaseLoader, BaseModel):
     """The file loader class to use."""
     file_loader_kwargs: Dict["str", Any] = {}
     """The file loader kwargs to use."""
+    max_workers: int = 1
+    """Number of files fetched and parsed in parallel. 1 loads them serially."""
+    listing_workers: int = 4
+    """Number of folder listing queries kept in flight at once."""
+    cache_dir: Optional[Path] = None
+    """Directory of the on-disk content cache. None disables caching."""
+    cache_max_bytes: int = DEFAULT_MAX_BYTES
+    """Size cap of the content cache; least recently used entries are evicted."""
+    sheet_chunk_rows: int = 10000
+    """Rows fetched per Sheets values call; larger tabs are streamed in chunks."""
+    sheet_rows_per_document: int = 1
+    """Spreadsheet rows packed into one document. 1 keeps one document per row,
+    unless `sheet_max_chars_per_document` is set."""
+    sheet_max_chars_per_document: Optional[int] = None
+    """Character budget of a packed spreadsheet document, header included. When
+    set, rows are packed up to this budget alone unless `sheet_rows_per_document`
+    is above 1."""
+    download_chunk_size: int = 100 * 1024 * 1024
+    """Bytes requested per chunk when downloading binary files."""
+    pdf_spool_threshold: int = 32 * 1024 * 1024
+    """Files larger than this are downloaded to a temporary file, not memory."""
+    pdf_workers: int = 1
+    """Processes extracting text from spooled PDFs. 1 extracts in-process."""
+    pdf_pages_per_task: int = 16
+    """Pages handed to a PDF worker process at a time."""
+    async_concurrency: int = 100
+    """Requests, and files, kept in flight at once by `alazy_load`."""
+    http2: bool = False
+    """Whether `alazy_load` multiplexes requests over HTTP/2 (needs `httpx[http2]`)."""
+    api_root_url: Optional[str] = None
+    """Root URL of the Google APIs for `alazy_load`; None uses Google's endpoints."""
+    progress: Any = None
+    """Optional reporter with `advance(phase, n)`, told about listed and fetched
+    files. It may raise from `advance` to cancel the load."""
+
+    # Files whose documents are missing or incomplete because a request or the
+    # parser failed; see `load_changes`.
+    _failed_file_ids: Set[str] = PrivateAttr(default_factory=set)
 
     @root_validator
     def validate_inputs(cls, values: Dict[str, Any]) -> Dict[str, Any]:
@@ -150,97 +391,145 @@ class GoogleDriveLoader(BaseLoader, BaseModel):
 
     def _load_sheet_from_id(self, id: str, username: str) -> List[Document]:
         """Load a sheet and all tabs from an ID."""
+        return list(self._lazy_load_sheet_from_id(id, username))
 
+    def _lazy_load_sheet_from_id(self, id: str, username: str) -> Iterator[Document]:
+        """Yield one document per row of every tab, tab by tab.
+
+        Tabs are fetched together through `values().batchGet`, grouped so that
+        one call returns at most `sheet_chunk_rows` rows. Larger tabs are read
+        in ranges of `sheet_chunk_rows` rows, so the full values matrix of a
+        huge tab is never held in memory.
+        """
         try:
-            from googleapiclient.discovery import build
-            creds = self._load_credentials()
-            # sheets_service = build("sheets", "v4", credentials=creds)
             sheets_service = self.create_drive_service(username, "sheets", "v4")
-            spreadsheet = sheets_service.spreadsheets().get(spreadsheetId=id).execute()
-            sheets = spreadsheet.get("sheets", [])
-
-            documents = []
-            for sheet in sheets:
-                sheet_name = sheet["properties"]["title"]
-                try:
-                    result = (
-                        sheets_service.spreadsheets()
-                            .values()
-                            .get(spreadsheetId=id, range=sheet_name)
-                            .execute()
-                    )
-                    values = result.get("values", [])
-                    if not values:
-                        continue  # empty sheet
-
-                    header = values[0]
-                    for i, row in enumerate(values[1:], start=1):
-                        metadata = {
-                            "source": (
-                                f"https://docs.google.com/spreadsheets/d/{id}/"
-                                f"edit?gid={sheet['properties']['sheetId']}"
-                            ),
-                            "title": f"{spreadsheet['properties']['title']} - {sheet_name}",
-                            "row": i,
-                        }
-                        content = []
-                        for j, v in enumerate(row):
-                            title = header[j].strip() if len(header) > j else ""
-                            content.append(f"{title}: {v.strip()}")
-
-                        page_content = "\n".join(content)
-                        documents.append(Document(page_content=page_content, metadata=metadata))
-                except HttpError as e:
-                    print(f"Error loading sheet '{sheet_name}': {str(e)}")
-
-            return documents
+            spreadsheet = self._execute(
+                sheets_service.spreadsheets()
+                .get(spreadsheetId=id, fields=SPREADSHEET_FIELDS),
+                username,
+            )
         except HttpError as e:
-            print(f"Error loading spreadsheet: {str(e)}")
-            return []  # Return an empty list or handle the error as needed
+            self._file_failed(id, "Failed to load spreadsheet %s: %s", id, e)
+            return
+
+        title = spreadsheet["properties"]["title"]
+        for batch in self._sheet_batches([s["properties"] for s in spreadsheet.get("sheets", [])]):
+            if len(batch) == 1 and _sheet_row_count(batch[0]) > self.sheet_chunk_rows:
+                yield from self._lazy_load_large_sheet(sheets_service, id, title, batch[0], username)
+                continue
+            try:
+                result = self._execute(
+                    sheets_service.spreadsheets()
+                    .values()
+                    .batchGet(spreadsheetId=id, ranges=[_sheet_range(p["title"]) for p in batch]),
+                    username,
+                )
+            except HttpError as e:
+                self._file_failed(
+                    id, "Failed to load tabs %s of spreadsheet %s: %s", [p["title"] for p in batch], id, e
+                )
+                continue
+            for properties, value_range in zip(batch, result.get("valueRanges", [])):
+                values = value_range.get("values", [])
+                if not values:
+                    continue  # empty sheet
+                yield from metrics.timed_iter(
+                    self._sheet_documents(
+                        id, title, properties, values[0], enumerate(values[1:], start=1)
+                    ),
+                    "ingest_phase_seconds",
+                    phase="parse",
+                )
+
+    def _sheet_batches(self, sheets: List[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """Group consecutive tabs so each group spans at most `sheet_chunk_rows` rows.
+
+        A tab larger than that forms a group of its own.
+        """
+        batch: List[Dict[str, Any]] = []
+        rows = 0
+        for properties in sheets:
+            row_count = _sheet_row_count(properties)
+            if batch and rows + row_count > self.sheet_chunk_rows:
+                yield batch
+                batch, rows = [], 0
+            batch.append(properties)
+            rows += row_count
+        if batch:
+            yield batch
+
+    def _lazy_load_large_sheet(
+        self, sheets_service: Any, id: str, title: str, properties: Dict[str, Any], username: str
+    ) -> Iterator[Document]:
+        """Stream a tab too large for one values call."""
+        rows = self._iter_sheet_rows(sheets_service, id, properties, username)
+        first = next(rows, None)
+        if first is None:
+            return  # empty sheet
+        _, header = first
+        yield from self._sheet_documents(id, title, properties, header, rows)
+
+    def _iter_sheet_rows(
+        self, sheets_service: Any, id: str, properties: Dict[str, Any], username: str
+    ) -> Iterator[Tuple[int, List[str]]]:
+        """Yield (index, row) pairs `sheet_chunk_rows` rows at a time; the header is index 0."""
+        row_count = _sheet_row_count(properties)
+        for start in range(1, row_count + 1, self.sheet_chunk_rows):
+            end = min(start + self.sheet_chunk_rows - 1, row_count)
+            try:
+                result = self._execute(
+                    sheets_service.spreadsheets()
+                    .values()
+                    .get(spreadsheetId=id, range=f"{_sheet_range(properties['title'])}!{start}:{end}"),
+                    username,
+                )
+            except HttpError as e:
+                self._file_failed(
+                    id, "Failed to load tab %r of spreadsheet %s: %s", properties["title"], id, e
+                )
+                return
+            # Sheet row numbers are 1-based; document row indices count from the header.
+            yield from enumerate(result.get("values", []), start=start - 1)
+
+    def _sheet_documents(
+        self,
+        id: str,
+        title: str,
+        properties: Dict[str, Any],
+        header: List[str],
+        rows: Iterable[Tuple[int, List[str]]],
+    ) -> Iterator[Document]:
+        return _sheet_documents(
+            id,
+            title,
+            properties,
+            header,
+            rows,
+            rows_per_document=self.sheet_rows_per_document,
+            max_chars_per_document=self.sheet_max_chars_per_document,
+        )
 
     def _load_slide_from_id(self, id: str, username: str) -> List[Document]:
-        """Load a sheet and all tabs from an ID."""
+        """Load a presentation, one document per slide."""
 
         try:
-            from googleapiclient.discovery import build
             slides_service = self.create_drive_service(username, "slides", "v1")
-            presentation = slides_service.presentations().get(presentationId=id).execute()
-
-            documents = []
-            complete_text = ""
-            print("presentation[""]", presentation['title'])
-            source = f"https://docs.google.com/presentation/d/{id}/edit"
-            title = f"{presentation['title']}"
-            for slide_number, slide in enumerate(presentation['slides'], start=1):
-                page_content = ""
-                for page_element in slide.get('pageElements', []):
-                    shape = page_element.get('shape')
-                    text_ele = shape.get('text') if shape else None
-                    if text_ele:
-                        text_elements = text_ele.get('textElements', [])
-                        for text_element in text_elements:
-                            text_run = text_element.get('textRun')
-                            if text_run:
-                                content = text_run.get('content', '')
-                                page_content += content
-                                complete_text += content
-                metadata = {
-                    "source": source,
-                    "title": title,
-                    "page" : slide_number
-                }
-                print(metadata)
-                print(page_content)
-                documents.append(Document(page_content=page_content, metadata=metadata))
-
-            print("documents: ", documents)
-            return documents
+            presentation = self._execute(
+                slides_service.presentations()
+                .get(presentationId=id, fields=PRESENTATION_FIELDS),
+                username,
+            )
+
+            with metrics.timer("ingest_phase_seconds", phase="parse"):
+                return _slide_documents(id, presentation)
         except HttpError as e:
-            print(f"Error loading spreadsheet: {str(e)}")
+            self._file_failed(id, "Failed to load presentation %s: %s", id, e)
             return []  # Return an empty list or handle the error as needed
 
-    def _load_document_from_id(self, id: str, username: str) -> Document:
-        """Load a document from an ID."""
+    def _load_document_from_id(
+        self, id: str, username: str, file: Optional[Dict[str, Any]] = None
+    ) -> Document:
+        """Load a document from an ID, reusing `file` metadata when it has it."""
         from io import BytesIO
         # from googleapiclient.discovery import build
         from googleapiclient.errors import HttpError
@@ -250,198 +539,503 @@ class GoogleDriveLoader(BaseLoader, BaseModel):
         # service = build("drive", "v3", credentials=creds)
         service = self.create_drive_service(username)
 
-        file = (
-            service.files()
-            .get(fileId=id, supportsAllDrives=True, fields="modifiedTime,name")
-            .execute()
-        )
+        if not file or "name" not in file or "modifiedTime" not in file:
+            with metrics.timer("ingest_phase_seconds", phase="metadata"):
+                file = self._execute(
+                    service.files()
+                    .get(fileId=id, supportsAllDrives=True, fields="modifiedTime,name"),
+                    username,
+                )
         request = service.files().export_media(fileId=id, mimeType="text/plain")
 
         fh = BytesIO()
 
         downloader = MediaIoBaseDownload(fh, request)
-        done = False
         try:
-            while done is False:
-                status, done = downloader.next_chunk()
+            self._download(downloader, username)
 
         except HttpError as e:
             if e.resp.status == 404:
-                print("File not found: {}".format(id))
+                self._file_failed(id, "File not found: %s", id)
             else:
-                print("An error occurred: {}".format(e))
+                self._file_failed(id, "Failed to export document %s: %s", id, e)
 
-        text = fh.getvalue().decode("utf-8")
-        metadata = {
-            "source": f"https://docs.google.com/document/d/{id}/edit",
-            "title": f"{file.get('name')}",
-            "when": f"{file.get('modifiedTime')}",
-        }
-        return Document(page_content=text, metadata=metadata)
+        with metrics.timer("ingest_phase_seconds", phase="parse"):
+            text = fh.getvalue().decode("utf-8")
+        return _document_from_text(id, file, text)
 
     def _load_documents_from_folder(
         self, folder_id: str, *, username: str, file_types: Optional[Sequence[str]] = None
     ) -> List[Document]:
         """Load documents from a folder."""
-
-        print("########## _load_documents_from_folder ##########")
-        service = self.create_drive_service(username)
-        files = self._fetch_files_recursive(service, folder_id)
-        # If file types filter is provided, we'll filter by the file type.
-        if file_types:
-            _files = [f for f in files if f["mimeType"] in file_types]  # type: ignore
-        else:
-            _files = files
-
-        returns = []
-        for file in _files:
-            print(file["mimeType"])
-            print(file["name"])
-            print(file)
-            if file["trashed"] and not self.load_trashed_files:
-                print("************ Ignored", file["name"])
-                continue
-            elif file["mimeType"] == "application/vnd.google-apps.document":
-                returns.append(self._load_document_from_id(file["id"], username))
-            elif file["mimeType"] == "application/vnd.google-apps.spreadsheet":
-                returns.extend(self._load_sheet_from_id(file["id"], username))
-            elif file["mimeType"] == "application/vnd.google-apps.presentation":
-                returns.extend(self._load_slide_from_id(file["id"], username))
-            elif (
-                file["mimeType"] == "application/pdf"
-                or self.file_loader_cls is not None
-            ):
-                returns.extend(self._load_file_from_id(file["id"], username))
-            else:
-                print("************ Ignored", file["name"])
-                pass
-        list_size = len(returns)
-        print(f"The size of the list is: {list_size}")
-        print("&&&&&&&&& LIST: ", returns)
+        returns = list(
+            self._lazy_load_documents_from_folder(folder_id, username=username, file_types=file_types)
+        )
+        logger.debug("Loaded %d documents from folder %s", len(returns), folder_id)
         return returns
 
+    def _lazy_load_documents_from_folder(
+        self, folder_id: str, *, username: str, file_types: Optional[Sequence[str]] = None
+    ) -> Iterator[Document]:
+        """Yield documents from a folder as each file finishes loading."""
+        logger.debug("Loading documents from folder %s", folder_id)
+        files = self._fetch_files_recursive(folder_id, username, file_types=file_types)
+        yield from self._iter_files(files, username)
+
     def load_documents_from_list(
         self, files: List[Dict[str, str]], username: str, file_types: Optional[Sequence[str]] = None
     ) -> List[Document]:
         """Load documents from a folder."""
         try:
-            print("&&&&&&&&&&&&&&&& LOADING ON DEMAND &&&&&&&&&&&&&&&&&&")
             if file_types:
                 _files = [f for f in files if f["mimeType"] in file_types]  # type: ignore
             else:
                 _files = files
 
-            returns = []
-            for file in _files:
-                print(username)
-                print(file["mimeType"])
-                print(file["fileId"])
-                print(file)
-                # TODO: Handle folderId here
-                if file["mimeType"] == "application/vnd.google-apps.document":
-                    returns.append(self._load_document_from_id(file["fileId"], username))
-                elif file["mimeType"] == "application/vnd.google-apps.spreadsheet":
-                    returns.extend(self._load_sheet_from_id(file["fileId"], username))
-                elif file["mimeType"] == "application/vnd.google-apps.presentation":
-                    returns.extend(self._load_slide_from_id(file["fileId"], username))
-                elif (
-                    file["mimeType"] == "application/pdf"
-                    or self.file_loader_cls is not None
-                ):
-                    returns.extend(self._load_file_from_id(file["fileId"], username))
-                else:
-                    print("************ Ignored", file["fileId"])
-                    pass
-
-            list_size = len(returns)
-            print(f"The size of the list returned from langchain is: {list_size}")
-            print("----------------------&&&&&&&&& LIST: ", returns)
+            # TODO: Handle folderId here
+            returns = self._load_files(
+                self._with_metadata(_files, username, id_key="fileId"), username, id_key="fileId"
+            )
+            logger.debug("Loaded %d documents from %d listed files", len(returns), len(_files))
             return returns
-        except Exception as e:
-            print(f"Error : {str(e)}")
+        except Exception:
+            logger.exception("Failed to load listed files")
             return []
 
-    def _fetch_files_recursive(
-        self, service: Any, folder_id: str
-    ) -> List[Dict[str, Union[str, List[str]]]]:
-        """Fetch all files and subfolders recursively."""
-        results = (
-            service.files()
-            .list(
-                q=f"'{folder_id}' in parents",
-                pageSize=1000,
-                includeItemsFromAllDrives=True,
-                supportsAllDrives=True,
-                fields="nextPageToken, files(id, name, mimeType, parents, trashed)",
-            )
-            .execute()
-        )
-        files = results.get("files", [])
-        returns = []
+    def load_listed_files(
+        self, files: List[Dict[str, Any]], username: str, id_key: str = "fileId"
+    ) -> Tuple[List[Document], List[str]]:
+        """Load listed files, returning (documents, ids of the files that failed).
+
+        Unlike `load_documents_from_list`, a file that fails to load, even in
+        part, contributes no documents, and errors that aren't confined to
+        one file are raised.
+        """
+        return self._load_files_checked(files, username, id_key)
+
+    def _load_files_checked(
+        self, files: List[Dict[str, Any]], username: str, id_key: str = "id"
+    ) -> Tuple[List[Document], List[str]]:
+        ids = {f[id_key] for f in files}
+        documents = self._load_files(files, username, id_key=id_key)
+        failed = ids & self._failed_file_ids
+        return [d for d in documents if d.metadata.get("file_id") not in failed], sorted(failed)
+
+    def _iter_files_checked(
+        self, files: Iterable[Dict[str, Any]], username: str, failed_file_ids: List[str]
+    ) -> Iterator[Document]:
+        """Like `_iter_files`; once done, appends the ids of failed files to `failed_file_ids`."""
+        ids: Set[str] = set()
+
+        def listed() -> Iterator[Dict[str, Any]]:
+            for f in files:
+                ids.add(f["id"])
+                yield f
+
+        yield from self._iter_files(listed(), username)
+        failed_file_ids.extend(sorted(ids & self._failed_file_ids))
+
+    def _load_files(
+        self, files: Iterable[Dict[str, Any]], username: str, id_key: str = "id"
+    ) -> List[Document]:
+        """Load the given files, returning documents in the order of `files`."""
+        return list(self._iter_files(files, username, id_key=id_key))
+
+    def _iter_files(
+        self, files: Iterable[Dict[str, Any]], username: str, id_key: str = "id"
+    ) -> Iterator[Document]:
+        """Yield documents for `files`, fetching up to `max_workers` in parallel.
+
+        Documents come out in the order of `files` regardless of which download
+        finishes first. At most `2 * max_workers` files are in flight, so memory
+        stays bounded however many files are listed.
+        """
+        files = self._report_each(files, "files_listed")
+        if self.max_workers <= 1:
+            for f in files:
+                yield from self._iter_file_documents(f[id_key], f["mimeType"], username, f)
+                self._report("files_fetched")
+            return
+
+        pending: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                for f in files:
+                    pending.append(
+                        executor.submit(
+                            self._load_file_documents, f[id_key], f["mimeType"], username, f
+                        )
+                    )
+                    if len(pending) >= 2 * self.max_workers:
+                        yield from pending.popleft().result()
+                        self._report("files_fetched")
+                while pending:
+                    yield from pending.popleft().result()
+                    self._report("files_fetched")
+            finally:
+                # The consumer may stop early; don't start files nobody will read.
+                for future in pending:
+                    future.cancel()
+
+    def _file_failed(self, id: str, message: str, *args: Any) -> None:
+        """Log a failure that leaves the file's documents incomplete, and remember the file."""
+        logger.warning(message, *args)
+        self._failed_file_ids.add(id)
+
+    def _report(self, phase: str, n: int = 1) -> None:
+        if self.progress is not None:
+            self.progress.advance(phase, n)
+
+    def _report_each(self, items: Iterable[Any], phase: str) -> Iterator[Any]:
+        for item in items:
+            self._report(phase)
+            yield item
+
+    def _load_file_documents(
+        self, id: str, mime_type: str, username: str, file: Optional[Dict[str, Any]] = None
+    ) -> List[Document]:
+        """Load one file by MIME type; a failure only drops that file."""
+        return list(self._iter_file_documents(id, mime_type, username, file))
+
+    def _iter_file_documents(
+        self, id: str, mime_type: str, username: str, file: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Document]:
+        """Yield one file's documents as they are parsed.
+
+        A failure is logged and ends that file only; documents already yielded
+        for it are kept. With a content cache configured, an unchanged revision
+        is served from disk without touching the network for its content.
+        """
+        try:
+            for doc in metrics.timed_iter(
+                self._fetch_file_documents(id, mime_type, username, file),
+                "ingest_file_seconds",
+                mime_type=mime_type,
+            ):
+                metrics.inc("ingest_items_total", kind="documents")
+                yield doc
+            metrics.inc("ingest_items_total", kind="files")
+        except Exception:
+            logger.exception("Failed to load file %s (%s)", id, mime_type)
+            self._failed_file_ids.add(id)
+
+    def _fetch_file_documents(
+        self, id: str, mime_type: str, username: str, file: Optional[Dict[str, Any]]
+    ) -> Iterator[Document]:
+        self._failed_file_ids.discard(id)
+        cache = self._content_cache()
+        revision = revision_marker(file or {})
+        if cache is not None and revision is None:
+            revision = revision_marker(self._file_metadata(id, username))
+        if cache is not None and revision is not None:
+            cached = cache.get(id, revision, self._cache_variant())
+            if cached is not None:
+                yield from cached
+                return
+
+        if mime_type == "application/vnd.google-apps.document":
+            docs: Iterable[Document] = [self._load_document_from_id(id, username, file)]
+        elif mime_type == "application/vnd.google-apps.spreadsheet":
+            docs = self._lazy_load_sheet_from_id(id, username)
+        elif mime_type == "application/vnd.google-apps.presentation":
+            docs = self._load_slide_from_id(id, username)
+        elif mime_type == "application/pdf" or self.file_loader_cls is not None:
+            docs = self._lazy_load_file_from_id(id, username, file)
+        else:
+            logger.debug("Ignoring %s with unsupported MIME type %s", id, mime_type)
+            return
+
+        # Documents are written to the cache entry as they are yielded.
+        writer = None
+        if cache is not None and revision:
+            writer = cache.writer(id, revision, self._cache_variant())
+        has_content = False
+        try:
+            for doc in docs:
+                # Lets vector stores replace or prune a file's chunks on later syncs.
+                doc.metadata["file_id"] = id
+                if revision is not None:
+                    doc.metadata["revision"] = revision
+                if writer is not None:
+                    writer.add(doc)
+                    has_content = has_content or bool(doc.page_content)
+                yield doc
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+
+        if writer is not None:
+            # Loaders log some errors and return nothing or part of the file; don't pin that.
+            if has_content and id not in self._failed_file_ids:
+                writer.commit()
+            else:
+                writer.abort()
+
+    def _with_metadata(
+        self, files: Iterable[Dict[str, Any]], username: str, id_key: str = "id"
+    ) -> Iterator[Dict[str, Any]]:
+        """Merge Drive metadata into file entries that only carry an ID.
+
+        Lookups are coalesced into HTTP batch requests of up to
+        `METADATA_BATCH_SIZE` files, turning N round trips into N/100. Given
+        values win over fetched ones; files whose lookup fails pass through
+        unchanged and are looked up again when loaded.
+        """
+        chunk: List[Dict[str, Any]] = []
         for file in files:
-            if file["mimeType"] == "application/vnd.google-apps.folder":
-                if self.recursive:
-                    returns.extend(self._fetch_files_recursive(service, file["id"]))
+            chunk.append(file)
+            if len(chunk) == METADATA_BATCH_SIZE:
+                yield from self._merge_metadata(chunk, username, id_key)
+                chunk = []
+        if chunk:
+            yield from self._merge_metadata(chunk, username, id_key)
+
+    def _merge_metadata(
+        self, files: List[Dict[str, Any]], username: str, id_key: str
+    ) -> List[Dict[str, Any]]:
+        missing = [f[id_key] for f in files if revision_marker(f) is None or "name" not in f]
+        metadata = self._batch_file_metadata(missing, username) if missing else {}
+        return [{**metadata.get(f[id_key], {}), **f} for f in files]
+
+    def fetch_metadata(
+        self, files: Iterable[Dict[str, Any]], username: str, id_key: str = "fileId"
+    ) -> List[Dict[str, Any]]:
+        """Return `files` with name, revision and size metadata merged in.
+
+        Entries returned here can be passed back to `load_documents_from_list`
+        without being looked up again.
+        """
+        return list(self._with_metadata(files, username, id_key=id_key))
+
+    def _batch_file_metadata(self, ids: List[str], username: str) -> Dict[str, Dict[str, Any]]:
+        """Fetch metadata for up to `METADATA_BATCH_SIZE` files in one HTTP batch."""
+        service = self.create_drive_service(username)
+        requests = {
+            id: service.files().get(fileId=id, supportsAllDrives=True, fields=FILE_METADATA_FIELDS)
+            for id in dict.fromkeys(ids)
+        }
+        try:
+            with metrics.timer("ingest_phase_seconds", phase="metadata"):
+                responses = self._execute_batch(service, requests, username)
+        except HttpError as e:
+            logger.warning("Metadata batch of %d files failed: %s", len(ids), e)
+            return {}
+
+        results: Dict[str, Dict[str, Any]] = {}
+        for id, (response, error) in responses.items():
+            if error is None:
+                results[id] = response
             else:
-                returns.append(file)
+                logger.warning("Metadata lookup failed for %s: %s", id, error)
+        return results
 
-        return returns
+    def _file_metadata(self, id: str, username: str) -> Dict[str, Any]:
+        """Fetch the metadata needed to name a file and key its cached content."""
+        service = self.create_drive_service(username)
+        with metrics.timer("ingest_phase_seconds", phase="metadata"):
+            return self._execute(
+                service.files()
+                .get(fileId=id, supportsAllDrives=True, fields=FILE_METADATA_FIELDS),
+                username,
+            )
+
+    def _content_cache(self) -> Optional[ContentCache]:
+        if self.cache_dir is None:
+            return None
+        return get_content_cache(self.cache_dir, self.cache_max_bytes)
+
+    def _cache_variant(self) -> str:
+        """Describe the settings that shape parsed output, so they key the cache too."""
+        variant = {
+            "sheet_rows_per_document": self.sheet_rows_per_document,
+            "sheet_max_chars_per_document": self.sheet_max_chars_per_document,
+        }
+        if self.file_loader_cls is not None:
+            variant["file_loader_cls"] = (
+                f"{self.file_loader_cls.__module__}.{self.file_loader_cls.__qualname__}"
+            )
+            variant["file_loader_kwargs"] = self.file_loader_kwargs
+        return json.dumps(variant, sort_keys=True, default=str)
+
+    def _fetch_files_recursive(
+        self, folder_id: str, username: str, file_types: Optional[Sequence[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Fetch all files under the folder, walking subfolders breadth-first."""
+        return self._folder_walker(username, file_types=file_types).walk(folder_id)
+
+    def _folder_walker(
+        self,
+        username: str,
+        file_types: Optional[Sequence[str]] = None,
+        server_side_filters: bool = True,
+        measure_bytes: bool = False,
+    ) -> FolderWalker:
+        return FolderWalker(
+            lambda: self.create_drive_service(username),
+            recursive=self.recursive,
+            max_workers=self.listing_workers,
+            file_types=file_types,
+            load_trashed_files=self.load_trashed_files,
+            server_side_filters=server_side_filters,
+            execute=lambda request: self._list(request, username),
+            measure_bytes=measure_bytes,
+        )
+
+    def listing_savings(self, username: str) -> Dict[str, Any]:
+        """List `folder_id` with and without server-side filtering and compare.
+
+        Both listings select the same files; the report shows how many pages
+        and (approximate, compact-JSON) payload bytes the server-side `q`
+        filters and field mask save over filtering on the client.
+        """
+        if not self.folder_id:
+            raise ValueError("folder_id must be set")
+
+        report: Dict[str, Any] = {}
+        for mode, server_side_filters in (("server_side", True), ("client_side", False)):
+            walker = self._folder_walker(
+                username,
+                file_types=self.file_types,
+                server_side_filters=server_side_filters,
+                measure_bytes=True,
+            )
+            files = sum(1 for _ in walker.walk(self.folder_id))
+            report[mode] = {"files": files, "pages": walker.pages, "bytes": walker.bytes}
+        report["pages_saved"] = report["client_side"]["pages"] - report["server_side"]["pages"]
+        report["bytes_saved"] = report["client_side"]["bytes"] - report["server_side"]["bytes"]
+        return report
 
     def _load_documents_from_ids(self, username: str) -> List[Document]:
         """Load documents from a list of IDs."""
         if not self.document_ids:
             raise ValueError("document_ids must be set")
 
-        return [self._load_document_from_id(doc_id, username) for doc_id in self.document_ids]
+        return self._load_files(self._with_metadata(self._document_id_files(), username), username)
+
+    def _document_id_files(self) -> List[Dict[str, Any]]:
+        """Describe `document_ids` as file entries for `_iter_files`."""
+        return [
+            {"id": doc_id, "mimeType": "application/vnd.google-apps.document"}
+            for doc_id in self.document_ids or []
+        ]
 
     def _load_file_from_id(self, id: str, username: str) -> List[Document]:
         """Load a file from an ID."""
+        return list(self._lazy_load_file_from_id(id, username))
+
+    def _lazy_load_file_from_id(
+        self, id: str, username: str, file: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Document]:
+        """Download a file and yield its documents (one per page for PDFs).
+
+        Files larger than `pdf_spool_threshold` are downloaded to a temporary
+        file instead of memory; their pages are parsed from a memory map, in
+        a process pool when `pdf_workers` is above 1.
+        """
         from io import BytesIO
         from googleapiclient.http import MediaIoBaseDownload
 
         service = self.create_drive_service(username)
-        file = service.files().get(fileId=id, supportsAllDrives=True).execute()
+        if not file or "name" not in file or "size" not in file:
+            with metrics.timer("ingest_phase_seconds", phase="metadata"):
+                file = self._execute(
+                    service.files().get(fileId=id, supportsAllDrives=True, fields="name, size"),
+                    username,
+                )
         request = service.files().get_media(fileId=id)
-        fh = BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
+        spooled = int(file.get("size") or 0) > self.pdf_spool_threshold
+        fh = tempfile.NamedTemporaryFile(suffix=".download", delete=False) if spooled else BytesIO()
+        try:
+            downloader = MediaIoBaseDownload(fh, request, chunksize=self.download_chunk_size)
+            self._download(downloader, username)
+            fh.flush()
+            yield from self._iter_downloaded_file_documents(id, file, fh, spooled)
+        finally:
+            fh.close()
+            if spooled:
+                os.unlink(fh.name)
 
+    def _iter_downloaded_file_documents(
+        self, id: str, file: Dict[str, Any], fh: Any, spooled: bool
+    ) -> Iterator[Document]:
+        """Parse a downloaded file with `file_loader_cls`, or as a PDF, one document per page."""
         if self.file_loader_cls is not None:
             fh.seek(0)
             loader = self.file_loader_cls(file=fh, **self.file_loader_kwargs)
-            docs = loader.load()
+            with metrics.timer("ingest_phase_seconds", phase="parse"):
+                docs = loader.load()
             for doc in docs:
                 doc.metadata["source"] = f"https://drive.google.com/file/d/{id}/view"
-            return docs
+            yield from docs
+            return
 
+        if spooled:
+            texts = self._extract_spooled_pdf_pages(fh.name)
         else:
+            texts = _extract_pdf_pages(fh, 0, None)
+        texts = metrics.timed_iter(texts, "ingest_phase_seconds", phase="parse")
+        for i, text in enumerate(texts):
+            yield Document(
+                page_content=text,
+                metadata={
+                    "source": f"https://drive.google.com/file/d/{id}/view",
+                    "title": f"{file.get('name')}",
+                    "page": i,
+                },
+            )
+
+    def _extract_spooled_pdf_pages(self, path: str) -> Iterator[str]:
+        """Yield the text of every page of a PDF on disk, in page order."""
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if self.pdf_workers <= 1:
+                yield from _extract_pdf_pages(mm, 0, None)
+                return
             from PyPDF2 import PdfReader
 
-            content = fh.getvalue()
-            pdf_reader = PdfReader(BytesIO(content))
-
-            return [
-                Document(
-                    page_content=page.extract_text(),
-                    metadata={
-                        "source": f"https://drive.google.com/file/d/{id}/view",
-                        "title": f"{file.get('name')}",
-                        "page": i,
-                    },
-                )
-                for i, page in enumerate(pdf_reader.pages)
-            ]
+            page_count = len(PdfReader(mm).pages)
+
+        ranges = [
+            (start, min(start + self.pdf_pages_per_task, page_count))
+            for start in range(0, page_count, self.pdf_pages_per_task)
+        ]
+        executor = _pdf_process_pool(self.pdf_workers)
+        # map() hands results back in submission order, so pages stay ordered.
+        for texts in executor.map(
+            _extract_pdf_page_range, [path] * len(ranges), *zip(*ranges)
+        ):
+            yield from texts
 
     def _load_file_from_ids(self, username) -> List[Document]:
         """Load files from a list of IDs."""
         if not self.file_ids:
             raise ValueError("file_ids must be set")
-        docs = []
-        for file_id in self.file_ids:
-            docs.extend(self._load_file_from_id(file_id, username))
-        return docs
+        return self._load_files(self._with_metadata(self._file_id_files(), username), username)
+
+    def _file_id_files(self) -> List[Dict[str, Any]]:
+        """Describe `file_ids` as file entries for `_iter_files`."""
+        return [{"id": file_id, "mimeType": "application/pdf"} for file_id in self.file_ids or []]
+
+    def lazy_load(self, username: str) -> Iterator[Document]:
+        """Lazily load documents, yielding them as each file finishes."""
+        yield from self._iter_files(self.list_files(username), username)
+
+    def list_files(self, username: str) -> Iterator[Dict[str, Any]]:
+        """Lazily list the file entries `lazy_load` loads, with their metadata."""
+        if self.folder_id:
+            return self._fetch_files_recursive(self.folder_id, username, file_types=self.file_types)
+        elif self.document_ids:
+            return self._with_metadata(self._document_id_files(), username)
+        else:
+            return self._with_metadata(self._file_id_files(), username)
+
+    def load_file(self, file: Dict[str, Any], username: str) -> List[Document]:
+        """Load one entry of `list_files`; a failure is logged and yields no documents."""
+        return self._load_file_documents(file["id"], file["mimeType"], username, file)
+
+    def failed_files(self) -> Set[str]:
+        """Ids of the files whose latest load failed, in whole or in part."""
+        return set(self._failed_file_ids)
 
     def load(self, username: str) -> List[Document]:
         """Load documents."""
@@ -454,22 +1048,471 @@ class GoogleDriveLoader(BaseLoader, BaseModel):
         else:
             return self._load_file_from_ids(username)
 
-    def create_drive_service(self, username, servicename='drive', version='v3'):
-        from google.oauth2 import service_account
-        from googleapiclient.discovery import build
-        # Read the service account JSON file once during application initialization
-        credentials_file = '<PATH>/service_account.json'  # Replace with your JSON file path
-        service_account_json = open(credentials_file, 'r').read()
+    async def alazy_load(self, username: str) -> AsyncIterator[Document]:
+        """Async `lazy_load` over pooled connections instead of googleapiclient.
+
+        Makes the REST calls of the blocking loaders through `AsyncDriveClient`,
+        with up to `async_concurrency` requests and files in flight. A file's
+        documents are yielded together once it is loaded, in completion order
+        rather than listing order. PDFs and `file_loader_cls` files are parsed
+        in worker threads to keep the event loop free.
+        """
+        from asyncDriveClient import AsyncDriveClient
+
+        async with AsyncDriveClient(
+            username,
+            concurrency=self.async_concurrency,
+            http2=self.http2,
+            root_url=self.api_root_url,
+        ) as client:
+            if self.folder_id:
+                walker = self._folder_walker(username, file_types=self.file_types)
+                files = walker.awalk(self.folder_id, lambda params: self._alist(client, params))
+            elif self.document_ids:
+                files = self._awith_metadata(client, self._document_id_files())
+            else:
+                files = self._awith_metadata(client, self._file_id_files())
+            async for doc in self._aiter_files(client, files):
+                yield doc
+
+    async def _aiter_files(
+        self, client: Any, files: AsyncIterable[Dict[str, Any]]
+    ) -> AsyncIterator[Document]:
+        """Async `_iter_files`: load up to `async_concurrency` files at once.
+
+        Documents are yielded file by file as each one finishes.
+        """
+        import asyncio
 
-        credentials = service_account.Credentials.from_service_account_file(
-            '<PATH>/service_account.json')
+        iterator = files.__aiter__()
+        pending: Set["asyncio.Future[List[Document]]"] = set()
+        listed = True
+        try:
+            while True:
+                while listed and len(pending) < self.async_concurrency:
+                    try:
+                        f = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        listed = False
+                        break
+                    self._report("files_listed")
+                    task = self._aload_file_documents(client, f["id"], f["mimeType"], f)
+                    pending.add(asyncio.ensure_future(task))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for doc in task.result():
+                        yield doc
+                    self._report("files_fetched")
+        finally:
+            # The consumer may stop early; don't keep loading files nobody will read.
+            for task in pending:
+                task.cancel()
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def _awith_metadata(
+        self, client: Any, files: List[Dict[str, Any]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Async `_with_metadata`: look up files that only carry an ID, concurrently."""
+        import asyncio
+
+        missing = [f for f in files if revision_marker(f) is None or "name" not in f]
+
+        async def lookup(file: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                return await self._afile_metadata(client, file["id"])
+            except HttpError as e:
+                logger.warning("Metadata lookup failed for %s: %s", file["id"], e)
+                return {}
 
-        credentials = credentials.with_scopes(
-            ['https://www.googleapis.com/auth/drive.metadata.readonly', 'https://www.googleapis.com/auth/drive'])
+        found = await asyncio.gather(*map(lookup, missing))
+        metadata = {f["id"]: m for f, m in zip(missing, found)}
+        for f in files:
+            yield {**metadata.get(f["id"], {}), **f}
 
-        credentials = credentials.with_subject(username)
+    async def _alist(self, client: Any, params: Dict[str, Any]) -> Dict[str, Any]:
+        with metrics.timer("ingest_phase_seconds", phase="listing"):
+            return await client.get_json("drive", "files", params, "drive.files.list")
 
-        # Create a Google Drive service using the credentials
-        drive_service = build(servicename, version, credentials=credentials)
+    async def _afile_metadata(
+        self, client: Any, id: str, fields: str = FILE_METADATA_FIELDS
+    ) -> Dict[str, Any]:
+        params = {"supportsAllDrives": True, "fields": fields}
+        with metrics.timer("ingest_phase_seconds", phase="metadata"):
+            return await client.get_json("drive", f"files/{id}", params, "drive.files.get")
 
-        return drive_service
+    async def _aload_file_documents(
+        self, client: Any, id: str, mime_type: str, file: Dict[str, Any]
+    ) -> List[Document]:
+        """Async `_load_file_documents`: a failure is logged and drops the whole file."""
+        start = time.perf_counter()
+        try:
+            docs = await self._afetch_file_documents(client, id, mime_type, file)
+        except Exception:
+            logger.exception("Failed to load file %s (%s)", id, mime_type)
+            self._failed_file_ids.add(id)
+            return []
+        metrics.observe("ingest_file_seconds", time.perf_counter() - start, mime_type=mime_type)
+        metrics.inc("ingest_items_total", len(docs), kind="documents")
+        metrics.inc("ingest_items_total", kind="files")
+        return docs
+
+    async def _afetch_file_documents(
+        self, client: Any, id: str, mime_type: str, file: Dict[str, Any]
+    ) -> List[Document]:
+        """Async `_fetch_file_documents`, serving unchanged revisions from the content cache."""
+        self._failed_file_ids.discard(id)
+        cache = self._content_cache()
+        revision = revision_marker(file)
+        if cache is not None and revision is None:
+            revision = revision_marker(await self._afile_metadata(client, id))
+        if cache is not None and revision is not None:
+            cached = cache.get(id, revision, self._cache_variant())
+            if cached is not None:
+                return cached
+
+        if mime_type == "application/vnd.google-apps.document":
+            docs = [await self._aload_document(client, id, file)]
+        elif mime_type == "application/vnd.google-apps.spreadsheet":
+            docs = await self._aload_sheet(client, id)
+        elif mime_type == "application/vnd.google-apps.presentation":
+            docs = await self._aload_slides(client, id)
+        elif mime_type == "application/pdf" or self.file_loader_cls is not None:
+            docs = await self._aload_file(client, id, file)
+        else:
+            logger.debug("Ignoring %s with unsupported MIME type %s", id, mime_type)
+            return []
+
+        for doc in docs:
+            doc.metadata["file_id"] = id
+            if revision is not None:
+                doc.metadata["revision"] = revision
+        # Loaders log some errors and return nothing or part of the file; don't pin that.
+        if (
+            cache is not None
+            and revision
+            and any(d.page_content for d in docs)
+            and id not in self._failed_file_ids
+        ):
+            cache.put(id, revision, docs, self._cache_variant())
+        return docs
+
+    async def _aload_document(self, client: Any, id: str, file: Dict[str, Any]) -> Document:
+        """Async `_load_document_from_id`."""
+        from io import BytesIO
+
+        if "name" not in file or "modifiedTime" not in file:
+            file = await self._afile_metadata(client, id, "modifiedTime,name")
+        fh = BytesIO()
+        try:
+            await self._adownload(
+                client, f"files/{id}/export", {"mimeType": "text/plain"}, fh, "drive.files.export"
+            )
+        except HttpError as e:
+            if e.resp.status == 404:
+                self._file_failed(id, "File not found: %s", id)
+            else:
+                self._file_failed(id, "Failed to export document %s: %s", id, e)
+        with metrics.timer("ingest_phase_seconds", phase="parse"):
+            text = fh.getvalue().decode("utf-8")
+        return _document_from_text(id, file, text)
+
+    async def _aload_sheet(self, client: Any, id: str) -> List[Document]:
+        """Async `_lazy_load_sheet_from_id`; the file's documents are collected in memory."""
+        try:
+            spreadsheet = await client.get_json(
+                "sheets",
+                f"spreadsheets/{id}",
+                {"fields": SPREADSHEET_FIELDS},
+                "sheets.spreadsheets.get",
+            )
+        except HttpError as e:
+            self._file_failed(id, "Failed to load spreadsheet %s: %s", id, e)
+            return []
+
+        title = spreadsheet["properties"]["title"]
+        docs: List[Document] = []
+        for batch in self._sheet_batches([s["properties"] for s in spreadsheet.get("sheets", [])]):
+            if len(batch) == 1 and _sheet_row_count(batch[0]) > self.sheet_chunk_rows:
+                docs.extend(await self._aload_large_sheet(client, id, title, batch[0]))
+                continue
+            try:
+                result = await client.get_json(
+                    "sheets",
+                    f"spreadsheets/{id}/values:batchGet",
+                    {"ranges": [_sheet_range(p["title"]) for p in batch]},
+                    "sheets.spreadsheets.values.batchGet",
+                )
+            except HttpError as e:
+                self._file_failed(
+                    id, "Failed to load tabs %s of spreadsheet %s: %s", [p["title"] for p in batch], id, e
+                )
+                continue
+            with metrics.timer("ingest_phase_seconds", phase="parse"):
+                for properties, value_range in zip(batch, result.get("valueRanges", [])):
+                    values = value_range.get("values", [])
+                    if not values:
+                        continue  # empty sheet
+                    docs.extend(
+                        self._sheet_documents(
+                            id, title, properties, values[0], enumerate(values[1:], start=1)
+                        )
+                    )
+        return docs
+
+    async def _aload_large_sheet(
+        self, client: Any, id: str, title: str, properties: Dict[str, Any]
+    ) -> List[Document]:
+        """Async `_lazy_load_large_sheet`: read the tab `sheet_chunk_rows` rows at a time."""
+        rows: List[Tuple[int, List[str]]] = []
+        row_count = _sheet_row_count(properties)
+        for start in range(1, row_count + 1, self.sheet_chunk_rows):
+            end = min(start + self.sheet_chunk_rows - 1, row_count)
+            a1 = f"{_sheet_range(properties['title'])}!{start}:{end}"
+            try:
+                result = await client.get_json(
+                    "sheets",
+                    f"spreadsheets/{id}/values/{quote(a1, safe='')}",
+                    None,
+                    "sheets.spreadsheets.values.get",
+                )
+            except HttpError as e:
+                self._file_failed(
+                    id, "Failed to load tab %r of spreadsheet %s: %s", properties["title"], id, e
+                )
+                break
+            # Sheet row numbers are 1-based; document row indices count from the header.
+            rows.extend(enumerate(result.get("values", []), start=start - 1))
+        if not rows:
+            return []  # empty sheet
+        (_, header), rows = rows[0], rows[1:]
+        with metrics.timer("ingest_phase_seconds", phase="parse"):
+            return list(self._sheet_documents(id, title, properties, header, rows))
+
+    async def _aload_slides(self, client: Any, id: str) -> List[Document]:
+        """Async `_load_slide_from_id`."""
+        try:
+            presentation = await client.get_json(
+                "slides",
+                f"presentations/{id}",
+                {"fields": PRESENTATION_FIELDS},
+                "slides.presentations.get",
+            )
+        except HttpError as e:
+            self._file_failed(id, "Failed to load presentation %s: %s", id, e)
+            return []
+        with metrics.timer("ingest_phase_seconds", phase="parse"):
+            return _slide_documents(id, presentation)
+
+    async def _aload_file(self, client: Any, id: str, file: Dict[str, Any]) -> List[Document]:
+        """Async `_lazy_load_file_from_id`; parsing runs in a worker thread."""
+        import asyncio
+        from io import BytesIO
+
+        if "name" not in file or "size" not in file:
+            file = await self._afile_metadata(client, id, "name, size")
+        spooled = int(file.get("size") or 0) > self.pdf_spool_threshold
+        fh = tempfile.NamedTemporaryFile(suffix=".download", delete=False) if spooled else BytesIO()
+        try:
+            await self._adownload(
+                client, f"files/{id}", {"alt": "media"}, fh, "drive.files.get_media"
+            )
+            fh.flush()
+            return await asyncio.to_thread(
+                lambda: list(self._iter_downloaded_file_documents(id, file, fh, spooled))
+            )
+        finally:
+            fh.close()
+            if spooled:
+                os.unlink(fh.name)
+
+    async def _adownload(
+        self, client: Any, path: str, params: Dict[str, Any], fh: Any, method: str
+    ) -> None:
+        with metrics.timer("ingest_phase_seconds", phase="download"):
+            size = await client.download("drive", path, params, fh, method)
+        metrics.inc("ingest_bytes_total", size, kind="downloaded")
+
+    def load_changes(
+        self, username: str, cursor_store: Optional[ChangeCursorStore] = None
+    ) -> ChangeSet:
+        """Load only what changed in the user's Drive since the last sync.
+
+        Without a stored cursor this falls back to a full load, whose
+        `documents` are streamed like `lazy_load`; see `ChangeSet`. Otherwise
+        files that fail to load are reported in `ChangeSet.failed_file_ids`
+        rather than as changed, and none of their documents are returned. The returned
+        `new_start_page_token` and `folder_ids` should be saved to the cursor
+        store once the changes have been applied, and only when no file
+        failed, so the next sync retries them.
+        """
+        cursor_store = cursor_store or ChangeCursorStore()
+        service = self.create_drive_service(username)
+        page_token = cursor_store.get(username)
+        scope_folder_ids = self._scope_folder_ids(username)
+        folder_ids = sorted(scope_folder_ids) if scope_folder_ids is not None else None
+        if page_token is None:
+            start = self._execute(
+                service.changes().getStartPageToken(supportsAllDrives=True), username
+            )
+            failed_file_ids: List[str] = []
+            documents = self._iter_files_checked(self.list_files(username), username, failed_file_ids)
+            return ChangeSet(
+                documents=documents,
+                failed_file_ids=failed_file_ids,
+                new_start_page_token=start["startPageToken"],
+                folder_ids=folder_ids,
+                full_sync=True,
+            )
+
+        # Only the latest change per file matters.
+        latest: Dict[str, Dict[str, Any]] = {}
+        new_start_page_token = None
+        while page_token:
+            response = self._execute(
+                service.changes()
+                .list(
+                    pageToken=page_token,
+                    pageSize=1000,
+                    spaces="drive",
+                    includeRemoved=True,
+                    includeItemsFromAllDrives=True,
+                    supportsAllDrives=True,
+                    fields=(
+                        "nextPageToken, newStartPageToken, "
+                        "changes(fileId, removed, "
+                        "file(id, name, mimeType, trashed, parents, modifiedTime, version, md5Checksum, size))"
+                    ),
+                ),
+                username,
+            )
+            for change in response.get("changes", []):
+                latest[change["fileId"]] = change
+            new_start_page_token = response.get("newStartPageToken", new_start_page_token)
+            page_token = response.get("nextPageToken")
+
+        in_scope = self._change_scope(scope_folder_ids)
+        changed_files: Dict[str, Dict[str, Any]] = {}
+        deleted_file_ids: Dict[str, None] = {}
+        changed_folder_ids = []
+        for file_id, change in latest.items():
+            file = change.get("file") or {}
+            if file.get("mimeType") == FOLDER_MIME_TYPE:
+                changed_folder_ids.append(file_id)
+                continue
+            if (
+                change.get("removed")
+                or (file.get("trashed") and not self.load_trashed_files)
+                or not in_scope(file)
+            ):
+                # Pruning a file that was never indexed is harmless.
+                deleted_file_ids[file_id] = None
+            elif not self.file_types or file["mimeType"] in self.file_types:
+                changed_files[file_id] = file
+
+        # Files below a folder that was moved or trashed get no change of their
+        # own; a change reported for the file itself takes precedence.
+        moved_in, moved_out = self._moved_folders(
+            scope_folder_ids, cursor_store.get_folder_ids(username), changed_folder_ids
+        )
+        for file in self._walk_folders(moved_out, username, include_trashed=True):
+            if file["id"] not in latest:
+                deleted_file_ids[file["id"]] = None
+        for file in self._walk_folders(moved_in, username):
+            if file["id"] not in latest:
+                deleted_file_ids.pop(file["id"], None)
+                changed_files[file["id"]] = file
+
+        documents, failed_file_ids = self._load_files_checked(list(changed_files.values()), username)
+        failed = set(failed_file_ids)
+        return ChangeSet(
+            documents=documents,
+            changed_file_ids=[id for id in changed_files if id not in failed],
+            deleted_file_ids=list(deleted_file_ids),
+            failed_file_ids=failed_file_ids,
+            new_start_page_token=new_start_page_token,
+            folder_ids=folder_ids,
+        )
+
+    def _scope_folder_ids(self, username: str) -> Optional[Set[str]]:
+        """Return the folders whose files this loader covers; None when it lists ids."""
+        if not self.folder_id:
+            return None
+
+        folder_id = self.folder_id
+        if folder_id == "root":
+            # Changes report the real ID of the root folder, not the alias.
+            service = self.create_drive_service(username)
+            folder_id = self._execute(service.files().get(fileId="root", fields="id"), username)["id"]
+        return self._folder_walker(username).folder_ids(folder_id)
+
+    def _change_scope(self, folder_ids: Optional[Set[str]]) -> Callable[[Dict[str, Any]], bool]:
+        """Return a predicate telling whether a changed file belongs to this loader."""
+        if folder_ids is None:
+            ids = set(self.document_ids or []) | set(self.file_ids or [])
+            return lambda file: file.get("id") in ids
+        return lambda file: bool(folder_ids.intersection(file.get("parents", [])))
+
+    @staticmethod
+    def _moved_folders(
+        folder_ids: Optional[Set[str]],
+        previous_folder_ids: Optional[Set[str]],
+        changed_folder_ids: List[str],
+    ) -> Tuple[List[str], List[str]]:
+        """Return the folders that entered and that left the scope since the last sync.
+
+        Without a recorded scope, every changed folder in scope is treated as
+        having entered it, and folders that left it can't be told apart.
+        """
+        if folder_ids is None:
+            return [], []
+        if previous_folder_ids is None:
+            return [id for id in changed_folder_ids if id in folder_ids], []
+        return sorted(folder_ids - previous_folder_ids), sorted(previous_folder_ids - folder_ids)
+
+    def _walk_folders(
+        self, folder_ids: List[str], username: str, include_trashed: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """List the files directly inside each folder; subfolders are listed in `folder_ids`."""
+        if not folder_ids:
+            return
+        walker = FolderWalker(
+            lambda: self.create_drive_service(username),
+            max_workers=self.listing_workers,
+            file_types=self.file_types,
+            load_trashed_files=include_trashed or self.load_trashed_files,
+            execute=lambda request: self._list(request, username),
+        )
+        for folder_id in folder_ids:
+            yield from walker.walk(folder_id)
+
+    def _list(self, request: Any, username: str) -> Any:
+        with metrics.timer("ingest_phase_seconds", phase="listing"):
+            return self._execute(request, username)
+
+    def _execute(self, request: Any, username: str) -> Any:
+        """Run an API request through the shared rate-limited, retrying executor."""
+        return request_executor.execute(request, username)
+
+    def _execute_batch(
+        self, service: Any, requests: Dict[str, Any], username: str
+    ) -> Dict[str, Tuple[Any, Optional[Exception]]]:
+        """Run requests as one HTTP batch, retrying throttled sub-requests; see `execute_batch`."""
+        return request_executor.execute_batch(service.new_batch_http_request, requests, username)
+
+    def _download(self, downloader: Any, username: str) -> None:
+        """Fetch every chunk of a media download through the shared executor."""
+        done = False
+        status = None
+        with metrics.timer("ingest_phase_seconds", phase="download"):
+            while done is False:
+                status, done = request_executor.next_chunk(downloader, username)
+        if status is not None:
+            metrics.inc("ingest_bytes_total", status.resumable_progress, kind="downloaded")
+
+    def create_drive_service(self, username, servicename='drive', version='v3'):
+        """Return a pooled service client impersonating the given user."""
+        return service_pool.get(username, servicename, version)
@@ -0,0 +1,192 @@
+"""Background ingestion jobs with progress reporting and cancellation.
+
+`JobQueue` is the interface the Flask app talks to. `InProcessJobQueue` is
+the local implementation: a thread pool inside the web process. A
+deployment that needs jobs to outlive the process can provide a distributed
+queue with the same interface.
+"""
+
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancellation has been requested."""
+
+
+class JobProgress:
+    """Per-phase progress counters handed to the code a job runs.
+
+    Every `advance` call is also a cancellation point, so long-running loops
+    stop at the next file or chunk once the job is cancelled.
+    """
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = {}
+        self.phase: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def advance(self, phase: str, n: int = 1) -> None:
+        """Add `n` to the phase's counter; raises `JobCancelled` if cancelled."""
+        self.check_cancelled()
+        with self._lock:
+            self.phase = phase
+            self.counters[phase] = self.counters.get(phase, 0) + n
+
+    def check_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"phase": self.phase, **self.counters}
+
+
+class Job:
+    """State of one submitted ingestion."""
+
+    def __init__(self, username: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.username = username
+        self.status = QUEUED
+        self.progress = JobProgress()
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "username": self.username,
+            "status": self.status,
+            "progress": self.progress.snapshot(),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue(ABC):
+    """Interface of an ingestion job queue."""
+
+    @abstractmethod
+    def submit(self, username: str, fn: Callable[[JobProgress], Any]) -> Tuple[Job, bool]:
+        """Queue `fn` for the user; returns the job and whether it was newly created.
+
+        While a job for the same user is queued or running, that job is
+        returned instead of starting a concurrent one.
+        """
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job, or None when it is unknown."""
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Request cancellation of the job; returns None when it is unknown."""
+
+    @abstractmethod
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Block until the job has finished or `timeout` seconds have passed.
+
+        Returns the job, whatever its status; None when it is unknown.
+        """
+
+
+class InProcessJobQueue(JobQueue):
+    """Run jobs on a thread pool in the current process."""
+
+    def __init__(self, max_workers: int = 2, max_finished: int = 1000) -> None:
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}
+
+    def submit(self, username: str, fn: Callable[[JobProgress], Any]) -> Tuple[Job, bool]:
+        with self._lock:
+            job = self._active.get(username)
+            if job is not None and job.status in ACTIVE_STATUSES:
+                return job, False
+            job = Job(username)
+            self._jobs[job.id] = job
+            self._active[username] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.progress.cancel()
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+        return job
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[JobProgress], Any]) -> None:
+        with self._lock:
+            if job.status != QUEUED:
+                return  # cancelled while queued
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            job.progress.check_cancelled()
+            result = fn(job.progress)
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            status = FAILED
+        else:
+            job.result = result
+            status = SUCCEEDED
+        with self._lock:
+            self._finish(job, status)
+
+    def _finish(self, job: Job, status: str) -> None:
+        """Record the final status; caller holds the lock."""
+        job.status = status
+        job.finished_at = time.time()
+        job.done.set()
+        if self._active.get(job.username) is job:
+            del self._active[job.username]
+
+    def _trim(self) -> None:
+        """Forget the oldest finished jobs beyond `max_finished`; caller holds the lock."""
+        finished = [j for j in self._jobs.values() if j.status not in ACTIVE_STATUSES]
+        for job in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
@@ -0,0 +1,237 @@
+"""Streaming split → embed → index pipeline for Chroma stores.
+
+Documents are consumed lazily (e.g. from `GoogleDriveLoader.lazy_load`), so
+downloading, splitting, embedding and writing overlap instead of running one
+after another over the whole corpus. Stages are connected by bounded queues:
+a slow embedding backend back-pressures the crawl rather than letting parsed
+documents pile up in memory.
+
+    source thread     documents → queue
+    split thread      split, assign chunk ids, group into micro-batches → queue
+    embed workers     embed each micro-batch → queue
+    calling thread    upsert each embedded batch into the Chroma collection
+
+The first error in any stage stops every stage and is re-raised by `run`.
+Async sources such as `GoogleDriveLoader.alazy_load` run on an event loop
+in the source thread.
+"""
+
+import queue
+import threading
+from typing import TYPE_CHECKING, Any, AsyncIterable, Dict, Iterable, List, Optional, Tuple, Union
+
+from metrics import metrics
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from langchain.text_splitter import TextSplitter
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Raised inside a stage once another stage has failed."""
+
+
+def chunk_ids(splits: List["Document"], counters: Optional[Dict[str, int]] = None) -> List[str]:
+    """Stable chunk ids: "<fileId>:<revision>:<chunk index>" for Drive files.
+
+    Re-indexing an unchanged file upserts the same ids instead of appending
+    duplicates, and a file's chunk 0 id tells whether a revision is indexed.
+    Other documents fall back to their source and page. Pass the same
+    `counters` for every call of one ingest so files split across several
+    documents (e.g. sheet rows) keep counting up.
+    """
+    counters = {} if counters is None else counters
+    ids = []
+    for split in splits:
+        metadata = split.metadata
+        if "file_id" in metadata:
+            key = f"{metadata['file_id']}:{metadata.get('revision', '')}"
+        else:
+            key = f"{metadata.get('source', '')}:{metadata.get('page', metadata.get('row', ''))}"
+        index = counters.get(key, 0)
+        counters[key] = index + 1
+        ids.append(f"{key}:{index}")
+    return ids
+
+
+class IngestionPipeline:
+    """Index a stream of documents into a Chroma store with overlapping stages."""
+
+    def __init__(
+        self,
+        vectordb: Any,
+        text_splitter: Optional["TextSplitter"] = None,
+        embed_batch_size: int = 64,
+        embed_workers: int = 2,
+        queue_size: int = 8,
+    ) -> None:
+        self.vectordb = vectordb
+        if text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=150)
+        self.text_splitter = text_splitter
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = embed_workers
+        # Bound of each inter-stage queue, in documents or micro-batches.
+        self.queue_size = queue_size
+
+    def run(
+        self,
+        documents: Union[Iterable["Document"], AsyncIterable["Document"]],
+        progress: Any = None,
+    ) -> Dict[str, int]:
+        """Split, embed and upsert `documents`; returns document and chunk counts.
+
+        `progress`, if given, is advanced with "chunks_embedded" and
+        "chunks_indexed"; raising from `advance` cancels the run.
+        """
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+        self._progress = progress
+        self._counts = {"documents": 0, "chunks": 0}
+        document_queue: "queue.Queue[Any]" = queue.Queue(self.queue_size)
+        batch_queue: "queue.Queue[Any]" = queue.Queue(self.queue_size)
+        embedded_queue: "queue.Queue[Any]" = queue.Queue(self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._stage, args=(self._read, documents, document_queue)),
+            threading.Thread(target=self._stage, args=(self._split, document_queue, batch_queue)),
+        ]
+        threads += [
+            threading.Thread(target=self._stage, args=(self._embed, batch_queue, embedded_queue))
+            for _ in range(self.embed_workers)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            self._stage(self._index, embedded_queue)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._counts
+
+    def _stage(self, fn: Any, *args: Any) -> None:
+        try:
+            fn(*args)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            with self._error_lock:
+                if self._error is None:
+                    self._error = e
+            self._stop.set()
+
+    def _read(self, documents: Any, out: "queue.Queue[Any]") -> None:
+        if hasattr(documents, "__aiter__"):
+            import asyncio
+
+            asyncio.run(self._aread(documents, out))
+            self._put(out, _DONE)
+            return
+        iterator = iter(documents)
+        try:
+            for document in iterator:
+                self._put(out, document)
+                self._counts["documents"] += 1
+        finally:
+            # Let generators such as `lazy_load` cancel their in-flight downloads.
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        self._put(out, _DONE)
+
+    async def _aread(self, documents: AsyncIterable["Document"], out: "queue.Queue[Any]") -> None:
+        import asyncio
+
+        iterator = documents.__aiter__()
+        try:
+            async for document in iterator:
+                try:
+                    out.put_nowait(document)
+                except queue.Full:
+                    # Wait for room off the loop so in-flight requests keep going.
+                    await asyncio.to_thread(self._put, out, document)
+                self._counts["documents"] += 1
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _split(self, source: "queue.Queue[Any]", out: "queue.Queue[Any]") -> None:
+        counters: Dict[str, int] = {}
+        batch: List[Tuple[str, "Document"]] = []
+        while True:
+            document = self._get(source)
+            if document is _DONE:
+                break
+            with metrics.timer("ingest_phase_seconds", phase="split"):
+                splits = self.text_splitter.split_documents([document])
+            batch.extend(zip(chunk_ids(splits, counters), splits))
+            while len(batch) >= self.embed_batch_size:
+                self._put(out, batch[:self.embed_batch_size])
+                batch = batch[self.embed_batch_size:]
+        if batch:
+            self._put(out, batch)
+        for _ in range(self.embed_workers):
+            self._put(out, _DONE)
+
+    def _embed(self, source: "queue.Queue[Any]", out: "queue.Queue[Any]") -> None:
+        embedding = self.vectordb._embedding_function
+        while True:
+            batch = self._get(source)
+            if batch is _DONE:
+                break
+            with metrics.timer("ingest_phase_seconds", phase="embed"):
+                vectors = embedding.embed_documents([split.page_content for _, split in batch])
+            if self._progress is not None:
+                self._progress.advance("chunks_embedded", len(batch))
+            self._put(out, (batch, vectors))
+        self._put(out, _DONE)
+
+    def _index(self, source: "queue.Queue[Any]") -> None:
+        remaining = self.embed_workers
+        while remaining:
+            item = self._get(source)
+            if item is _DONE:
+                remaining -= 1
+                continue
+            batch, vectors = item
+            # Ids are unique per ingest, so upserting batch by batch is idempotent.
+            with metrics.timer("ingest_phase_seconds", phase="index"):
+                self.vectordb._collection.upsert(
+                    ids=[chunk_id for chunk_id, _ in batch],
+                    embeddings=vectors,
+                    metadatas=[split.metadata for _, split in batch],
+                    documents=[split.page_content for _, split in batch],
+                )
+            self._counts["chunks"] += len(batch)
+            metrics.inc("ingest_items_total", len(batch), kind="chunks")
+            if self._progress is not None:
+                self._progress.advance("chunks_indexed", len(batch))
+
+    def _put(self, q: "queue.Queue[Any]", item: Any) -> None:
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _get(self, q: "queue.Queue[Any]") -> Any:
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,158 @@
+"""Process-wide ingestion metrics rendered in the Prometheus text format.
+
+Timings are histograms labelled by phase (listing, metadata, download,
+parse, split, embed, index), per file and per Google API method. Counters
+track bytes, items and API calls by method and response status. Everything
+lives in the `metrics` registry and is served by the `/metrics` endpoint.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int) -> None:
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+
+    def describe(self, name: str, kind: str, help: str) -> None:
+        """Declare a metric's type (`counter`, `gauge` or `histogram`) and help text."""
+        with self._lock:
+            self._help[name] = (kind, help)
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            values = self._values.setdefault(name, {})
+            values[key] = values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values.setdefault(name, {})[_label_key(labels)] = float(value)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = _Histogram(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram.counts[i] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe the wall-clock duration of the `with` block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed_iter(self, iterable: Iterable[Any], name: str, **labels: Any) -> Iterator[Any]:
+        """Yield from `iterable`, observing only the time spent producing items.
+
+        Time the consumer spends between items is not counted, so a lazy
+        parser is timed on its own work.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.observe(name, elapsed, **labels)
+
+    def value(self, name: str, **labels: Any) -> float:
+        """Return a counter or gauge value (0 if never set)."""
+        with self._lock:
+            return self._values.get(name, {}).get(_label_key(labels), 0.0)
+
+    def reset(self) -> None:
+        """Drop every recorded value, keeping declarations."""
+        with self._lock:
+            self._values.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(set(self._values) | set(self._histograms)):
+                kind, help = self._help.get(
+                    name, ("histogram" if name in self._histograms else "untyped", "")
+                )
+                if help:
+                    lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                for key, histogram in sorted(self._histograms.get(name, {}).items()):
+                    for bound, count in zip(self.buckets, histogram.counts):
+                        le = key + (("le", _format_value(bound)),)
+                        lines.append(f"{name}_bucket{_format_labels(le)} {count}")
+                    inf = key + (("le", "+Inf"),)
+                    lines.append(f"{name}_bucket{_format_labels(inf)} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+metrics = MetricsRegistry()
+"""Process-wide registry shared by the loader, the pipeline and the API executor."""
+
+metrics.describe("ingest_phase_seconds", "histogram", "Time spent per ingestion phase.")
+metrics.describe("ingest_file_seconds", "histogram", "Time to fetch and parse one file, by MIME type.")
+metrics.describe("ingest_items_total", "counter", "Items processed, by kind (files, documents, chunks).")
+metrics.describe("ingest_bytes_total", "counter", "Bytes processed, by kind.")
+metrics.describe("google_api_calls_total", "counter", "Google API call attempts by method and status.")
+metrics.describe("google_api_call_seconds", "histogram", "Google API call latency by method.")
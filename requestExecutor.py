@@ -0,0 +1,382 @@
+"""Central executor for Google API calls: rate limiting, retries and backoff.
+
+Every `.execute()` and `next_chunk()` issued by the loader goes through
+`request_executor`. Calls first take a token from the per-project and the
+per-user bucket of the API being called, then a slot from an AIMD-controlled
+concurrency limit. Throttling (`429`, `403 rateLimitExceeded`) and transient
+server errors (`5xx`) are retried with exponential backoff and full jitter,
+honouring `Retry-After` when the server sends one; throttling also halves the
+concurrency limit, which then grows back by one slot per round of successes.
+Every attempt is counted and timed in `metrics` by API method and status.
+`acall` applies the same buckets and retry policy to coroutines.
+
+`execute_batch` sends HTTP batches. The API charges quota per sub-request, so
+a batch takes one token per sub-request. Sub-requests that are throttled or
+fail transiently are retried in a new batch with the same backoff.
+"""
+
+import email.utils
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Default quotas in requests per second, per Google Cloud project and per user.
+DEFAULT_QUOTAS: Dict[str, Dict[str, float]] = {
+    "drive": {"project": 200.0, "user": 200.0},
+    "sheets": {"project": 5.0, "user": 1.0},
+    "slides": {"project": 50.0, "user": 10.0},
+}
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+
+
+class TokenBucket:
+    """Classic token bucket; `acquire` blocks until a token is available."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take `tokens` if they are available; otherwise return the seconds until they are.
+
+        Asking for more than `capacity` waits for a full bucket and leaves it
+        in debt, so the long-run rate still holds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            needed = min(tokens, self.capacity)
+            if self._tokens >= needed:
+                self._tokens -= tokens
+                return 0.0
+            return (needed - self._tokens) / self.rate
+
+
+class AdaptiveConcurrencyLimit:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(self, initial: int = 16, minimum: int = 1, maximum: int = 64) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def throttle(self) -> None:
+        """Halve the limit without releasing a slot, e.g. for throttled batch sub-requests."""
+        with self._condition:
+            self.limit = max(float(self.minimum), self.limit / 2)
+
+    def release(self, throttled: bool) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(float(self.minimum), self.limit / 2)
+            else:
+                # +1 slot once a full window of calls has succeeded.
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class RequestExecutor:
+    """Run Google API calls under shared rate limits, retrying what is retryable."""
+
+    def __init__(
+        self,
+        quotas: Optional[Dict[str, Dict[str, float]]] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 64.0,
+        initial_concurrency: int = 16,
+        max_concurrency: int = 64,
+    ) -> None:
+        self.quotas = quotas or DEFAULT_QUOTAS
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = AdaptiveConcurrencyLimit(initial_concurrency, 1, max_concurrency)
+        self.retries = 0
+        self.throttled = 0
+        self._buckets: Dict[Tuple[str, Optional[str]], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def execute(self, request: Any, username: Optional[str] = None) -> Any:
+        """Execute a googleapiclient `HttpRequest` with retries.
+
+        A batch passed here costs one token and only fails or retries as a
+        whole; use `execute_batch` for batches.
+        """
+        return self.call(request.execute, _api_name(request), username, _method_name(request))
+
+    def execute_batch(
+        self,
+        new_batch: Callable[..., Any],
+        requests: Dict[str, Any],
+        username: Optional[str] = None,
+    ) -> Dict[str, Tuple[Any, Optional[Exception]]]:
+        """Execute `requests` in one HTTP batch, re-sending sub-requests that can be retried.
+
+        `new_batch(callback=...)` returns an empty `BatchHttpRequest`, such as
+        `service.new_batch_http_request`. Every round costs one token per
+        sub-request. Sub-requests that are throttled or fail transiently go
+        into the next round, after the backoff `call` would apply. Returns
+        `(response, error)` per request id; `error` is None on success.
+        """
+        results: Dict[str, Tuple[Any, Optional[Exception]]] = {}
+        pending = dict(requests)
+        api = _api_name(next(iter(requests.values()), None))
+        attempt = 0
+        while pending:
+            failures: Dict[str, Exception] = {}
+
+            def callback(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+                if exception is None:
+                    results[request_id] = (response, None)
+                    failures.pop(request_id, None)
+                else:
+                    failures[request_id] = exception
+
+            batch = new_batch(callback=callback)
+            for request_id, request in pending.items():
+                batch.add(request, request_id=request_id)
+            self.call(batch.execute, api, username, "batch", cost=len(pending))
+
+            pending = {}
+            retries: List[Tuple[bool, Optional[float]]] = []
+            for request_id, error in failures.items():
+                try:
+                    outcome, throttled, delay = self._failure(error, attempt)
+                except Exception:
+                    results[request_id] = (None, error)
+                    continue
+                metrics.inc(
+                    "google_api_calls_total", method=_method_name(requests[request_id]), status=outcome
+                )
+                pending[request_id] = requests[request_id]
+                retries.append((throttled, delay))
+            if not pending:
+                break
+
+            throttled = any(t for t, _ in retries)
+            if throttled:
+                self.concurrency.throttle()
+            delays = [d for _, d in retries if d is not None]
+            time.sleep(self._backoff(api, attempt, throttled, max(delays) if delays else None))
+            attempt += 1
+        return results
+
+    def next_chunk(self, downloader: Any, username: Optional[str] = None) -> Any:
+        """Fetch the next chunk of a `MediaIoBaseDownload` with retries.
+
+        A failed chunk leaves the downloader's progress untouched, so retrying
+        resumes where it stopped.
+        """
+        request = getattr(downloader, "_request", None)
+        return self.call(downloader.next_chunk, _api_name(request), username, _method_name(request))
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        api: str = "drive",
+        username: Optional[str] = None,
+        method: Optional[str] = None,
+        cost: int = 1,
+    ) -> Any:
+        """Call `fn` under the API's rate limits, retrying throttled or transient failures.
+
+        `cost` is the number of quota units (tokens) one attempt uses.
+        """
+        method = method or api
+        attempt = 0
+        while True:
+            self._bucket(api, None).acquire(cost)
+            if username:
+                self._bucket(api, username).acquire(cost)
+            self.concurrency.acquire()
+            throttled = False
+            outcome = "error"
+            start = time.perf_counter()
+            try:
+                result = fn()
+                outcome = "ok"
+                return result
+            except Exception as e:
+                outcome, throttled, delay = self._failure(e, attempt)
+            finally:
+                self.concurrency.release(throttled)
+                metrics.observe("google_api_call_seconds", time.perf_counter() - start, method=method)
+                metrics.inc("google_api_calls_total", method=method, status=outcome)
+
+            time.sleep(self._backoff(api, attempt, throttled, delay))
+            attempt += 1
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        api: str = "drive",
+        username: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> Any:
+        """Await `fn()` under the API's rate limits with the retry policy of `call`.
+
+        The adaptive concurrency limit blocks threads, so it is not applied
+        here; async callers bound their own concurrency.
+        """
+        import asyncio
+
+        method = method or api
+        attempt = 0
+        while True:
+            await _acquire(self._bucket(api, None))
+            if username:
+                await _acquire(self._bucket(api, username))
+            throttled = False
+            outcome = "error"
+            start = time.perf_counter()
+            try:
+                result = await fn()
+                outcome = "ok"
+                return result
+            except Exception as e:
+                outcome, throttled, delay = self._failure(e, attempt)
+            finally:
+                metrics.observe("google_api_call_seconds", time.perf_counter() - start, method=method)
+                metrics.inc("google_api_calls_total", method=method, status=outcome)
+
+            await asyncio.sleep(self._backoff(api, attempt, throttled, delay))
+            attempt += 1
+
+    def _failure(self, error: Exception, attempt: int) -> Tuple[str, bool, Optional[float]]:
+        """Classify a failed attempt as (outcome, throttled, Retry-After delay).
+
+        Re-raises `error` when it is not retryable or retries are exhausted.
+        """
+        if isinstance(error, HttpError):
+            status = error.resp.status if error.resp is not None else None
+            throttled = status == 429 or (
+                status == 403 and bool(_error_reasons(error) & RATE_LIMIT_REASONS)
+            )
+            if attempt >= self.max_retries or not (throttled or status in RETRYABLE_STATUSES):
+                raise error
+            return str(status), throttled, _retry_after(error)
+        if isinstance(error, (socket.timeout, ConnectionError)):
+            if attempt >= self.max_retries:
+                raise error
+            logger.debug("Transient network error: %s", error)
+            return "network_error", False, None
+        raise error
+
+    def _backoff(self, api: str, attempt: int, throttled: bool, delay: Optional[float]) -> float:
+        """Count a retry and return how long to wait before it."""
+        with self._lock:
+            self.retries += 1
+            self.throttled += int(throttled)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        logger.info("Retrying %s call in %.1fs (attempt %d)", api, delay, attempt + 1)
+        return delay
+
+    def stats(self) -> Dict[str, float]:
+        """Return retry counters and the current concurrency limit."""
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "concurrency_limit": self.concurrency.limit,
+                "in_flight": self.concurrency.in_flight,
+            }
+
+    def _bucket(self, api: str, username: Optional[str]) -> TokenBucket:
+        key = (api, username)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            quota = self.quotas.get(api, self.quotas["drive"])
+            with self._lock:
+                bucket = self._buckets.setdefault(
+                    key, TokenBucket(quota["user" if username else "project"])
+                )
+        return bucket
+
+
+async def _acquire(bucket: TokenBucket) -> None:
+    """Wait for a token of `bucket` without blocking the event loop."""
+    import asyncio
+
+    while True:
+        wait = bucket.try_acquire()
+        if not wait:
+            return
+        await asyncio.sleep(wait)
+
+
+def _api_name(request: Any) -> str:
+    """Return the API a request targets, from its method id (e.g. `sheets.spreadsheets.get`)."""
+    method_id = getattr(request, "methodId", None)
+    return method_id.split(".", 1)[0] if method_id else "drive"
+
+
+def _method_name(request: Any) -> str:
+    """Return a request's method id, or "batch" for a batch request."""
+    if request is not None and hasattr(request, "_requests"):
+        return "batch"
+    return getattr(request, "methodId", None) or "unknown"
+
+
+def _error_reasons(error: HttpError) -> set:
+    """Extract the `errors[].reason` values from an API error body."""
+    try:
+        body = json.loads(error.content.decode("utf-8"))
+    except (ValueError, AttributeError, UnicodeDecodeError):
+        return set()
+    errors = body.get("error", {}).get("errors", []) if isinstance(body, dict) else []
+    return {e.get("reason") for e in errors if isinstance(e, dict)}
+
+
+def _retry_after(error: HttpError) -> Optional[float]:
+    """Seconds to wait according to the `Retry-After` header, if present."""
+    value = error.resp.get("retry-after") if error.resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+request_executor = RequestExecutor()
+"""Process-wide executor shared by every loader, so limits apply across requests."""
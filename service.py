@@ -1,53 +1,223 @@
 import os
 os.environ['OPENAI_API_KEY']="<API_KEY_HERE>"
 
-from flask import Flask, request, jsonify
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import Chroma
-from langchain.embeddings.openai import OpenAIEmbeddings
-from googleDriveLoader import GoogleDriveLoader
+import functools
+import hashlib
+import logging
+import re
+
+from flask import Flask, Response, request, jsonify
+from contentCache import revision_marker
+from crawlScheduler import CrawlCheckpoint, CrawlScheduler
+from driveChanges import ChangeCursorStore
+from ingestionJobs import CANCELLED, SUCCEEDED, InProcessJobQueue
+from ingestionPipeline import IngestionPipeline
+from metrics import metrics
+from queryCache import QueryCache
+from requestExecutor import request_executor
+from servicePool import service_pool
+from vectorStores import VectorStoreManager
 import json
 
+# langchain, OpenAI, Chroma and googleapiclient take seconds to import, so
+# they are imported on first use, or up front by `warm_up`.
+
 app = Flask(__name__)
+cursor_store = ChangeCursorStore('docs/cursors/')
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_cache():
+    """The shared embedding cache, opened on first use so no SQLite handle outlives a fork."""
+    from embeddingCache import EmbeddingCache
 
+    return EmbeddingCache('docs/embedding_cache.sqlite3')
 
-def load_and_create_vector_store(embedding, persist_directory, loaders=None, documents=None):
-    docs = []
 
-    if loaders is not None:
-        for loader in loaders:
-            docs.extend(loader.load())
+def cached_embeddings():
+    """OpenAI embeddings that skip chunks already embedded by any earlier request."""
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from embeddingCache import CachedEmbeddings
 
-    if documents is not None:
-        docs.extend(documents)
+    return CachedEmbeddings(OpenAIEmbeddings(), get_embedding_cache())
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=150)
-    splits = text_splitter.split_documents(docs)
 
-    vectordb = Chroma.from_documents(documents=splits, embedding=embedding, persist_directory=persist_directory)
-    return vectordb
+@functools.lru_cache(maxsize=None)
+def query_embeddings():
+    """OpenAI embeddings for search questions.
+
+    Questions are one-off, so they bypass the embedding cache instead of
+    growing it and skewing its hit rate.
+    """
+    from langchain.embeddings.openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings()
+
+
+stores = VectorStoreManager(cached_embeddings, root='docs/chroma/', max_open=32)
+jobs = InProcessJobQueue(max_workers=2)
+query_cache = QueryCache(max_entries=10000, ttl=300)
+# Drive metadata looked up for `/get_shortlisted_doc`, per (username, fileId).
+# Edits to a file are picked up at most `ttl` seconds late.
+metadata_cache = QueryCache(max_entries=10000, ttl=60)
+
+
+def iter_documents(loaders=None, documents=None):
+    """Yield the loaders' documents one loader at a time, then `documents`."""
+    for loader in loaders or []:
+        yield from loader.load()
+    yield from documents or []
+
+
+def index_documents(vectordb, docs, progress=None):
+    """Split, embed and upsert documents under stable chunk ids as they arrive.
+
+    `docs` may be a lazy stream; see `IngestionPipeline`.
+    """
+    return IngestionPipeline(vectordb).run(docs, progress)
+
+
+def sync_user_files(vectordb, revisions, gdl_instance, files, username):
+    """Index the listed files that are missing from the store or out of date.
+
+    `revisions` is the store's `FileRevisions`. Stale chunks are only deleted
+    once the new revision is indexed; files that fail to load keep theirs.
+    Returns whether anything was written.
+    """
+    files = fetch_metadata(gdl_instance, files, username)
+    stale = [f for f in files if not is_file_indexed(vectordb, revisions, f)]
+    if not stale:
+        return False
+    docs, failed = gdl_instance.load_listed_files(stale, username)
+    loaded = {f["fileId"]: revision_marker(f) or '' for f in stale if f["fileId"] not in failed}
+    if not loaded:
+        return False
+    index_documents(vectordb, docs)
+    delete_file_chunks(vectordb, loaded.keys(), keep_revisions=loaded)
+    revisions.update(loaded)
+    return True
+
+
+def fetch_metadata(gdl_instance, files, username):
+    """Merge revision metadata into `files`, looking up only what isn't known yet.
+
+    Revisions sent by the client are used as they are, and lookups are reused
+    from `metadata_cache` while fresh, so a repeated question doesn't cost a
+    Drive round trip.
+    """
+    cached = {}
+    for f in files:
+        metadata = metadata_cache.get((username, f["fileId"]))
+        if metadata is not None:
+            cached[f["fileId"]] = metadata
+    files = gdl_instance.fetch_metadata(
+        [{**cached.get(f["fileId"], {}), **f} for f in files], username
+    )
+    for f in files:
+        if f["fileId"] not in cached and revision_marker(f) is not None:
+            metadata_cache.put((username, f["fileId"]), f)
+    return files
+
+
+def is_file_indexed(vectordb, revisions, file):
+    """Whether the file's current revision is in the store.
+
+    Without a revision marker the file is only loaded once. Files missing
+    from `revisions` fall back to looking up their first chunk.
+    """
+    revision = revision_marker(file) or ''
+    indexed = revisions.get(file["fileId"])
+    if indexed is not None:
+        return indexed == revision or not revision
+    return bool(revision) and bool(vectordb.get(ids=[f'{file["fileId"]}:{revision}:0'])["ids"])
+
+
+def delete_file_chunks(vectordb, file_ids, keep_revisions=None):
+    """Remove the chunks indexed for the given Drive file ids.
+
+    Chunks of the revision given for a file in `keep_revisions` are kept.
+    Files are looked up a few hundred at a time to stay under SQLite's
+    limit on query parameters.
+    """
+    file_ids = list(file_ids)
+    keep_revisions = keep_revisions or {}
+    for start in range(0, len(file_ids), 500):
+        found = vectordb.get(
+            where={"file_id": {"$in": file_ids[start:start + 500]}}, include=["metadatas"]
+        )
+        ids = [
+            id for id, metadata in zip(found["ids"], found["metadatas"])
+            if keep_revisions.get(metadata["file_id"]) != metadata.get("revision", '')
+        ]
+        if ids:
+            vectordb.delete(ids)
+
+
+def track_revisions(docs, indexed):
+    """Pass `docs` through, recording in `indexed` the revision of each Drive file seen."""
+    for doc in docs:
+        if "file_id" in doc.metadata:
+            indexed[doc.metadata["file_id"]] = doc.metadata.get("revision", '')
+        yield doc
+
+
+def prune_other_revisions(vectordb, indexed, failed=(), revisions=None):
+    """Delete the chunks of other revisions of the files in `indexed` and record theirs.
+
+    Chunk ids include the revision, so upserting an edited file leaves the
+    old revision's chunks behind until they are pruned here. Files that
+    failed to load keep their older chunks.
+    """
+    indexed = {id: revision for id, revision in indexed.items() if id not in failed}
+    delete_file_chunks(vectordb, indexed.keys(), keep_revisions=indexed)
+    if revisions is not None:
+        revisions.update(indexed)
 
 
 @app.route('/load_pdfs', methods=['POST'])
 def load_pdfs():
+    from langchain.document_loaders import PyPDFLoader
+
     pdf_paths = request.json['pdf_paths']
     loaders = [PyPDFLoader(pdf_path) for pdf_path in pdf_paths]
-    embedding = OpenAIEmbeddings()
-    persist_directory = 'docs/chroma/'
-    vectordb = load_and_create_vector_store(embedding, persist_directory, loaders=loaders)
+    try:
+        index_documents(stores.get(), iter_documents(loaders))
+    finally:
+        stores.mark_written()
     return jsonify({"message": "PDFs loaded successfully"})
 
 
+def search(username, questions, k):
+    """Return [(document, score), ...] per question, best match first.
+
+    Results are cached per (store, store version, question, k). Questions
+    missing from the cache are embedded in one call, then searched.
+    """
+    store_key = username or ''
+    version = stores.version(username)
+    results = [query_cache.get((store_key, version, question, k)) for question in questions]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    vectordb = stores.get(username)
+    embeddings = query_embeddings().embed_documents([questions[i] for i in missing])
+    for i, embedding in zip(missing, embeddings):
+        docs = vectordb.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+        results[i] = [(doc.page_content, score) for doc, score in docs]
+        query_cache.put((store_key, version, questions[i], k), results[i])
+    return results
+
+
 @app.route('/similarity_search', methods=['POST'])
 def similarity_search():
-    global vectordb
     question = request.json['question']
     k = request.json.get('k', 5)
+    username = request.json.get('username')
 
-    if vectordb is not None:
-        docs = vectordb.similarity_search(question, k=k)
-        results = [{"document": doc.page_content} for doc in docs]
+    if stores.exists(username):
+        docs = search(username, [question], k)[0]
+        results = [{"document": document} for document, _ in docs]
         return jsonify({"results": results})
     else:
         return jsonify({"error": "Vector database not initialized."})
@@ -55,13 +225,13 @@ def similarity_search():
 
 @app.route('/similarity_search_with_score', methods=['POST'])
 def similarity_search_with_score():
-    global vectordb
     question = request.json['question']
     k = request.json.get('k', 5)
+    username = request.json.get('username')
 
-    if vectordb is not None:
-        docs = vectordb.similarity_search_with_score(question, k=k)
-        results = [{"document": doc[0].page_content, "score": doc[1]} for doc in docs]
+    if stores.exists(username):
+        docs = search(username, [question], k)[0]
+        results = [{"document": document, "score": score} for document, score in docs]
         return jsonify({"results": results})
     else:
         return jsonify({"error": "Vector database not initialized."})
@@ -69,32 +239,173 @@ def similarity_search_with_score():
 
 @app.route('/similarity_search_best_score', methods=['POST'])
 def similarity_search_best_score():
-    global vectordb
     question = request.json['question']
+    username = request.json.get('username')
+
+    if stores.exists(username):
+        # Results come back best first, so only the top hit is needed.
+        docs = search(username, [question], 1)[0]
+        if not docs:
+            return jsonify({"error": "Vector database is empty."})
+        document, score = docs[0]
+        return jsonify({"result": {"document": document, "score": score}})
+    else:
+        return jsonify({"error": "Vector database not initialized."})
+
+
+@app.route('/similarity_search_batch', methods=['POST'])
+def similarity_search_batch():
+    questions = request.json['questions']
     k = request.json.get('k', 5)
+    username = request.json.get('username')
 
-    if vectordb is not None:
-        docs = vectordb.similarity_search_with_score(question, k=k)
-        min_score_result = min(docs, key=lambda x: x[1])
-        result_item = {
-            "document": min_score_result[0].page_content,
-            "score": min_score_result[1]
-        }
-        return jsonify({"result": result_item})
+    if stores.exists(username):
+        results = [
+            {"question": question, "results": [{"document": d, "score": s} for d, s in docs]}
+            for question, docs in zip(questions, search(username, questions, k))
+        ]
+        return jsonify({"results": results})
     else:
         return jsonify({"error": "Vector database not initialized."})
 
 
+def ingest_gdrive(username, incremental, progress=None):
+    """Load a user's Drive into the user's own store; runs inside an ingestion job.
+
+    Incremental syncs prune files that left the user's scope, so the store
+    must not hold other users' files.
+    """
+    from googleDriveLoader import GoogleDriveLoader
+
+    gdl_instance = GoogleDriveLoader(progress=progress)
+    vectordb = stores.get(username)
+    revisions = stores.file_revisions(username)
+    indexed = {}
+
+    # A failed or cancelled sync may already have written, so cached results
+    # are invalidated whatever happens.
+    try:
+        if not incremental:
+            docs = track_revisions(gdl_instance.lazy_load(username), indexed)
+            counts = index_documents(vectordb, docs, progress)
+            prune_other_revisions(vectordb, indexed, gdl_instance.failed_files(), revisions)
+            return {"results": "SUCCESS", **counts}
+
+        change_set = gdl_instance.load_changes(username, cursor_store)
+        if not change_set.full_sync:
+            pruned = change_set.changed_file_ids + change_set.deleted_file_ids
+            delete_file_chunks(vectordb, pruned)
+            # Lets `/get_shortlisted_doc` load them again if it is asked about them.
+            revisions.discard(pruned)
+        index_documents(vectordb, track_revisions(change_set.documents, indexed), progress)
+        prune_other_revisions(vectordb, indexed, change_set.failed_file_ids, revisions)
+    finally:
+        stores.mark_written(username)
+    # Keep the cursor on failures, so the next sync fetches those files again.
+    if not change_set.failed_file_ids:
+        cursor_store.save(username, change_set.new_start_page_token, change_set.folder_ids)
+    return {
+        "results": "SUCCESS" if not change_set.failed_file_ids else "PARTIAL",
+        "full_sync": change_set.full_sync,
+        "changed": len(change_set.changed_file_ids),
+        "deleted": len(change_set.deleted_file_ids),
+        "failed": change_set.failed_file_ids,
+    }
+
+
+def job_outcome(job, **fields):
+    """Wait for the job and respond with its result, or its state if it didn't succeed.
+
+    Synchronous requests still go through `jobs`, so they are deduplicated
+    like background ones: a request that finds the same ingestion already
+    queued or running waits for that job.
+    """
+    jobs.wait(job.id)
+    if job.status == SUCCEEDED:
+        return jsonify({**job.result, **fields})
+    return jsonify({**job.to_dict(), **fields}), 409 if job.status == CANCELLED else 500
+
+
 @app.route('/load_gdrive', methods=['POST'])
 def load_gdrive():
-    global vectordb
-    gdl_instance = GoogleDriveLoader()
     username = request.json['username']
-    docs = gdl_instance.load(username)
-    embedding = OpenAIEmbeddings()
-    persist_directory = 'docs/chroma/'
-    vectordb = load_and_create_vector_store(embedding, persist_directory, documents=docs)
-    return jsonify({"results": "SUCCESS"})
+    incremental = request.json.get('incremental', False)
+
+    job, created = jobs.submit(username, lambda progress: ingest_gdrive(username, incremental, progress))
+    if request.json.get('wait', False):
+        return job_outcome(job)
+    return jsonify({**job.to_dict(), "created": created}), 202
+
+
+def crawl_org(crawl_id, usernames, weights=None, workers=8, progress=None):
+    """Crawl many users' Drives into the shared store; runs inside an ingestion job.
+
+    Progress is checkpointed per crawl id, so submitting an unfinished crawl
+    again resumes it. Each user lists one page and embeds one batch at a
+    time, so `workers` bounds the crawl's Drive and embedding calls.
+    """
+    from googleDriveLoader import GoogleDriveLoader
+
+    vectordb = stores.get()
+    loaders = {}
+
+    def loader(username):
+        loaders[username] = GoogleDriveLoader(listing_workers=1)
+        return loaders[username]
+
+    def index(username, docs):
+        indexed = {}
+        IngestionPipeline(vectordb, embed_workers=1).run(track_revisions(docs, indexed))
+        prune_other_revisions(vectordb, indexed, loaders[username].failed_files())
+
+    scheduler = CrawlScheduler(
+        loader,
+        index,
+        workers=workers,
+        weights=weights,
+        checkpoint=CrawlCheckpoint(f'docs/crawls/{crawl_id}.json'),
+        progress=progress,
+    )
+    try:
+        users = scheduler.run(usernames)
+    finally:
+        stores.mark_written()
+    return {"results": "SUCCESS", "users": users}
+
+
+@app.route('/load_gdrive_org', methods=['POST'])
+def load_gdrive_org():
+    usernames = request.json['usernames']
+    weights = request.json.get('weights')
+    workers = request.json.get('workers', 8)
+    crawl_id = request.json.get('crawl_id') or hashlib.sha1(
+        '\n'.join(sorted(usernames)).encode('utf-8')
+    ).hexdigest()[:16]
+    crawl_id = re.sub(r'[^A-Za-z0-9._-]', '_', crawl_id)
+
+    def run(progress=None):
+        return crawl_org(crawl_id, usernames, weights, workers, progress)
+
+    job, created = jobs.submit(f'crawl:{crawl_id}', run)
+    if request.json.get('wait', False):
+        return job_outcome(job, crawl_id=crawl_id)
+    return jsonify({**job.to_dict(), "crawl_id": crawl_id, "created": created}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job."}), 404
+    return jsonify(job.to_dict())
 
 @app.route('/get_shortlisted_doc', methods=['POST'])
 def get_shortlisted_doc():
@@ -113,13 +424,23 @@ def get_shortlisted_doc():
         username = data['username']
         files = data['files']
 
-        gdl_instance = GoogleDriveLoader()
-        docs = gdl_instance.load_documents_from_list(json.loads(files), username)
-        embedding = OpenAIEmbeddings()
-        persist_directory = 'docs/chroma/'+username+"/"
-        vectordb_internal = load_and_create_vector_store(embedding, persist_directory, documents=docs)
+        files = json.loads(files)
+        from googleDriveLoader import GoogleDriveLoader
 
-        docs = vectordb_internal.similarity_search_with_score(question, k=5)
+        gdl_instance = GoogleDriveLoader()
+        vectordb_internal = stores.get(username)
+        revisions = stores.file_revisions(username)
+        written = True
+        try:
+            written = sync_user_files(vectordb_internal, revisions, gdl_instance, files, username)
+        finally:
+            if written:
+                stores.mark_written(username)
+
+        file_ids = [f["fileId"] for f in files]
+        docs = vectordb_internal.similarity_search_with_score(
+            question, k=5, filter={"file_id": {"$in": file_ids}}
+        )
         min_score_result = min(docs, key=lambda x: x[1])
         result_item = {
             "document": min_score_result[0].page_content,
@@ -131,17 +452,66 @@ def get_shortlisted_doc():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/embedding_cache_stats', methods=['GET'])
+def embedding_cache_stats():
+    return jsonify(get_embedding_cache().stats())
+
+
+@app.route('/query_cache_stats', methods=['GET'])
+def query_cache_stats():
+    return jsonify(query_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint; cache, store pool and API executor state are exported as gauges."""
+    for name, value in get_embedding_cache().stats().items():
+        metrics.set(f'embedding_cache_{name}', value)
+    for name, value in query_cache.stats().items():
+        metrics.set(f'query_cache_{name}', value)
+    for name, value in stores.stats().items():
+        metrics.set(f'vector_stores_{name}', value)
+    for name, value in request_executor.stats().items():
+        metrics.set(f'google_api_{name}', value)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/get_documents', methods=['GET'])
 def get_documents():
-    global vectordb
+    username = request.args.get('username')
 
-    if vectordb is not None:
-        documents = vectordb.get()
+    if stores.exists(username):
+        documents = stores.get(username).get()
         return jsonify({"documents": documents})
     else:
         return jsonify({"error": "Vector database not initialized."})
 
 
+def warm_up(hot_users=()):
+    """Do the slow first-use work up front, e.g. in a pre-fork server's master.
+
+    Imports the heavy dependencies, fetches and parses the Drive, Sheets and
+    Slides discovery documents and creates an embedding client, so forked
+    workers inherit all of it. Open stores and SQLite handles must
+    not cross a fork, so the stores of `hot_users` (and the shared store) are
+    only read into the OS page cache.
+    """
+    import googleDriveLoader  # noqa: F401
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from langchain.vectorstores import Chroma  # noqa: F401
+
+    for servicename, version in (('drive', 'v3'), ('sheets', 'v4'), ('slides', 'v1')):
+        service_pool.preload(servicename, version)
+    OpenAIEmbeddings()
+    for username in [None, *hot_users]:
+        stores.prefetch(username)
+
+
+# gunicorn --preload imports this module once in the master before forking.
+if os.environ.get('WARM_UP'):
+    warm_up([u for u in os.environ.get('WARM_UP_USERS', '').split(',') if u])
+
+
 if __name__ == '__main__':
-    vectordb = None
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
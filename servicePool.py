@@ -0,0 +1,207 @@
+"""Shared pool of Google API service clients.
+
+Building a service client means reading the service account key, deriving
+scoped and subject-delegated credentials and parsing a discovery document.
+The pool does that once per (username, service name, version) and hands the
+same client back to every loader until it ages out or is evicted.
+
+httplib2 connections are not thread-safe, so each thread gets its own client
+(and therefore its own HTTP connection) for a given key. The user's delegated
+credentials are shared by all of those clients, so a token is minted once
+per user rather than once per thread.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+SERVICE_ACCOUNT_FILE = "<PATH>/service_account.json"  # Replace with your JSON file path
+DELEGATED_SCOPES = [
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+    "https://www.googleapis.com/auth/drive",
+]
+
+ServiceKey = Tuple[str, str, str, int]
+
+
+class _DelegatedCredentials:
+    """One user's credentials and the lock serializing their refreshes."""
+
+    __slots__ = ("credentials", "refresh_lock")
+
+    def __init__(self, credentials: Any) -> None:
+        self.credentials = credentials
+        self.refresh_lock = threading.Lock()
+
+
+class _PooledService:
+    """A built service client together with the credentials it signs with."""
+
+    __slots__ = ("service", "delegated", "created_at")
+
+    def __init__(self, service: Any, delegated: _DelegatedCredentials) -> None:
+        self.service = service
+        self.delegated = delegated
+        self.created_at = time.monotonic()
+
+
+class ServicePool:
+    """LRU/TTL cache of service clients keyed by (username, service, version, thread)."""
+
+    def __init__(
+        self,
+        credentials_file: str = SERVICE_ACCOUNT_FILE,
+        scopes: Optional[List[str]] = None,
+        max_size: int = 256,
+        ttl: float = 3600.0,
+        refresh_margin: float = 300.0,
+        credentials: Any = None,
+        discovery_service_url: Optional[str] = None,
+    ) -> None:
+        self.credentials_file = credentials_file
+        self.scopes = scopes or DELEGATED_SCOPES
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        # Fixed credentials used for every user instead of delegating from the
+        # service account key, and an alternative discovery endpoint; both let
+        # the pool talk to a local stand-in of the Google APIs.
+        self.credentials = credentials
+        self.discovery_service_url = discovery_service_url
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._services: "OrderedDict[ServiceKey, _PooledService]" = OrderedDict()
+        self._discovery_documents: Dict[Tuple[str, str], Any] = {}
+        self._base_credentials: Any = None
+        self._delegated: "OrderedDict[str, _DelegatedCredentials]" = OrderedDict()
+
+    def get(self, username: str, servicename: str = "drive", version: str = "v3") -> Any:
+        """Return the calling thread's service client for the user, building it on a miss."""
+        key = (username, servicename, version, threading.get_ident())
+        with self._lock:
+            entry = self._services.get(key)
+            if entry is not None and time.monotonic() - entry.created_at >= self.ttl:
+                del self._services[key]
+                entry = None
+            if entry is not None:
+                self._services.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is not None:
+            self._refresh_if_expiring(entry)
+            return entry.service
+
+        entry = self._build(username, servicename, version)
+        with self._lock:
+            self._services[key] = entry
+            self._services.move_to_end(key)
+            while len(self._services) > self.max_size:
+                self._services.popitem(last=False)
+        return entry.service
+
+    def preload(self, servicename: str = "drive", version: str = "v3") -> None:
+        """Fetch and cache the service's discovery document ahead of the first build."""
+        self._discovery_document(servicename, version)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current pool size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._services)}
+
+    def clear(self, discovery_documents: bool = False) -> None:
+        """Drop every pooled client and credential, and the cached discovery documents if asked."""
+        with self._lock:
+            self._services.clear()
+            self._delegated.clear()
+            if discovery_documents:
+                self._discovery_documents.clear()
+
+    def delegated_credentials(self, username: str) -> Any:
+        """Return the credentials impersonating the user, shared by all of the user's clients.
+
+        Also used by clients that sign their own requests, such as `AsyncDriveClient`.
+        """
+        return self._delegated_entry(username).credentials
+
+    def _delegated_entry(self, username: str) -> _DelegatedCredentials:
+        with self._lock:
+            entry = self._delegated.get(username)
+            if entry is not None:
+                self._delegated.move_to_end(username)
+                return entry
+        entry = _DelegatedCredentials(self._derive_credentials(username))
+        with self._lock:
+            # Another thread may have derived them meanwhile; keep the first.
+            entry = self._delegated.setdefault(username, entry)
+            self._delegated.move_to_end(username)
+            while len(self._delegated) > self.max_size:
+                self._delegated.popitem(last=False)
+        return entry
+
+    def _derive_credentials(self, username: str) -> Any:
+        """Derive credentials impersonating the user from the shared base key."""
+        if self.credentials is not None:
+            return self.credentials
+        if self._base_credentials is None:
+            from google.oauth2 import service_account
+
+            credentials = service_account.Credentials.from_service_account_file(
+                self.credentials_file, scopes=self.scopes
+            )
+            with self._lock:
+                if self._base_credentials is None:
+                    self._base_credentials = credentials
+        return self._base_credentials.with_subject(username)
+
+    def _build(self, username: str, servicename: str, version: str) -> _PooledService:
+        """Build a client from the cached discovery document."""
+        from googleapiclient.discovery import build_from_document
+
+        delegated = self._delegated_entry(username)
+        document = self._discovery_document(servicename, version)
+        service = build_from_document(document, credentials=delegated.credentials)
+        return _PooledService(service, delegated)
+
+    def _discovery_document(self, servicename: str, version: str) -> Any:
+        key = (servicename, version)
+        document = self._discovery_documents.get(key)
+        if document is None:
+            from googleapiclient.discovery import build
+            from googleapiclient.http import build_http
+
+            kwargs: Dict[str, Any] = {}
+            if self.discovery_service_url is not None:
+                kwargs = {"discoveryServiceUrl": self.discovery_service_url, "static_discovery": False}
+            # An unauthenticated client is enough to fetch and parse the document.
+            service = build(servicename, version, http=build_http(), cache_discovery=False, **kwargs)
+            document = service._rootDesc
+            with self._lock:
+                self._discovery_documents[key] = document
+        return document
+
+    def _refresh_if_expiring(self, entry: _PooledService) -> None:
+        """Refresh the entry's token when it is about to expire."""
+        delegated = entry.delegated
+        expiry = getattr(delegated.credentials, "expiry", None)
+        if expiry is None:
+            # No token minted yet; the first request will fetch one.
+            return
+        if expiry - datetime.utcnow() > timedelta(seconds=self.refresh_margin):
+            return
+        with delegated.refresh_lock:
+            expiry = delegated.credentials.expiry
+            if expiry - datetime.utcnow() > timedelta(seconds=self.refresh_margin):
+                return
+            import google_auth_httplib2
+            import httplib2
+
+            delegated.credentials.refresh(google_auth_httplib2.Request(httplib2.Http()))
+
+
+service_pool = ServicePool()
+"""Process-wide pool used by `GoogleDriveLoader.create_drive_service`."""
@@ -0,0 +1,27 @@
+import pytest
+
+from atomicWrite import write_atomic
+
+
+def test_replaces_file_and_creates_directory(tmp_path):
+    path = tmp_path / "state" / "cursor.json"
+    write_atomic(path, "first")
+    write_atomic(path, "second")
+
+    assert path.read_text() == "second"
+    assert [p.name for p in path.parent.iterdir()] == ["cursor.json"]
+
+
+def test_failed_write_keeps_previous_file(tmp_path, monkeypatch):
+    path = tmp_path / "cursor.json"
+    write_atomic(path, "first")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("atomicWrite.os.replace", fail)
+    with pytest.raises(OSError):
+        write_atomic(path, "second")
+
+    assert path.read_text() == "first"
+    assert [p.name for p in tmp_path.iterdir()] == ["cursor.json"]
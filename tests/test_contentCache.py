@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain.docstore.document import Document
+
+from contentCache import ContentCache
+
+
+def docs(*texts):
+    return [Document(page_content=text, metadata={"source": text}) for text in texts]
+
+
+def tmp_files(cache):
+    return list(cache.directory.glob("*/*.tmp"))
+
+
+def test_entries_are_keyed_by_revision_and_variant(tmp_path):
+    cache = ContentCache(tmp_path)
+    cache.put("f", "version:1", docs("a", "b"))
+
+    assert [d.page_content for d in cache.get("f", "version:1")] == ["a", "b"]
+    assert cache.get("f", "version:1")[0].metadata == {"source": "a"}
+    assert cache.get("f", "version:2") is None
+    assert cache.get("f", "version:1", variant="ocr") is None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_writer_publishes_only_on_commit(tmp_path):
+    cache = ContentCache(tmp_path)
+    writer = cache.writer("f", "version:1")
+    writer.add(docs("a")[0])
+
+    assert cache.get("f", "version:1") is None
+    writer.commit()
+    assert [d.page_content for d in cache.get("f", "version:1")] == ["a"]
+    assert tmp_files(cache) == []
+
+
+def test_aborted_writer_leaves_nothing_behind(tmp_path):
+    cache = ContentCache(tmp_path)
+    writer = cache.writer("f", "version:1")
+    writer.add(docs("a")[0])
+    writer.abort()
+
+    assert cache.get("f", "version:1") is None
+    assert tmp_files(cache) == []
+    assert cache.stats()["bytes"] == 0
+
+
+def test_failed_put_is_aborted(tmp_path):
+    cache = ContentCache(tmp_path)
+
+    def documents():
+        yield docs("a")[0]
+        raise RuntimeError("parse failed")
+
+    with pytest.raises(RuntimeError):
+        cache.put("f", "version:1", documents())
+    assert cache.get("f", "version:1") is None
+    assert tmp_files(cache) == []
+
+
+def test_least_recently_used_entries_are_evicted_below_the_cap(tmp_path):
+    cache = ContentCache(tmp_path)
+    for i, file_id in enumerate("abc"):
+        cache.put(file_id, "r", docs("x" * 100))
+        path = cache._path(file_id, "r", "")
+        os.utime(path, (1000 + i, 1000 + i))
+    entry_size = os.path.getsize(cache._path("a", "r", ""))
+    # Reading "a" makes "b" the least recently used entry.
+    assert cache.get("a", "r") is not None
+    cache.max_bytes = int(entry_size * 3.2)
+
+    cache.put("d", "r", docs("x" * 100))
+
+    assert cache.get("b", "r") is None
+    assert cache.get("c", "r") is None
+    assert cache.get("a", "r") is not None
+    assert cache.get("d", "r") is not None
+    assert cache.stats()["bytes"] == 2 * entry_size <= cache.max_bytes * 0.9
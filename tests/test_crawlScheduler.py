@@ -0,0 +1,126 @@
+import json
+
+from crawlScheduler import DONE, FAILED, CrawlCheckpoint, CrawlScheduler
+
+
+class FakeLoader:
+    def __init__(self, username, count, fail_listing=False):
+        self.username = username
+        self.count = count
+        self.fail_listing = fail_listing
+
+    def list_files(self, username):
+        for i in range(self.count):
+            if self.fail_listing:
+                raise RuntimeError("listing failed")
+            yield {"id": f"{username}{i}", "mimeType": "text/plain"}
+
+    def load_file(self, file, username):
+        return [file["id"] + "/0", file["id"] + "/1"]
+
+
+def make_index(calls):
+    def index(username, documents):
+        calls.append((username, list(documents)))
+
+    return index
+
+
+def test_users_take_turns():
+    calls = []
+    scheduler = CrawlScheduler(
+        lambda username: FakeLoader(username, 3), make_index(calls), workers=1, files_per_unit=1
+    )
+    results = scheduler.run(["a", "b"])
+
+    assert [username for username, _ in calls] == ["a", "b", "a", "b", "a", "b"]
+    assert results["a"] == {"status": DONE, "files": 3, "documents": 6, "skipped": 0}
+
+
+def test_weights_share_workers():
+    calls = []
+    scheduler = CrawlScheduler(
+        lambda username: FakeLoader(username, 4),
+        make_index(calls),
+        workers=1,
+        files_per_unit=1,
+        weights={"a": 2},
+    )
+    scheduler.run(["a", "b"])
+
+    # While both have files left, a gets two units for every one of b's.
+    assert [username for username, _ in calls][:6].count("a") == 4
+
+
+def test_unit_of_files_is_indexed_in_one_call():
+    calls = []
+    scheduler = CrawlScheduler(
+        lambda username: FakeLoader(username, 25), make_index(calls), workers=2, files_per_unit=10
+    )
+    results = scheduler.run(["a"])
+
+    assert [len(documents) for _, documents in calls] == [20, 20, 10]
+    assert results["a"]["files"] == 25
+
+
+def test_failing_user_does_not_stop_others():
+    calls = []
+    scheduler = CrawlScheduler(
+        lambda username: FakeLoader(username, 2, fail_listing=username == "bad"),
+        make_index(calls),
+        workers=2,
+    )
+    results = scheduler.run(["bad", "good"])
+
+    assert results["bad"]["status"] == FAILED
+    assert "listing failed" in results["bad"]["error"]
+    assert results["good"]["status"] == DONE
+    assert {username for username, _ in calls} == {"good"}
+
+
+def test_failing_index_fails_only_that_user():
+    def index(username, documents):
+        list(documents)
+        if username == "bad":
+            raise RuntimeError("index failed")
+
+    scheduler = CrawlScheduler(lambda username: FakeLoader(username, 2), index, workers=2)
+    results = scheduler.run(["bad", "good"])
+
+    assert results["bad"]["status"] == FAILED
+    assert results["good"]["status"] == DONE
+
+
+def test_resumes_from_checkpoint(tmp_path):
+    path = tmp_path / "crawl.json"
+    path.write_text(json.dumps({"users": {
+        "a": {"status": DONE, "files": []},
+        "b": {"status": "running", "files": ["b0", "b1"]},
+    }}))
+    calls = []
+    scheduler = CrawlScheduler(
+        lambda username: FakeLoader(username, 3),
+        make_index(calls),
+        checkpoint=CrawlCheckpoint(path),
+    )
+    results = scheduler.run(["a", "b"])
+
+    assert results["a"] == {"status": DONE, "resumed": True}
+    assert results["b"] == {"status": DONE, "files": 1, "documents": 2, "skipped": 2}
+    assert calls == [("b", ["b2/0", "b2/1"])]
+    # Finished: submitting the same crawl again starts over.
+    assert not path.exists()
+
+
+def test_unfinished_crawl_keeps_its_checkpoint(tmp_path):
+    path = tmp_path / "crawl.json"
+    scheduler = CrawlScheduler(
+        lambda username: FakeLoader(username, 2, fail_listing=username == "bad"),
+        make_index([]),
+        checkpoint=CrawlCheckpoint(path),
+    )
+    scheduler.run(["bad", "good"])
+
+    checkpoint = CrawlCheckpoint(path)
+    assert checkpoint.status("good") == DONE
+    assert checkpoint.status("bad") == FAILED
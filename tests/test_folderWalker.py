@@ -0,0 +1,170 @@
+from folderWalker import FOLDER_MIME_TYPE, SHORTCUT_MIME_TYPE, FolderWalker
+
+
+class FakeFiles:
+    """`files()` resource answering `list` from a {parent id: [children]} tree."""
+
+    def __init__(self, tree, page_size=2):
+        self.tree = tree
+        self.page_size = page_size
+        self.queries = []
+
+    def list(self, q, pageToken=None, **kwargs):
+        self.queries.append(q)
+        children = [
+            file for parent, files in self.tree.items() if f"'{parent}' in parents" in q
+            for file in files
+        ]
+        start = int(pageToken or 0)
+        page = {"files": children[start:start + self.page_size]}
+        if start + self.page_size < len(children):
+            page["nextPageToken"] = str(start + self.page_size)
+        return page
+
+
+class FakeService:
+    def __init__(self, files):
+        self._files = files
+
+    def files(self):
+        return self._files
+
+
+def doc(id):
+    return {"id": id, "name": id, "mimeType": "application/vnd.google-apps.document"}
+
+
+def walker(files, **kwargs):
+    return FolderWalker(lambda: FakeService(files), execute=lambda request: request, **kwargs)
+
+
+def test_one_worker_lists_only_as_files_are_consumed():
+    files = FakeFiles({"root": [doc("a"), doc("b"), doc("c"), doc("d")]})
+    walk = walker(files, max_workers=1).walk("root")
+
+    assert next(walk)["id"] == "a"
+    assert next(walk)["id"] == "b"
+    # The second page isn't requested until the caller asks for more.
+    assert len(files.queries) == 1
+    assert [f["id"] for f in walk] == ["c", "d"]
+    assert len(files.queries) == 2
+
+
+def folder(id):
+    return {"id": id, "name": id, "mimeType": FOLDER_MIME_TYPE}
+
+
+def shortcut(id, target):
+    return {
+        "id": id,
+        "name": id,
+        "mimeType": SHORTCUT_MIME_TYPE,
+        "version": "7",
+        "shortcutDetails": {"targetId": target["id"], "targetMimeType": target["mimeType"]},
+    }
+
+
+def test_walks_breadth_first_batching_sibling_folders():
+    files = FakeFiles(
+        {
+            "root": [folder("f1"), folder("f2"), doc("a")],
+            "f1": [doc("b"), folder("f3")],
+            "f2": [doc("c")],
+            "f3": [doc("d")],
+        },
+        page_size=10,
+    )
+    walked = [f["id"] for f in walker(files, recursive=True).walk("root")]
+
+    assert walked == ["a", "b", "c", "d"]
+    # One query per level: f1 and f2 are listed together.
+    assert len(files.queries) == 3
+    assert "'f1' in parents or 'f2' in parents" in files.queries[1]
+
+
+def test_batches_are_split_to_fit_the_query_length():
+    files = FakeFiles({"root": [folder(f"f{i}") for i in range(6)]}, page_size=10)
+    walk = walker(files, recursive=True, max_workers=1)
+    walk.max_query_length = len(walk.query(["f0", "f1"]))
+    list(walk.walk("root"))
+
+    assert len(files.queries) == 1 + 3
+    assert all(len(q) <= walk.max_query_length for q in files.queries[1:])
+
+
+def test_files_with_several_parents_are_yielded_once():
+    shared = doc("shared")
+    files = FakeFiles({"root": [folder("f1"), folder("f2")], "f1": [shared], "f2": [shared]})
+
+    assert [f["id"] for f in walker(files, recursive=True).walk("root")] == ["shared"]
+
+
+def test_shortcut_cycles_are_visited_once():
+    files = FakeFiles(
+        {
+            "root": [folder("f1"), doc("a")],
+            # A shortcut back to the root and one to a file already seen.
+            "f1": [shortcut("s1", folder("root")), shortcut("s2", doc("a")), doc("b")],
+        },
+        page_size=10,
+    )
+    walked = list(walker(files, recursive=True).walk("root"))
+
+    assert [f["id"] for f in walked] == ["a", "b"]
+    assert len(files.queries) == 2
+
+
+def test_shortcuts_resolve_to_their_target_without_its_revision():
+    target = doc("target")
+    files = FakeFiles({"root": [shortcut("s", target)]})
+
+    [resolved] = list(walker(files).walk("root"))
+
+    assert resolved["id"] == "target"
+    assert resolved["mimeType"] == target["mimeType"]
+    assert "version" not in resolved
+
+
+def test_folder_ids_lists_every_folder_below_when_recursive():
+    files = FakeFiles({"root": [folder("f1"), doc("a")], "f1": [folder("f2")], "f2": []})
+
+    assert walker(files, recursive=True).folder_ids("root") == {"root", "f1", "f2"}
+    assert walker(files).folder_ids("root") == {"root"}
+
+
+PDF = "application/pdf"
+
+
+def test_filters_are_pushed_into_the_query():
+    files = FakeFiles({})
+
+    assert walker(files).query(["root"]) == (
+        f"'root' in parents and trashed = false and mimeType != '{FOLDER_MIME_TYPE}'"
+    )
+    assert walker(files, recursive=True, load_trashed_files=True).query(["root"]) == (
+        "'root' in parents"
+    )
+    assert walker(files, recursive=True, file_types=[PDF]).query(["root"]) == (
+        "'root' in parents and trashed = false and "
+        f"(mimeType = '{PDF}' or mimeType = '{SHORTCUT_MIME_TYPE}' "
+        f"or mimeType = '{FOLDER_MIME_TYPE}')"
+    )
+
+
+def test_shortcut_targets_are_filtered_by_type():
+    pdf = {"id": "p", "name": "p", "mimeType": PDF}
+    files = FakeFiles({"root": [pdf, shortcut("s1", doc("d")), shortcut("s2", dict(pdf, id="q"))]})
+
+    walked = walker(files, file_types=[PDF]).walk("root")
+
+    assert [f["id"] for f in walked] == ["p", "q"]
+
+
+def test_client_side_filters_leave_the_query_bare():
+    trashed = dict(doc("t"), trashed=True)
+    files = FakeFiles({"root": [doc("a"), trashed, folder("f1")], "f1": [doc("b")]})
+    walk = walker(files, server_side_filters=False)
+
+    assert [f["id"] for f in walk.walk("root")] == ["a"]
+    assert set(files.queries) == {"'root' in parents"}
+    assert "parents, trashed" in walk.fields
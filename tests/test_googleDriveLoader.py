@@ -0,0 +1,216 @@
+import threading
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain.docstore.document import Document
+
+from driveChanges import ChangeCursorStore
+from googleDriveLoader import GoogleDriveLoader, _sheet_documents
+
+DOC = "application/vnd.google-apps.document"
+FOLDER = "application/vnd.google-apps.folder"
+
+
+class FakeRequest:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class FakeChanges:
+    def __init__(self, changes):
+        self.changes = changes
+
+    def getStartPageToken(self, **kwargs):
+        return FakeRequest({"startPageToken": "start"})
+
+    def list(self, **kwargs):
+        return FakeRequest({"changes": self.changes, "newStartPageToken": "next"})
+
+
+class FakeDrive:
+    def __init__(self, changes):
+        self._changes = FakeChanges(changes)
+
+    def changes(self):
+        return self._changes
+
+
+def doc(id, parent, **extra):
+    return {"id": id, "name": id, "mimeType": DOC, "parents": [parent], **extra}
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    """A Drive whose scope, listings, changes and failing files the test sets."""
+    state = {"scope": {"root"}, "changes": [], "listed": [], "folders": {}, "failing": set()}
+
+    def load_document(self, id, username, file=None):
+        if id in state["failing"]:
+            self._file_failed(id, "Failed to export %s", id)
+            return Document(page_content="", metadata={"source": id})
+        return Document(page_content=f"content of {id}", metadata={"source": id})
+
+    def walk_folders(self, folder_ids, username, include_trashed=False):
+        return [file for folder_id in folder_ids for file in state["folders"].get(folder_id, [])]
+
+    monkeypatch.setattr(
+        GoogleDriveLoader, "create_drive_service", lambda self, username, *args: FakeDrive(state["changes"])
+    )
+    monkeypatch.setattr(GoogleDriveLoader, "_scope_folder_ids", lambda self, username: state["scope"])
+    monkeypatch.setattr(GoogleDriveLoader, "list_files", lambda self, username: iter(state["listed"]))
+    monkeypatch.setattr(GoogleDriveLoader, "_walk_folders", walk_folders)
+    monkeypatch.setattr(GoogleDriveLoader, "_load_document_from_id", load_document)
+    return state
+
+
+def test_full_sync_streams_documents_and_reports_failed_files(drive, tmp_path):
+    drive["listed"] = [doc("a", "root"), doc("b", "root")]
+    drive["failing"] = {"b"}
+
+    change_set = GoogleDriveLoader(folder_id="root").load_changes("alice", ChangeCursorStore(tmp_path))
+
+    assert change_set.full_sync
+    assert change_set.failed_file_ids == []
+    # Streamed like lazy_load: failed files are known once the stream is consumed.
+    documents = list(change_set.documents)
+    assert [d.metadata["file_id"] for d in documents] == ["a", "b"]
+    assert change_set.failed_file_ids == ["b"]
+    assert change_set.new_start_page_token == "start"
+    assert change_set.folder_ids == ["root"]
+
+
+def test_full_sync_does_not_list_until_consumed(drive, monkeypatch, tmp_path):
+    listed = []
+
+    def list_files(self, username):
+        listed.append(username)
+        yield doc("a", "root")
+
+    monkeypatch.setattr(GoogleDriveLoader, "list_files", list_files)
+    change_set = GoogleDriveLoader(folder_id="root").load_changes("alice", ChangeCursorStore(tmp_path))
+
+    assert listed == []
+    assert [d.metadata["file_id"] for d in change_set.documents] == ["a"]
+    assert listed == ["alice"]
+
+
+def test_failed_files_are_not_reported_as_changed(drive, tmp_path):
+    cursors = ChangeCursorStore(tmp_path)
+    cursors.save("alice", "previous", ["root"])
+    drive["changes"] = [
+        {"fileId": "a", "file": doc("a", "root")},
+        {"fileId": "b", "file": doc("b", "root")},
+        {"fileId": "c", "removed": True},
+        {"fileId": "d", "file": doc("d", "elsewhere")},
+    ]
+    drive["failing"] = {"b"}
+
+    change_set = GoogleDriveLoader(folder_id="root").load_changes("alice", cursors)
+
+    assert not change_set.full_sync
+    assert change_set.changed_file_ids == ["a"]
+    assert [d.metadata["file_id"] for d in change_set.documents] == ["a"]
+    assert change_set.failed_file_ids == ["b"]
+    assert change_set.deleted_file_ids == ["c", "d"]
+    assert change_set.new_start_page_token == "next"
+
+
+def test_files_follow_folders_moved_into_and_out_of_scope(drive, tmp_path):
+    cursors = ChangeCursorStore(tmp_path)
+    cursors.save("alice", "previous", ["root", "old"])
+    drive["scope"] = {"root", "new"}
+    drive["changes"] = [
+        {"fileId": "old", "file": {"id": "old", "mimeType": FOLDER, "parents": ["elsewhere"]}},
+        {"fileId": "new", "file": {"id": "new", "mimeType": FOLDER, "parents": ["root"]}},
+        # Edited and moved out of `new` in the same period: its own change wins.
+        {"fileId": "edited", "file": doc("edited", "elsewhere")},
+    ]
+    drive["folders"] = {
+        "old": [doc("left", "old")],
+        "new": [doc("arrived", "new"), doc("edited", "new")],
+    }
+
+    change_set = GoogleDriveLoader(folder_id="root").load_changes("alice", cursors)
+
+    assert change_set.changed_file_ids == ["arrived"]
+    assert sorted(change_set.deleted_file_ids) == ["edited", "left"]
+    assert change_set.folder_ids == ["new", "root"]
+
+
+def test_parallel_fetches_yield_documents_in_listing_order(drive, monkeypatch):
+    # "a" only finishes once "c" has: results still come out as listed.
+    c_loaded = threading.Event()
+    load_document = GoogleDriveLoader._load_document_from_id
+
+    def slow_first(self, id, username, file=None):
+        if id == "a":
+            assert c_loaded.wait(timeout=5)
+        document = load_document(self, id, username, file)
+        if id == "c":
+            c_loaded.set()
+        return document
+
+    monkeypatch.setattr(GoogleDriveLoader, "_load_document_from_id", slow_first)
+    loader = GoogleDriveLoader(folder_id="root", max_workers=3)
+
+    documents = list(loader._iter_files([doc(id, "root") for id in "abc"], "alice"))
+
+    assert [d.metadata["file_id"] for d in documents] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_a_failing_file_does_not_stop_the_others(drive, monkeypatch, max_workers):
+    load_document = GoogleDriveLoader._load_document_from_id
+
+    def broken_b(self, id, username, file=None):
+        if id == "b":
+            raise RuntimeError("export failed")
+        return load_document(self, id, username, file)
+
+    monkeypatch.setattr(GoogleDriveLoader, "_load_document_from_id", broken_b)
+    loader = GoogleDriveLoader(folder_id="root", max_workers=max_workers)
+
+    documents = list(loader._iter_files([doc(id, "root") for id in "abc"], "alice"))
+
+    assert [d.metadata["file_id"] for d in documents] == ["a", "c"]
+    assert loader.failed_files() == {"b"}
+
+
+def rows(*values):
+    return enumerate(values, start=1)
+
+
+SHEET = {"title": "Tab", "sheetId": 0}
+
+
+def test_sheet_rows_become_one_document_each_by_default():
+    documents = list(_sheet_documents("id", "Book", SHEET, ["a", "b"], rows(["1", "2"], ["3", "4"])))
+
+    assert [d.page_content for d in documents] == ["a: 1\nb: 2", "a: 3\nb: 4"]
+    assert [d.metadata["row"] for d in documents] == [1, 2]
+
+
+def test_sheet_rows_are_packed_up_to_the_character_budget():
+    documents = list(
+        _sheet_documents("id", "Book", SHEET, ["h"], rows(*[["x" * 9]] * 10), max_chars_per_document=25)
+    )
+
+    # Header (1) + two rows of 1 + 9 characters each fit in 25.
+    assert [d.page_content.count("\n") for d in documents] == [2] * 5
+    assert [(d.metadata["row_start"], d.metadata["row_end"]) for d in documents][:2] == [(1, 2), (3, 4)]
+
+
+def test_sheet_rows_are_packed_by_row_count():
+    documents = list(
+        _sheet_documents("id", "Book", SHEET, ["h"], rows(*[["v"]] * 7), rows_per_document=3)
+    )
+
+    assert [(d.metadata["row_start"], d.metadata["row_end"]) for d in documents] == [
+        (1, 3), (4, 6), (7, 7)
+    ]
+
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from ingestionJobs import (
+    CANCELLED,
+    FAILED,
+    SUCCEEDED,
+    InProcessJobQueue,
+    JobQueue,
+)
+
+
+@pytest.fixture
+def queue():
+    return InProcessJobQueue(max_workers=1)
+
+
+def blocking_job(started, release):
+    def fn(progress):
+        started.set()
+        while not release.wait(0.01):
+            progress.advance("waiting")
+        return {"done": True}
+
+    return fn
+
+
+def test_job_queue_is_abstract():
+    with pytest.raises(TypeError):
+        JobQueue()
+
+
+def test_wait_returns_the_finished_job(queue):
+    job, created = queue.submit("alice", lambda progress: {"files": 3})
+
+    assert created
+    assert queue.wait(job.id, timeout=5) is job
+    assert job.status == SUCCEEDED
+    assert job.result == {"files": 3}
+
+
+def test_active_job_is_reused_for_the_same_user(queue):
+    started, release = threading.Event(), threading.Event()
+    first, _ = queue.submit("alice", blocking_job(started, release))
+    started.wait(5)
+
+    again, created = queue.submit("alice", lambda progress: {"second": True})
+    other, other_created = queue.submit("bob", lambda progress: {})
+    release.set()
+
+    assert again is first and not created
+    assert other is not first and other_created
+    queue.wait(first.id, timeout=5)
+    queue.wait(other.id, timeout=5)
+    assert first.result == {"done": True}
+    # Finished jobs no longer block new ones.
+    assert queue.submit("alice", lambda progress: {})[1]
+
+
+def test_cancelling_a_running_job_stops_it_at_the_next_progress_update(queue):
+    started, release = threading.Event(), threading.Event()
+    job, _ = queue.submit("alice", blocking_job(started, release))
+    started.wait(5)
+
+    queue.cancel(job.id)
+
+    assert queue.wait(job.id, timeout=5).status == CANCELLED
+    assert job.done.is_set()
+
+
+def test_cancelling_a_queued_job_never_runs_it(queue):
+    started, release = threading.Event(), threading.Event()
+    running, _ = queue.submit("alice", blocking_job(started, release))
+    started.wait(5)
+    ran = []
+    queued, _ = queue.submit("bob", lambda progress: ran.append(True))
+
+    queue.cancel(queued.id)
+    release.set()
+    queue.wait(running.id, timeout=5)
+
+    assert queued.status == CANCELLED
+    assert ran == []
+
+
+def test_failures_are_recorded(queue):
+    def fail(progress):
+        raise RuntimeError("boom")
+
+    job, _ = queue.submit("alice", fail)
+
+    assert queue.wait(job.id, timeout=5).status == FAILED
+    assert job.error == "boom"
+
+
+def test_unknown_jobs(queue):
+    assert queue.get("missing") is None
+    assert queue.cancel("missing") is None
+    assert queue.wait("missing") is None
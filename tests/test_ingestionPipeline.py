@@ -0,0 +1,23 @@
+from types import SimpleNamespace
+
+from ingestionPipeline import chunk_ids
+
+
+def split(**metadata):
+    return SimpleNamespace(page_content="", metadata=metadata)
+
+
+def test_chunk_ids_count_up_per_file_revision():
+    counters = {}
+    first = chunk_ids([split(file_id="f", revision="r1"), split(file_id="f", revision="r1")], counters)
+    second = chunk_ids([split(file_id="f", revision="r1"), split(file_id="g")], counters)
+
+    assert first == ["f:r1:0", "f:r1:1"]
+    assert second == ["f:r1:2", "g::0"]
+
+
+def test_chunk_ids_fall_back_to_source_and_page():
+    assert chunk_ids([split(source="a.pdf", page=3), split(source="a.pdf", page=3)]) == [
+        "a.pdf:3:0",
+        "a.pdf:3:1",
+    ]
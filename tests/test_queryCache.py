@@ -0,0 +1,24 @@
+from queryCache import QueryCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("queryCache.time.monotonic", lambda: now[0])
+    cache = QueryCache(ttl=10)
+    cache.put("a", 1)
+    now[0] += 10
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
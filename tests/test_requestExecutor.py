@@ -0,0 +1,116 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import requestExecutor
+from requestExecutor import AdaptiveConcurrencyLimit, RequestExecutor, TokenBucket
+
+
+def http_error(status, headers=None):
+    return HttpError(httplib2.Response({"status": status, **(headers or {})}), b"")
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(requestExecutor.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_token_bucket_goes_into_debt_for_large_requests():
+    bucket = TokenBucket(rate=1.0, capacity=2.0)
+
+    assert bucket.try_acquire(5) == 0.0
+    # Three tokens of debt plus the one asked for.
+    assert bucket.try_acquire(1) == pytest.approx(4.0, abs=0.1)
+
+
+def test_concurrency_limit_halves_on_throttling_and_grows_back():
+    limit = AdaptiveConcurrencyLimit(initial=16, minimum=2, maximum=64)
+
+    limit.throttle()
+    assert limit.limit == 8
+    limit.acquire()
+    limit.release(throttled=True)
+    assert limit.limit == 4
+    limit.acquire()
+    limit.release(throttled=False)
+    assert limit.limit == pytest.approx(4.25)
+    for _ in range(5):
+        limit.throttle()
+    assert limit.limit == 2
+
+
+def test_call_retries_throttled_requests(no_sleep):
+    executor = RequestExecutor(base_delay=0.0)
+    outcomes = [http_error(429, {"retry-after": "3"}), http_error(503), "done"]
+
+    def fn():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert executor.call(fn) == "done"
+    assert executor.stats()["retries"] == 2
+    assert executor.stats()["throttled"] == 1
+    assert no_sleep[0] == 3.0
+
+
+def test_call_raises_errors_that_are_not_retryable():
+    executor = RequestExecutor()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise http_error(404)
+
+    with pytest.raises(HttpError):
+        executor.call(fn)
+    assert len(calls) == 1
+
+
+class FakeRequest:
+    methodId = "drive.files.get"
+
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+
+
+class FakeBatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = {}
+
+    def add(self, request, request_id):
+        self.requests[request_id] = request
+
+    def execute(self):
+        for request_id, request in self.requests.items():
+            outcome = request.outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                self.callback(request_id, None, outcome)
+            else:
+                self.callback(request_id, outcome, None)
+
+
+def test_execute_batch_retries_only_failed_sub_requests(monkeypatch):
+    costs = []
+    monkeypatch.setattr(TokenBucket, "acquire", lambda self, tokens=1.0: costs.append(tokens))
+    executor = RequestExecutor()
+    requests = {
+        "ok": FakeRequest([{"id": "ok"}]),
+        "throttled": FakeRequest([http_error(429), http_error(429), {"id": "throttled"}]),
+        "missing": FakeRequest([http_error(404)]),
+    }
+
+    results = executor.execute_batch(lambda callback: FakeBatch(callback), requests, "alice")
+
+    assert results["ok"] == ({"id": "ok"}, None)
+    assert results["throttled"] == ({"id": "throttled"}, None)
+    assert results["missing"][0] is None
+    assert results["missing"][1].resp.status == 404
+    # One token per sub-request, from both the project and the user bucket.
+    assert costs == [3, 3, 1, 1, 1, 1]
+    assert executor.stats()["throttled"] == 2
+    assert executor.concurrency.limit < 16
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+pytest.importorskip("flask")
+
+import service
+
+
+@pytest.fixture
+def client():
+    return service.app.test_client()
+
+
+def test_synchronous_load_joins_the_users_running_sync(client, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def ingest_gdrive(username, incremental, progress=None):
+        runs.append(username)
+        started.set()
+        release.wait(5)
+        return {"results": "SUCCESS"}
+
+    monkeypatch.setattr(service, "ingest_gdrive", ingest_gdrive)
+    background = client.post("/load_gdrive", json={"username": "alice"})
+    started.wait(5)
+    threading.Timer(0.1, release.set).start()
+    waited = client.post("/load_gdrive", json={"username": "alice", "wait": True})
+
+    assert background.status_code == 202
+    assert waited.status_code == 200
+    assert waited.get_json() == {"results": "SUCCESS"}
+    assert runs == ["alice"]
+
+
+def test_synchronous_load_reports_failures(client, monkeypatch):
+    def ingest_gdrive(username, incremental, progress=None):
+        raise RuntimeError("quota exhausted")
+
+    monkeypatch.setattr(service, "ingest_gdrive", ingest_gdrive)
+    response = client.post("/load_gdrive", json={"username": "bob", "wait": True})
+
+    assert response.status_code == 500
+    assert response.get_json()["error"] == "quota exhausted"
+
+
+class FakeStore:
+    """Chroma-like store supporting the `get`/`delete` calls used for pruning."""
+
+    def __init__(self, chunks):
+        self.chunks = dict(chunks)
+
+    def get(self, where, include):
+        file_ids = where["file_id"]["$in"]
+        ids = [id for id, metadata in self.chunks.items() if metadata["file_id"] in file_ids]
+        return {"ids": ids, "metadatas": [self.chunks[id] for id in ids]}
+
+    def delete(self, ids):
+        for id in ids:
+            del self.chunks[id]
+
+
+class FakeRevisions:
+    def __init__(self):
+        self.recorded = {}
+
+    def update(self, revisions):
+        self.recorded.update(revisions)
+
+
+class Doc:
+    def __init__(self, **metadata):
+        self.metadata = metadata
+
+
+def test_reindexed_files_lose_their_other_revisions():
+    store = FakeStore({
+        "a:v1:0": {"file_id": "a", "revision": "v1"},
+        "a:v2:0": {"file_id": "a", "revision": "v2"},
+        "b:v1:0": {"file_id": "b", "revision": "v1"},
+        "b:v2:0": {"file_id": "b", "revision": "v2"},
+        "c:v1:0": {"file_id": "c", "revision": "v1"},
+    })
+    indexed = {}
+    docs = [Doc(file_id="a", revision="v2"), Doc(source="x.pdf"), Doc(file_id="b", revision="v2")]
+    revisions = FakeRevisions()
+
+    assert list(service.track_revisions(docs, indexed)) == docs
+    service.prune_other_revisions(store, indexed, failed={"b"}, revisions=revisions)
+
+    # b failed to load, so its older revision is kept; c wasn't reindexed.
+    assert sorted(store.chunks) == ["a:v2:0", "b:v1:0", "b:v2:0", "c:v1:0"]
+    assert revisions.recorded == {"a": "v2"}
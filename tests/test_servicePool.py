@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from servicePool import ServicePool
+
+
+class FakeBaseCredentials:
+    def __init__(self):
+        self.subjects = []
+
+    def with_subject(self, username):
+        self.subjects.append(username)
+        return object()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(
+        "googleapiclient.discovery.build_from_document",
+        lambda document, credentials: {"credentials": credentials},
+    )
+    pool = ServicePool()
+    pool._base_credentials = FakeBaseCredentials()
+    monkeypatch.setattr(pool, "_discovery_document", lambda servicename, version: {})
+    return pool
+
+
+def get_in_new_thread(pool, *args):
+    services = []
+    thread = threading.Thread(target=lambda: services.append(pool.get(*args)))
+    thread.start()
+    thread.join()
+    return services[0]
+
+
+def test_clients_are_per_thread_but_share_the_users_credentials(pool):
+    first = pool.get("alice")
+    other_thread = get_in_new_thread(pool, "alice")
+    sheets = pool.get("alice", "sheets", "v4")
+
+    assert pool.get("alice") is first
+    assert other_thread is not first
+    assert other_thread["credentials"] is first["credentials"] is sheets["credentials"]
+    assert pool._base_credentials.subjects == ["alice"]
+
+
+def test_users_get_their_own_credentials(pool):
+    alice = pool.get("alice")
+    bob = pool.get("bob")
+
+    assert alice["credentials"] is not bob["credentials"]
+    assert pool.delegated_credentials("bob") is bob["credentials"]
+    assert pool._base_credentials.subjects == ["alice", "bob"]
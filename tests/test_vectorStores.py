@@ -0,0 +1,92 @@
+import pytest
+
+from vectorStores import VectorStoreManager
+
+
+def test_write_version_is_shared_between_managers(tmp_path):
+    root = str(tmp_path) + "/"
+    worker_a = VectorStoreManager(lambda: None, root=root)
+    worker_b = VectorStoreManager(lambda: None, root=root)
+    before = worker_b.version("alice")
+
+    worker_a.mark_written("alice")
+
+    assert worker_b.version("alice") != before
+    assert worker_b.version("alice") == worker_a.version("alice")
+    assert worker_b.version("bob") == before
+
+
+def test_every_write_gets_a_new_version(tmp_path):
+    stores = VectorStoreManager(lambda: None, root=str(tmp_path) + "/")
+    seen = {stores.version()}
+    for _ in range(3):
+        stores.mark_written()
+        seen.add(stores.version())
+
+    assert len(seen) == 4
+
+
+class FakeChroma:
+    """Stands in for `Chroma`; its collection reports `counts[directory]` chunks."""
+
+    counts = {}
+
+    def __init__(self, persist_directory, embedding_function):
+        self.persist_directory = persist_directory
+        self._collection = self
+
+    def count(self):
+        return self.counts.get(self.persist_directory, 0)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    pytest.importorskip("langchain")
+    monkeypatch.setattr("langchain.vectorstores.Chroma", FakeChroma)
+    monkeypatch.setattr(FakeChroma, "counts", {})
+
+    def manager(**kwargs):
+        return VectorStoreManager(lambda: None, root=str(tmp_path) + "/", bytes_per_vector=1, **kwargs)
+
+    return manager
+
+
+def test_least_recently_used_store_is_closed(manager):
+    stores = manager(max_open=2)
+    alice = stores.get("alice")
+    stores.get("bob")
+    assert stores.get("alice") is alice
+    stores.get("carol")
+
+    assert stores.stats()["open"] == 2
+    assert stores.get("alice") is alice
+    assert stores.stats()["opened"] == 3
+    stores.get("bob")
+    assert stores.stats()["opened"] == 4
+    assert stores.stats()["evicted"] == 2
+
+
+def test_stores_are_closed_over_the_byte_cap(manager):
+    stores = manager(max_bytes=100)
+    FakeChroma.counts[stores.path("alice")] = 60
+    FakeChroma.counts[stores.path("bob")] = 30
+    stores.get("alice")
+    stores.get("bob")
+    assert stores.stats() == {"open": 2, "estimated_bytes": 90, "opened": 2, "evicted": 0}
+
+    # Bob's store grows past the cap; alice's, the older one, is closed.
+    FakeChroma.counts[stores.path("bob")] = 80
+    stores.mark_written("bob")
+
+    assert stores.stats()["estimated_bytes"] == 80
+    assert stores.stats()["evicted"] == 1
+    assert "alice" not in stores._stores
+
+
+def test_a_store_over_the_byte_cap_on_its_own_stays_open(manager):
+    stores = manager(max_bytes=10)
+    FakeChroma.counts[stores.path("alice")] = 50
+    alice = stores.get("alice")
+
+    assert stores.get("alice") is alice
+    assert stores.stats()["open"] == 1
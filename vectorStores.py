@@ -0,0 +1,236 @@
+"""Bounded pool of open per-user Chroma stores.
+
+Opening a persisted collection loads its index into memory, so reopening it
+on every request is slow while keeping every tenant's store open forever
+leaks memory. `VectorStoreManager` opens stores lazily on first use, keeps at
+most `max_open` of them (and at most `max_bytes` of estimated index memory)
+and closes the least recently used one when a limit is exceeded.
+
+Every store also has a write version, changed by `mark_written`, which lets
+caches of query results tell whether they are stale, and a `FileRevisions`
+record of the Drive file revisions indexed into it. The version lives in a
+file in the store's directory, so a write in one worker process invalidates
+the results cached by every other worker.
+"""
+
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from atomicWrite import write_atomic
+
+REVISIONS_FILE = "file_revisions.json"
+VERSION_FILE = "write_version"
+
+SHARED_STORE = ""
+"""Key of the store that is not tied to a user (`docs/chroma/` itself)."""
+
+
+class _OpenStore:
+    __slots__ = ("vectordb", "estimated_bytes")
+
+    def __init__(self, vectordb: Any, estimated_bytes: int) -> None:
+        self.vectordb = vectordb
+        self.estimated_bytes = estimated_bytes
+
+
+class FileRevisions:
+    """Revision of each Drive file indexed into a store, persisted as JSON.
+
+    A file is recorded even when it produced no chunks, so an empty file is
+    not fetched again until it changes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self._revisions: Dict[str, str] = json.load(f)
+        except FileNotFoundError:
+            self._revisions = {}
+
+    def get(self, file_id: str) -> Optional[str]:
+        with self._lock:
+            return self._revisions.get(file_id)
+
+    def update(self, revisions: Dict[str, str]) -> None:
+        """Record the given files' revisions and persist the record atomically."""
+        with self._lock:
+            self._revisions.update(revisions)
+            self._save()
+
+    def discard(self, file_ids: Iterable[str]) -> None:
+        """Forget the given files, e.g. after their chunks were deleted, so they are loaded again."""
+        with self._lock:
+            removed = [self._revisions.pop(file_id, None) for file_id in file_ids]
+            if any(revision is not None for revision in removed):
+                self._save()
+
+    def _save(self) -> None:
+        """Persist the record; caller holds the lock."""
+        write_atomic(self.path, json.dumps(self._revisions))
+
+
+class VectorStoreManager:
+    """Thread-safe LRU of open Chroma stores keyed by username."""
+
+    def __init__(
+        self,
+        embedding_factory: Callable[[], Any],
+        root: str = "docs/chroma/",
+        max_open: int = 32,
+        max_bytes: Optional[int] = None,
+        bytes_per_vector: int = 1536 * 4 + 512,
+    ) -> None:
+        self.embedding_factory = embedding_factory
+        self.root = root
+        self.max_open = max_open
+        self.max_bytes = max_bytes
+        # Rough in-memory footprint of one indexed chunk: a float32 vector
+        # (1536 dimensions for OpenAI embeddings) plus index and metadata overhead.
+        self.bytes_per_vector = bytes_per_vector
+        self.opened = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._stores: "OrderedDict[str, _OpenStore]" = OrderedDict()
+        self._opening: Dict[str, threading.Lock] = {}
+        self._revisions: Dict[str, FileRevisions] = {}
+
+    def path(self, username: Optional[str] = None) -> str:
+        """Return the persist directory of the user's store."""
+        return self.root + username + "/" if username else self.root
+
+    def exists(self, username: Optional[str] = None) -> bool:
+        """Whether the user's store has been persisted or is open."""
+        with self._lock:
+            if (username or SHARED_STORE) in self._stores:
+                return True
+        return os.path.isdir(self.path(username))
+
+    def get(self, username: Optional[str] = None) -> Any:
+        """Return the user's open store, opening it on first use."""
+        key = username or SHARED_STORE
+        with self._lock:
+            entry = self._stores.get(key)
+            if entry is not None:
+                self._stores.move_to_end(key)
+                return entry.vectordb
+            opening = self._opening.setdefault(key, threading.Lock())
+
+        # Open outside the pool lock so other users' lookups aren't blocked,
+        # but only once per user.
+        with opening:
+            with self._lock:
+                entry = self._stores.get(key)
+                if entry is not None:
+                    self._stores.move_to_end(key)
+                    return entry.vectordb
+            from langchain.vectorstores import Chroma
+
+            vectordb = Chroma(
+                persist_directory=self.path(username), embedding_function=self.embedding_factory()
+            )
+            entry = _OpenStore(vectordb, self._estimate_bytes(vectordb))
+            with self._lock:
+                self._stores[key] = entry
+                self.opened += 1
+                self._evict_over_limits(keep=key)
+                self._opening.pop(key, None)
+        return vectordb
+
+    def prefetch(self, username: Optional[str] = None) -> int:
+        """Read the user's persisted store into the OS page cache without opening it.
+
+        Returns the number of bytes read. Pages stay cached for every process,
+        so this warms stores before forking workers, which must not inherit
+        open stores.
+        """
+        size = 0
+        for directory, _, filenames in os.walk(self.path(username)):
+            for filename in filenames:
+                with open(os.path.join(directory, filename), "rb") as f:
+                    while True:
+                        chunk = f.read(1 << 20)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+        return size
+
+    def file_revisions(self, username: Optional[str] = None) -> FileRevisions:
+        """Return the record of Drive file revisions indexed into the user's store."""
+        key = username or SHARED_STORE
+        with self._lock:
+            revisions = self._revisions.get(key)
+            if revisions is None:
+                revisions = self._revisions[key] = FileRevisions(self.path(username) + REVISIONS_FILE)
+            return revisions
+
+    def version(self, username: Optional[str] = None) -> str:
+        """Return the store's write version, as seen by every process using the store."""
+        try:
+            with open(self.path(username) + VERSION_FILE, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def mark_written(self, username: Optional[str] = None) -> None:
+        """Change the store's version and refresh its memory estimate after a write.
+
+        Versions are random rather than counted, so concurrent writers in
+        different processes can never end up on a version seen before.
+        """
+        key = username or SHARED_STORE
+        write_atomic(self.path(username) + VERSION_FILE, uuid.uuid4().hex)
+        with self._lock:
+            entry = self._stores.get(key)
+        if entry is None:
+            return
+        estimated_bytes = self._estimate_bytes(entry.vectordb)
+        with self._lock:
+            entry.estimated_bytes = estimated_bytes
+            self._evict_over_limits(keep=key)
+
+    def evict(self, username: Optional[str] = None) -> None:
+        """Close the user's store if it is open."""
+        with self._lock:
+            if self._stores.pop(username or SHARED_STORE, None) is not None:
+                self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return open store count, estimated memory and open/evict counters."""
+        with self._lock:
+            return {
+                "open": len(self._stores),
+                "estimated_bytes": sum(e.estimated_bytes for e in self._stores.values()),
+                "opened": self.opened,
+                "evicted": self.evicted,
+            }
+
+    def _evict_over_limits(self, keep: str) -> None:
+        """Drop least recently used stores until both limits hold; caller holds the lock."""
+        def over_limits() -> bool:
+            if len(self._stores) > self.max_open:
+                return True
+            if self.max_bytes is None:
+                return False
+            return sum(e.estimated_bytes for e in self._stores.values()) > self.max_bytes
+
+        while over_limits() and len(self._stores) > 1:
+            key = next(iter(self._stores))
+            if key == keep:
+                self._stores.move_to_end(key)
+                key = next(iter(self._stores))
+            # Requests still holding the handle keep working; it is freed once they finish.
+            del self._stores[key]
+            self.evicted += 1
+
+    def _estimate_bytes(self, vectordb: Any) -> int:
+        try:
+            count = vectordb._collection.count()
+        except Exception:
+            count = 0
+        return count * self.bytes_per_vector